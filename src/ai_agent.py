@@ -4,9 +4,7 @@ import openai
 from datetime import datetime
 from dotenv import load_dotenv
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
+from business_classifier import BUSINESS_CATEGORIES, business_similarity_classifier
 
 load_dotenv()
 
@@ -22,37 +20,37 @@ class AIAgent:
         # Business type patterns and indicators
         self.business_patterns = {
             'restaurant': {
-                'keywords': ['restaurant', 'cafe', 'diner', 'bistro', 'eatery', 'food'],
+                'keywords': BUSINESS_CATEGORIES['restaurant'],
                 'pain_points': ['online ordering', 'reservation system', 'menu updates', 'food photos'],
                 'opportunities': ['food delivery', 'online menu', 'table reservations', 'customer reviews'],
                 'success_metrics': ['order volume', 'reservation rate', 'customer reviews', 'menu views']
             },
             'retail': {
-                'keywords': ['retail', 'store', 'shop', 'boutique', 'market'],
+                'keywords': BUSINESS_CATEGORIES['retail'],
                 'pain_points': ['inventory management', 'online sales', 'product showcase', 'payment processing'],
                 'opportunities': ['e-commerce', 'inventory system', 'product catalog', 'online payments'],
                 'success_metrics': ['online sales', 'inventory turnover', 'cart completion', 'product views']
             },
             'salon': {
-                'keywords': ['salon', 'spa', 'beauty', 'hair', 'nails', 'barber'],
+                'keywords': BUSINESS_CATEGORIES['salon'],
                 'pain_points': ['appointment scheduling', 'service showcase', 'staff scheduling', 'customer retention'],
                 'opportunities': ['online booking', 'service catalog', 'staff profiles', 'loyalty program'],
                 'success_metrics': ['booking rate', 'repeat customers', 'service popularity', 'customer feedback']
             },
             'gym': {
-                'keywords': ['gym', 'fitness', 'workout', 'training', 'yoga', 'crossfit'],
+                'keywords': BUSINESS_CATEGORIES['gym'],
                 'pain_points': ['class scheduling', 'membership management', 'trainer booking', 'attendance tracking'],
                 'opportunities': ['class registration', 'membership portal', 'trainer profiles', 'workout tracking'],
                 'success_metrics': ['membership growth', 'class attendance', 'trainer bookings', 'member retention']
             },
             'automotive': {
-                'keywords': ['auto', 'car', 'mechanic', 'repair', 'service', 'tire'],
+                'keywords': BUSINESS_CATEGORIES['automotive'],
                 'pain_points': ['service scheduling', 'repair tracking', 'parts inventory', 'customer communication'],
                 'opportunities': ['online appointments', 'service history', 'status updates', 'maintenance reminders'],
                 'success_metrics': ['service bookings', 'customer retention', 'parts sales', 'review ratings']
             },
             'professional': {
-                'keywords': ['lawyer', 'accountant', 'consultant', 'insurance', 'real estate', 'professional'],
+                'keywords': BUSINESS_CATEGORIES['professional'],
                 'pain_points': ['client scheduling', 'document sharing', 'client communication', 'service explanation'],
                 'opportunities': ['online consultations', 'document portal', 'service packages', 'testimonials'],
                 'success_metrics': ['consultation rate', 'client retention', 'document usage', 'referral rate']
@@ -138,36 +136,10 @@ class AIAgent:
 
     def _detect_business_type(self, business_info):
         """
-        Detect business type using TF-IDF and cosine similarity
+        Detect business type by TF-IDF cosine similarity to each type's keywords
         Returns tuple of (type, confidence)
         """
-        # Create TF-IDF vectors for business patterns
-        pattern_texts = []
-        pattern_types = []
-        
-        for btype, pattern in self.business_patterns.items():
-            pattern_text = ' '.join(pattern['keywords'])
-            pattern_texts.append(pattern_text)
-            pattern_types.append(btype)
-
-        # Add the business info
-        all_texts = pattern_texts + [business_info]
-        
-        # Create TF-IDF matrix
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(all_texts)
-        
-        # Calculate similarity between business and each pattern
-        business_vector = tfidf_matrix[-1]
-        pattern_vectors = tfidf_matrix[:-1]
-        
-        similarities = cosine_similarity(business_vector, pattern_vectors)[0]
-        
-        # Get best match
-        best_match_idx = np.argmax(similarities)
-        confidence = similarities[best_match_idx]
-        
-        return pattern_types[best_match_idx], float(confidence)
+        return business_similarity_classifier.classify(business_info)
 
     def generate_email(self, business_analysis, template_type='custom'):
         """
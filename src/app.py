@@ -14,7 +14,15 @@ Key Features:
 Routes:
 - / : Main application interface
 - /api/leads : Lead management endpoints
+- /api/leads/stats : Lead counts per status and type
+- /api/leads/status : Bulk lead status update
+- /api/leads/import, /api/leads/upload : Streaming bulk lead import (NDJSON/CSV)
+- /api/leads/export : Streaming bulk lead export (NDJSON/CSV)
+- /api/templates/<id>/preview/batch : Streaming template previews for many leads
 - /api/email : Email sending endpoints
+- /api/send-email, /api/send-emails : Async sends over a pooled SendGrid connection
+- /api/send-queue : Durable outbound queue drained within hourly/daily limits
+- /api/dead-letters : Permanently failed emails and bulk replay
 - /api/campaigns : Campaign management endpoints
 - /agent : Agent interface
 - /api/search : Search businesses
@@ -31,20 +39,27 @@ Author: Oscar Hernandez
 Date: January 2025
 """
 
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, stream_with_context
 from flask_cors import CORS
-from lead_finder import LeadFinder
+from lead_finder import LEAD_STATUSES, LeadFinder
+from lead_io import FORMATS as LEAD_IO_FORMATS, detect_format as detect_lead_format
 from email_sender import EmailSender
-from campaign_handler import campaign_bp
-from business_discovery import BusinessDiscoveryEngine
+from async_sender import AsyncEmailSender
+from send_queue import SendQueue
+from campaign_handler import campaign_bp, use_services as use_campaign_services
+from business_discovery import shared_engine as shared_discovery_engine
 from website_checker import WebsiteChecker
 from crm_integration import CRMIntegration
 from email_campaign_manager import EmailCampaignManager
 import os
-from datetime import datetime
 from dotenv import load_dotenv
 import asyncio
+import atexit
+import hashlib
+import io
+import json
 import logging
+import threading
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 from config import Config
@@ -81,17 +96,43 @@ if missing_vars:
 else:
     logger.info("All required environment variables are set")
 
-# Register blueprints
-app.register_blueprint(campaign_bp)
+# Largest page size accepted by GET /api/leads
+MAX_LEADS_PAGE_SIZE = 500
+
+def is_lead_id_list(value):
+    """Check that a request gave a list of lead IDs (strings or integers)"""
+    return isinstance(value, list) and all(
+        isinstance(lead_id, (str, int)) and not isinstance(lead_id, bool) for lead_id in value
+    )
 
 # Initialize services
 lead_finder = LeadFinder()
 email_sender = EmailSender()
-business_discovery = BusinessDiscoveryEngine()
+# Bulk sends use the pooled async SendGrid client, or the SMTP relay's connection pool
+if email_sender.transport.name == 'sendgrid':
+    async_email_sender = AsyncEmailSender()
+    send_many_outbound = async_email_sender.send_many_sync
+else:
+    async_email_sender = None
+    send_many_outbound = email_sender.transport.send_many
+# Outbound queue drained in the background within the hourly/daily limits
+send_queue = SendQueue(send_many_outbound, default_sender=email_sender.from_email.email,
+                       ledger=email_sender.ledger)
+# Campaign ticks reserve their sends against the same limits through this queue
+email_sender.send_queue = send_queue
+send_queue.start()
+atexit.register(send_queue.stop)
+business_discovery = shared_discovery_engine()
+# Geocode the usual search regions in the background so their searches skip the lookup
+threading.Thread(target=business_discovery.warm_geocodes, name='geocode-warmup', daemon=True).start()
 website_checker = WebsiteChecker()
 crm_integration = CRMIntegration()
 email_manager = EmailCampaignManager()
 
+# Campaign routes share this app's sender and lead finder
+use_campaign_services(email_sender, lead_finder)
+app.register_blueprint(campaign_bp)
+
 @app.before_first_request
 def before_first_request():
     """Check configuration before starting the server"""
@@ -133,33 +174,49 @@ def find_leads():
 def handle_leads():
     if request.method == 'GET':
         try:
-            leads = lead_finder.get_all_leads()
-            return jsonify(leads)
+            # Any lead mutation changes the version, so an unchanged list costs a 304
+            query = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+            etag = hashlib.md5(f"{lead_finder.leads_version()}?{query}".encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+            
+            paginated = 'limit' in request.args or 'cursor' in request.args
+            try:
+                limit = min(max(int(request.args.get('limit', 50)), 1), MAX_LEADS_PAGE_SIZE)
+                page = lead_finder.get_leads_page(
+                    cursor=request.args.get('cursor'),
+                    limit=limit if paginated else None,
+                    status=request.args.get('status'),
+                    business_type=request.args.get('type'),
+                    fields=[f for f in request.args.get('fields', '').split(',') if f] or None
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            # Without limit/cursor, keep returning a plain list for existing clients
+            response = jsonify(page if paginated else page['leads'])
+            response.set_etag(etag)
+            return response
         except Exception as e:
             print(f"Error getting leads: {e}")
             return jsonify([])
     else:  # POST
         try:
             data = request.json
-            if not data.get('name') or not data.get('email'):
+            error = lead_finder.validate_lead_input(data)
+            if error:
                 return jsonify({
                     'success': False,
-                    'error': 'Name and email are required'
+                    'error': error
                 }), 400
                 
             # Add the lead
-            lead = {
-                'id': str(len(lead_finder.leads) + 1),
-                'name': data['name'],
-                'email': data['email'],
-                'type': data.get('type', 'other'),
-                'status': 'new',
-                'found_date': datetime.now().isoformat(),
-                'source': 'manual'
-            }
-            
-            lead_finder.leads.append(lead)
-            lead_finder._save_leads()
+            lead = lead_finder.add_lead(lead_finder.build_lead(data))
             
             return jsonify({
                 'success': True,
@@ -174,6 +231,112 @@ def handle_leads():
                 'error': str(e)
             }), 500
 
+@app.route('/api/leads/stats', methods=['GET'])
+def lead_stats():
+    """Lead counts per status and type for the dashboard tiles"""
+    try:
+        return jsonify(lead_finder.get_lead_stats())
+    except Exception as e:
+        print(f"Error getting lead stats: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/leads/import', methods=['POST'])
+def import_leads():
+    """Bulk import leads streamed in the request body as NDJSON (default) or CSV"""
+    try:
+        fmt = request.args.get('format', 'csv' if request.mimetype == 'text/csv' else 'ndjson')
+        if fmt not in LEAD_IO_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Unsupported format: {fmt}"
+            }), 400
+        
+        lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        result = lead_finder.import_leads(lines, fmt)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        print(f"Error importing leads: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/leads/upload', methods=['POST'])
+def upload_leads():
+    """Bulk import leads from an uploaded NDJSON or CSV file"""
+    try:
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({
+                'success': False,
+                'error': 'No file uploaded'
+            }), 400
+        
+        fmt = request.form.get('format') or detect_lead_format(upload.filename)
+        lines = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        result = lead_finder.import_leads(lines, fmt)
+        return jsonify({'success': True, **result})
+    except Exception as e:
+        print(f"Error uploading leads: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/leads/export', methods=['GET'])
+def export_leads_file():
+    """Stream all (optionally filtered) leads as NDJSON or CSV"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in LEAD_IO_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Unsupported format: {fmt}"
+        }), 400
+    
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+    chunks = lead_finder.export_leads(fmt, request.args.get('status'), request.args.get('type'), fields)
+    response = Response(
+        stream_with_context(chunks),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    )
+    response.headers['Content-Disposition'] = f"attachment; filename=leads.{fmt}"
+    return response
+
+@app.route('/api/leads/status', methods=['PUT'])
+def update_lead_statuses():
+    """Set the same status on many leads at once"""
+    try:
+        data = request.json or {}
+        lead_ids = data.get('ids')
+        status = data.get('status')
+        if not is_lead_id_list(lead_ids) or not status:
+            return jsonify({
+                'success': False,
+                'error': 'A list of ids (strings or integers) and a status are required'
+            }), 400
+        if not isinstance(status, str) or status not in LEAD_STATUSES:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid status {status!r}: must be one of {', '.join(LEAD_STATUSES)}"
+            }), 400
+        
+        updated = lead_finder.update_statuses(lead_ids, status)
+        updated_ids = set(updated)
+        return jsonify({
+            'success': True,
+            'updated': len(updated),
+            'not_found': [lead_id for lead_id in lead_ids if str(lead_id) not in updated_ids]
+        })
+    except Exception as e:
+        print(f"Error updating lead statuses: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/leads/<lead_id>', methods=['PUT'])
 def update_lead(lead_id):
     try:
@@ -242,21 +405,8 @@ def get_template(template_id):
 @app.route('/api/templates/<template_id>/preview', methods=['POST'])
 def preview_template(template_id):
     try:
-        print(f"\nTemplate Preview Request:")
-        print(f"Template ID: {template_id}")
-        
-        data = request.json
-        lead = data.get('lead')
-        print(f"Lead Data: {lead}")
-        
-        # Get template
-        template = email_sender.get_template(template_id)
-        print(f"Found Template: {template is not None}")
-        if template:
-            print(f"Template Content: {template}")
-        
-        preview = email_sender.preview_template(template_id, lead)
-        print(f"Preview Result: {preview}")
+        data = request.json or {}
+        preview = email_sender.preview_template(template_id, data.get('lead'))
         
         if preview:
             return jsonify(preview)
@@ -267,15 +417,59 @@ def preview_template(template_id):
         }), 404
         
     except Exception as e:
-        print(f"Error previewing template: {str(e)}")
-        print(f"Error type: {type(e).__name__}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        print(f"Error previewing template {template_id}: {str(e)}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@app.route('/api/templates/<template_id>/preview/batch', methods=['POST'])
+def preview_template_batch(template_id):
+    """
+    Stream previews of a template for many leads as NDJSON.
+    Body: {"lead_ids": [...]} or a filter {"status": ..., "type": ...};
+    optional "unresolved_only": true streams only leads with unresolved placeholders.
+    Each line is one lead's preview; the last line is {"summary": {...}}.
+    """
+    data = request.json or {}
+    if email_sender.template_version(template_id) is None:
+        return jsonify({
+            'success': False,
+            'error': 'Template not found'
+        }), 404
+    
+    lead_ids = data.get('lead_ids')
+    if lead_ids is not None and not is_lead_id_list(lead_ids):
+        return jsonify({
+            'success': False,
+            'error': '"lead_ids" must be a list of strings or integers'
+        }), 400
+    if lead_ids is not None:
+        leads = lead_finder.get_leads(lead_ids)
+    else:
+        leads = ((lead.get('id'), lead) for lead in lead_finder.iter_leads(data.get('status'), data.get('type')))
+    unresolved_only = bool(data.get('unresolved_only'))
+    
+    def generate():
+        summary = {'total': 0, 'unresolved': 0, 'errors': 0}
+        for result in email_sender.preview_many(template_id, leads):
+            summary['total'] += 1
+            if 'error' in result:
+                summary['errors'] += 1
+            elif result['unresolved']:
+                summary['unresolved'] += 1
+            elif unresolved_only:
+                continue
+            yield json.dumps(result) + '\n'
+        yield json.dumps({'summary': summary}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/templates/preview/stats', methods=['GET'])
+def preview_cache_stats():
+    """Hit/miss counters of the template preview cache"""
+    return jsonify(email_sender.preview_cache.stats())
+
 @app.route('/api/email/send', methods=['POST'])
 def send_email():
     try:
@@ -328,11 +522,22 @@ def send_email():
             'error': error_msg
         }), 500
 
+async def send_outbound(messages):
+    """
+    Send messages over the pooled transport without blocking the event loop.
+    Messages with an idempotency_key are sent at most once, and failures are dead-lettered.
+    """
+    if async_email_sender is not None:
+        return await email_sender.ledger.send_many_async(async_email_sender.send_many, messages)
+    # The SMTP relay's pool is blocking, so it runs on a worker thread
+    return await asyncio.get_running_loop().run_in_executor(
+        None, email_sender.ledger.send_many, send_many_outbound, messages
+    )
+
 @app.route('/api/send-email', methods=['POST'])
-def send_email_api():
+async def send_email_api():
     try:
         data = request.json
-        print("Received email request:", data)  # Debug log
         
         if not data:
             return jsonify({
@@ -346,15 +551,14 @@ def send_email_api():
                 'error': 'Missing required fields: to, subject, content'
             }), 400
             
-        # Initialize EmailSender
-        email_sender = EmailSender()
-        
-        # Send email
-        success, message = email_sender.send_email(
-            to_email=data['to'],
-            subject=data['subject'],
-            content=data['content']
-        )
+        # Send through the shared pooled sender
+        result = (await send_outbound([{
+            'to': data['to'],
+            'subject': data['subject'],
+            'content': data['content'],
+            'idempotency_key': data.get('idempotency_key')
+        }]))[0]
+        success, message = result['success'], result['message']
         
         if success:
             return jsonify({
@@ -377,6 +581,140 @@ def send_email_api():
             'error': str(e)
         }), 500
 
+@app.route('/api/send-emails', methods=['POST'])
+async def send_emails_api():
+    """
+    Send many emails concurrently.
+    Body: {"messages": [{"to", "subject", "content", optional "idempotency_key"}, ...]}
+    Returns one {email, success, message} result per message, in order.
+    """
+    try:
+        data = request.json or {}
+        messages = data.get('messages')
+        if not isinstance(messages, list) or not messages:
+            return jsonify({
+                'success': False,
+                'error': 'Expected a non-empty "messages" list'
+            }), 400
+        
+        results = await send_outbound(messages)
+        sent = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': sent == len(results),
+            'sent': sent,
+            'failed': len(results) - sent,
+            'results': results
+        })
+    except Exception as e:
+        print(f"Error in send_emails_api: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/send-queue', methods=['POST'])
+def enqueue_emails():
+    """
+    Queue emails to be sent within the hourly and daily limits.
+    Body: {"messages": [{"to", "subject", "content"}, ...]}
+       or {"template_id": ..., "lead_ids": [...]} to render a template per lead
+    Optional "campaign_id" tags the queued messages.
+    """
+    try:
+        data = request.json or {}
+        messages = data.get('messages')
+        skipped = []
+        if messages is None and data.get('template_id'):
+            if not email_sender.get_template(data['template_id']):
+                return jsonify({
+                    'success': False,
+                    'error': f"Template not found: {data['template_id']}"
+                }), 404
+            if not is_lead_id_list(data.get('lead_ids') or []):
+                return jsonify({
+                    'success': False,
+                    'error': '"lead_ids" must be a list of strings or integers'
+                }), 400
+            messages = []
+            for lead_id in data.get('lead_ids') or []:
+                lead = lead_finder.get_lead(lead_id)
+                if not lead or not lead.get('email'):
+                    skipped.append(lead_id)
+                    continue
+                rendered = email_sender.render_template(data['template_id'], lead)
+                messages.append({
+                    'to': lead['email'],
+                    'subject': rendered['subject'],
+                    'content': rendered['content'],
+                    'lead_id': lead_id
+                })
+        if not isinstance(messages, list) or not messages:
+            return jsonify({
+                'success': False,
+                'error': 'Expected a non-empty "messages" list or "template_id" with "lead_ids"',
+                'skipped': skipped
+            }), 400
+        
+        queued = send_queue.enqueue(messages, campaign_id=data.get('campaign_id'))
+        return jsonify({
+            'success': True,
+            'queued': queued,
+            'skipped': skipped
+        }), 202
+    except Exception as e:
+        print(f"Error queueing emails: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/send-queue/stats', methods=['GET'])
+def send_queue_stats():
+    """Queue counts per status and each sender's remaining hourly/daily budget"""
+    try:
+        return jsonify(send_queue.stats())
+    except Exception as e:
+        print(f"Error getting send queue stats: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/dead-letters', methods=['GET'])
+def get_dead_letters():
+    """Emails that failed permanently; ?kind=email|crm_template, ?limit=N"""
+    try:
+        limit = min(int(request.args.get('limit', 100)), 1000)
+        kind = request.args.get('kind')
+        return jsonify(email_sender.ledger.dead_letters(kind=kind, limit=limit))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+@app.route('/api/dead-letters/replay', methods=['POST'])
+def replay_dead_letters():
+    """
+    Send dead-lettered emails again.
+    Body (all optional): {"kind": "email"|"crm_template", "ids": [...], "limit": N}
+    """
+    try:
+        data = request.json or {}
+        ids = data.get('ids')
+        limit = min(int(data.get('limit', 100)), 1000)
+        kind = data.get('kind', 'email')
+        if kind == 'crm_template':
+            results = crm_integration.replay_dead_letters(ids=ids, limit=limit)
+        elif kind == 'email':
+            results = email_sender.replay_dead_letters(ids=ids, limit=limit)
+        else:
+            return jsonify({'success': False, 'error': f"Unknown dead letter kind: {kind}"}), 400
+        sent = sum(1 for result in results if result['success'])
+        return jsonify({
+            'success': True,
+            'replayed': len(results),
+            'sent': sent,
+            'results': results
+        })
+    except Exception as e:
+        print(f"Error replaying dead letters: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/campaigns', methods=['GET'])
 def get_campaigns():
     try:
@@ -462,6 +800,11 @@ def search_businesses():
             'error': f"Failed to search businesses: {str(e)}"
         }), 500
 
+@app.route('/api/search-businesses/cache/stats', methods=['GET'])
+def search_cache_stats():
+    """Hit/miss counters of the discovery search result cache, and searches joined while in flight"""
+    return jsonify(business_discovery.search_cache_stats())
+
 @app.route('/api/check-websites', methods=['POST'])
 async def check_websites():
     try:
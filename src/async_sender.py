@@ -0,0 +1,167 @@
+"""
+Async Email Sender Module
+Sends email through the SendGrid v3 API from one long-lived, pooled aiohttp session.
+
+The session lives on a dedicated event loop thread, so it survives across
+Flask requests (each async view runs on its own short-lived loop). Callers on
+any loop await send_many(), which hands the work to the sender's loop.
+
+Environment Variables:
+- SENDGRID_API_KEY: Your SendGrid API key
+- SENDGRID_MAX_IN_FLIGHT: Most sends awaiting a response at once (default 20)
+- SENDGRID_POOL_SIZE: Most open connections to SendGrid (default 20)
+- SENDGRID_TIMEOUT_SECONDS: Per-request timeout (default 30)
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from mail_delivery import SUCCESS_STATUSES, RetryPolicy, is_retryable, retry_after
+
+SENDGRID_SEND_URL = 'https://api.sendgrid.com/v3/mail/send'
+
+
+class AsyncEmailSender:
+    def __init__(self, api_key: Optional[str] = None, from_email: str = 'sam@webreachconnect.com',
+                 from_name: str = 'Sam from Web Reach Connect', max_in_flight: Optional[int] = None,
+                 pool_size: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        Args:
+            api_key: SendGrid API key; defaults to SENDGRID_API_KEY
+            from_email: Verified sender address
+            from_name: Sender display name
+            max_in_flight: Most sends awaiting a response at once
+            pool_size: Most open connections in the pool
+            timeout: Per-request timeout in seconds
+        """
+        self.api_key = api_key or os.environ.get('SENDGRID_API_KEY')
+        if not self.api_key:
+            raise ValueError("SENDGRID_API_KEY not found in environment variables")
+        self.from_email = from_email
+        self.from_name = from_name
+        self.max_in_flight = max_in_flight or int(os.getenv('SENDGRID_MAX_IN_FLIGHT', '20'))
+        self.pool_size = pool_size or int(os.getenv('SENDGRID_POOL_SIZE', '20'))
+        self.timeout = timeout or float(os.getenv('SENDGRID_TIMEOUT_SECONDS', '30'))
+        self.retry_policy = RetryPolicy()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Start the sender's event loop thread on first use"""
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name='async-email-sender', daemon=True)
+                    self._thread.start()
+                    asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                    self._loop = loop
+                    atexit.register(self.close)
+        return self._loop
+
+    async def _open(self):
+        """Create the pooled session and in-flight limit on the sender's loop"""
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={'Authorization': f"Bearer {self.api_key}", 'Content-Type': 'application/json'}
+        )
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+
+    def _message_body(self, message: Dict) -> Dict:
+        """SendGrid request body for a {to, subject, content} message"""
+        return {
+            'personalizations': [{'to': [{'email': message['to']}]}],
+            'from': {'email': message.get('from_email') or self.from_email,
+                     'name': message.get('from_name') or self.from_name},
+            'subject': message['subject'],
+            'content': [{'type': 'text/plain', 'value': message['content']}]
+        }
+
+    async def _post(self, message: Dict):
+        """One attempt; returns (status or None, Retry-After seconds, error message)"""
+        async with self._slots:
+            try:
+                async with self._session.post(SENDGRID_SEND_URL, json=self._message_body(message)) as response:
+                    if response.status in SUCCESS_STATUSES:
+                        return response.status, None, None
+                    detail = (await response.text())[:200]
+                    error = f"SendGrid error: Status {response.status} {detail}".strip()
+                    return response.status, retry_after(response.headers), error
+            except asyncio.TimeoutError:
+                return None, None, f"Failed to send email: timed out after {self.timeout}s"
+            except aiohttp.ClientError as e:
+                return None, None, f"Failed to send email: {str(e)}"
+
+    async def _send_one(self, message: Dict) -> Dict:
+        """Send one message, retrying transient failures; runs on the sender's loop"""
+        result = {'email': message.get('to'), 'success': False}
+        if not all(message.get(key) for key in ('to', 'subject', 'content')):
+            result['message'] = 'Missing required fields: to, subject, content'
+            return result
+
+        attempt = 0
+        while True:
+            attempt += 1
+            status, requested, error = await self._post(message)
+            if error is None:
+                result.update(success=True, message='Email sent successfully')
+                return result
+            # Back off outside the in-flight limit so other sends proceed
+            wait = self.retry_policy.delay(attempt, requested) if is_retryable(status) else None
+            if wait is None:
+                result['message'] = error
+                return result
+            await asyncio.sleep(wait)
+
+    async def _send_all(self, messages: List[Dict]) -> List[Dict]:
+        return await asyncio.gather(*(self._send_one(message) for message in messages))
+
+    async def send_many(self, messages: List[Dict]) -> List[Dict]:
+        """
+        Send messages concurrently, at most max_in_flight at a time.
+
+        Args:
+            messages: Dicts with 'to', 'subject', 'content' (and optional 'from_email', 'from_name')
+
+        Returns:
+            One {email, success, message} result per message, in input order
+        """
+        if not messages:
+            return []
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(self._send_all(list(messages)), loop)
+        return await asyncio.wrap_future(future)
+
+    async def send(self, to_email: str, subject: str, content: str):
+        """Send a single email; returns (success, message) like EmailSender.send_email"""
+        result = (await self.send_many([{'to': to_email, 'subject': subject, 'content': content}]))[0]
+        return result['success'], result['message']
+
+    def send_many_sync(self, messages: List[Dict]) -> List[Dict]:
+        """Blocking send_many for callers without an event loop"""
+        if not messages:
+            return []
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(self._send_all(list(messages)), loop).result()
+
+    def close(self):
+        """Close the pooled session and stop the sender's loop"""
+        loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"Error closing email session: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=5)
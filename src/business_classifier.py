@@ -0,0 +1,164 @@
+"""
+Business Classifier Module
+Precompiled multi-keyword matcher used for business type and intent detection,
+and the TF-IDF similarity scorer used by the AI agent
+"""
+
+import math
+import re
+from bisect import bisect_right
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# Business categories and their keywords, shared by lead discovery and the AI agent
+BUSINESS_CATEGORIES = {
+    'restaurant': ['restaurant', 'cafe', 'diner', 'bistro', 'eatery', 'food'],
+    'retail': ['retail', 'store', 'shop', 'boutique', 'market'],
+    'salon': ['salon', 'spa', 'beauty', 'hair', 'nails', 'barber'],
+    'gym': ['gym', 'fitness', 'workout', 'training', 'yoga', 'crossfit'],
+    'automotive': ['auto', 'car', 'mechanic', 'repair', 'service', 'tire'],
+    'professional': ['lawyer', 'accountant', 'consultant', 'insurance', 'real estate', 'professional']
+}
+
+# Separates records when a batch is scanned in one pass; never part of a keyword
+_RECORD_SEPARATOR = '\x00'
+
+
+class KeywordClassifier:
+    def __init__(self, categories: Dict[str, List[str]], default: Tuple[str, float] = ('professional', 0.1)):
+        """
+        Compile all keywords of all categories into a single regex.
+
+        Matching has plain substring semantics: a keyword counts once per text
+        if it occurs anywhere in it, including inside other words or overlapping
+        another keyword.
+        """
+        self.categories = categories
+        self.default = default
+        self._category_sizes = {category: len(keywords) for category, keywords in categories.items()}
+
+        # keyword -> categories listing it (a keyword may appear in several)
+        self._keyword_categories: Dict[str, List[str]] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                self._keyword_categories.setdefault(keyword.lower(), []).append(category)
+
+        # Longest keywords first; the lookahead lets matches overlap at every position
+        keywords = sorted(self._keyword_categories, key=len, reverse=True)
+        self._pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in keywords) + '))')
+
+        # The regex reports one keyword per position, so shorter keywords that are
+        # a prefix of the reported one are credited along with it
+        self._implied = {
+            keyword: [other for other in keywords if other != keyword and keyword.startswith(other)]
+            for keyword in keywords
+        }
+
+    def _matches(self, text: str) -> Iterable[Tuple[int, str]]:
+        """Yield (position, keyword) for every keyword occurrence in text"""
+        for match in self._pattern.finditer(text):
+            keyword = match.group(1)
+            yield match.start(), keyword
+            for implied in self._implied[keyword]:
+                yield match.start(), implied
+
+    def matched_keywords(self, text: str) -> Set[str]:
+        """Get the set of keywords occurring in text"""
+        return {keyword for _, keyword in self._matches(text)}
+
+    def _score(self, keywords: Set[str]) -> Tuple[str, float]:
+        """Pick the category with the highest share of matched keywords"""
+        counts = dict.fromkeys(self.categories, 0)
+        for keyword in keywords:
+            for category in self._keyword_categories[keyword]:
+                counts[category] += 1
+
+        best = None
+        for category, count in counts.items():
+            score = count / self._category_sizes[category]
+            if best is None or score > best[1]:
+                best = (category, score)
+
+        if best and best[1] > 0:
+            return best
+        return self.default
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Classify a single text, returning (category, confidence)"""
+        return self._score(self.matched_keywords(text))
+
+    def classify_many(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """Classify a batch of texts with a single regex scan over all of them"""
+        if not texts:
+            return []
+
+        # Record i starts at offsets[i] in the combined text
+        offsets = []
+        position = 0
+        for text in texts:
+            offsets.append(position)
+            position += len(text) + len(_RECORD_SEPARATOR)
+
+        found: List[Set[str]] = [set() for _ in texts]
+        for start, keyword in self._matches(_RECORD_SEPARATOR.join(texts)):
+            found[bisect_right(offsets, start) - 1].add(keyword)
+
+        return [self._score(keywords) for keywords in found]
+
+    def first_category(self, text: str) -> Optional[str]:
+        """First category, in definition order, with any keyword in text"""
+        matched = self.matched_keywords(text)
+        for category, keywords in self.categories.items():
+            if any(keyword.lower() in matched for keyword in keywords):
+                return category
+        return None
+
+
+class SimilarityClassifier:
+    def __init__(self, categories: Dict[str, List[str]]):
+        """
+        Score texts by TF-IDF cosine similarity to each category's keywords.
+
+        Gives the same results as fitting scikit-learn's TfidfVectorizer (default
+        settings) on the keyword documents plus the text and taking the cosine
+        similarity, without refitting a vectorizer per call: the keyword documents
+        are tokenized once, and only the document frequencies the text changes are
+        recomputed. Ties, and texts matching nothing, go to the first category.
+        """
+        self.categories = list(categories)
+        self._documents = [Counter(self._tokenize(' '.join(keywords))) for keywords in categories.values()]
+        self._document_frequency = Counter(term for document in self._documents for term in document)
+
+    # scikit-learn's default token pattern on lowercased text
+    _token_pattern = re.compile(r'(?u)\b\w\w+\b')
+
+    @classmethod
+    def _tokenize(cls, text: str) -> List[str]:
+        return cls._token_pattern.findall(text.lower())
+
+    def classify(self, text: str) -> Tuple[str, float]:
+        """Classify a text, returning (category, cosine similarity)"""
+        query = Counter(self._tokenize(text))
+        total = len(self._documents) + 1
+
+        def idf(term):
+            frequency = self._document_frequency[term] + (1 if term in query else 0)
+            return math.log((1 + total) / (1 + frequency)) + 1
+
+        query_weights = {term: count * idf(term) for term, count in query.items()}
+        query_norm = math.sqrt(sum(weight * weight for weight in query_weights.values()))
+
+        best = (self.categories[0], 0.0)
+        for category, document in zip(self.categories, self._documents):
+            weights = {term: count * idf(term) for term, count in document.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            dot = sum(weight * query_weights[term] for term, weight in weights.items() if term in query_weights)
+            score = dot / (norm * query_norm) if dot else 0.0
+            if score > best[1]:
+                best = (category, score)
+        return best
+
+
+# Built once at import so every caller shares the compiled pattern
+business_type_classifier = KeywordClassifier(BUSINESS_CATEGORIES)
+business_similarity_classifier = SimilarityClassifier(BUSINESS_CATEGORIES)
@@ -1,8 +1,10 @@
 import os
+import re
 import json
+import threading
 import time
 import requests
-from typing import List, Dict, Optional
+from typing import Any, Callable, List, Dict, Hashable, Iterable, Optional, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 from googlemaps import Client as GoogleMapsClient
@@ -11,13 +13,21 @@ import pandas as pd
 from bs4 import BeautifulSoup
 import aiohttp
 import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 from urllib.parse import urlparse
 from email_validator import validate_email, EmailNotValidError
 from website_checker import WebsiteChecker, WebsiteCheckResult
 from compliance import ComplianceManager
+from dedup_index import DedupIndex
+from cache_store import LRUCache, PersistentTTLCache
 import logging
 from config import Config
 
+# Place Details fields each discovery path reads; Google bills and returns only these
+PLACE_DETAIL_FIELDS = ['name', 'formatted_address', 'formatted_phone_number', 'website']
+PLACE_CONTACT_FIELDS = ['formatted_phone_number', 'website']
+
 @dataclass
 class BusinessContact:
     name: str
@@ -32,6 +42,59 @@ class BusinessContact:
     discovery_date: str
     enrichment_status: Dict[str, bool]
 
+class _SingleFlight:
+    """Runs one call per key at a time; callers arriving while it runs share its result"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """The in-flight call's future, and whether the caller leads (must run) it"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        with self._lock:
+            del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, func: Callable, *args) -> Any:
+        """Call func(*args), or wait for the identical call already running on another thread"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = func(*args)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def do_async(self, key: Hashable, func: Callable, *args) -> Any:
+        """Await func(*args), or the identical call already running on any event loop"""
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await func(*args)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+
 class BusinessDiscoveryEngine:
     def __init__(self):
         """Initialize the business discovery engine with API clients"""
@@ -58,6 +121,40 @@ class BusinessDiscoveryEngine:
         if not self.gmaps and not self.yelp:
             self.logger.error("No API clients initialized - business discovery will not work!")
             
+        # The Google and Yelp clients block, so the async paths run their calls on
+        # one small thread pool per provider, which also caps each API's concurrency
+        # and the fan-out of detail lookups
+        self.provider_limits = {
+            'google': int(os.getenv('GOOGLE_MAX_CONCURRENCY', 4)),
+            'yelp': int(os.getenv('YELP_MAX_CONCURRENCY', 2))
+        }
+        self._provider_pools = {
+            provider: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"discovery-{provider}")
+            for provider, limit in self.provider_limits.items()
+        }
+        
+        # Persistent cache of region -> coordinates; cities don't move, so entries live long
+        self.cache_file = os.getenv('CACHE_FILE', 'data/cache.db')
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        self.geocode_cache = PersistentTTLCache(
+            self.cache_file,
+            'geocodes',
+            ttl=float(os.getenv('GEOCODE_CACHE_TTL_SECONDS', 90 * 24 * 3600))
+        )
+        self.geocode_warm_file = os.getenv('GEOCODE_WARM_FILE', 'data/warm_regions.txt')
+        
+        # Recent search results, keyed by (region, type, radius). Fresh entries are
+        # served as is; stale ones are served while a background refresh runs
+        self.search_cache = LRUCache(int(os.getenv('SEARCH_CACHE_SIZE', 256)))
+        self.search_cache_ttl = float(os.getenv('SEARCH_CACHE_TTL_SECONDS', 3600))
+        self.search_cache_stale = float(os.getenv('SEARCH_CACHE_STALE_SECONDS', 24 * 3600))
+        self._refresh_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='discovery-refresh')
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        
+        # Identical searches already in flight are joined rather than repeated
+        self._flights = _SingleFlight()
+            
         # Initialize results storage
         self.discovered_businesses: List[BusinessContact] = []
         
@@ -83,17 +180,23 @@ class BusinessDiscoveryEngine:
                 'validation_status': 'pending',
                 'discovery_date': datetime.now().isoformat()
             }]
-            
+        
+        # Operators launching the same search at once share one run of the pipeline
+        key = ('discover', self._region_key(region), ' '.join(industry.casefold().split()), tuple(keywords))
+        return list(await self._flights.do_async(key, self._discover_async, region, industry, keywords))
+    
+    async def _discover_async(self, region: str, industry: str, keywords: List[str]) -> List[BusinessContact]:
+        """Search every provider, then deduplicate and enrich the results"""
         businesses = []
         
-        # Try each available API
+        # Search every available API at once
+        searches = []
         if self.gmaps:
-            places_results = await self._search_google_places(region, industry, keywords)
-            businesses.extend(places_results)
-            
+            searches.append(self._search_google_places(region, industry, keywords))
         if self.yelp:
-            yelp_results = await self._search_yelp(region, industry, keywords)
-            businesses.extend(yelp_results)
+            searches.append(self._search_yelp(region, industry, keywords))
+        for results in await asyncio.gather(*searches):
+            businesses.extend(results)
             
         # Remove duplicates
         unique_businesses = self._remove_duplicates(businesses)
@@ -103,6 +206,28 @@ class BusinessDiscoveryEngine:
         
         return enriched_businesses
     
+    async def _call_provider(self, provider: str, func, *args, **kwargs):
+        """Run a blocking API client call on the provider's thread pool without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._provider_pools[provider], partial(func, *args, **kwargs))
+    
+    async def _gather_details(self, provider: str, func, ids: List[str], **kwargs) -> List[Optional[Dict]]:
+        """
+        Look up details for every ID at once; the provider's pool bounds the fan-out.
+        Returns one result per ID, in order, with None for failed lookups.
+        """
+        results = await asyncio.gather(
+            *(self._call_provider(provider, func, item_id, **kwargs) for item_id in ids),
+            return_exceptions=True
+        )
+        details = []
+        for item_id, result in zip(ids, results):
+            if isinstance(result, Exception):
+                self.logger.error(f"Error getting {provider} details for {item_id}: {str(result)}")
+                result = None
+            details.append(result)
+        return details
+    
     async def _search_google_places(self, region: str, industry: str, keywords: List[str]) -> List[BusinessContact]:
         """Search Google Places API for businesses"""
         if not self.gmaps:
@@ -113,15 +238,21 @@ class BusinessDiscoveryEngine:
         
         try:
             # Search for businesses in the area
-            places_result = self.gmaps.places(
+            places_result = await self._call_provider(
+                'google',
+                self.gmaps.places,
                 query=search_query,
                 location=region,
                 radius=50000  # 50km radius
             )
             
-            for place in places_result.get('results', []):
-                # Get detailed place information
-                place_details = self.gmaps.place(place['place_id'])['result']
+            # Get detailed place information for every hit at once
+            place_ids = [place['place_id'] for place in places_result.get('results', []) if place.get('place_id')]
+            for details in await self._gather_details('google', self.gmaps.place, place_ids,
+                                                      fields=PLACE_DETAIL_FIELDS):
+                if details is None:
+                    continue
+                place_details = details['result']
                 
                 business = BusinessContact(
                     name=place_details.get('name', ''),
@@ -168,20 +299,25 @@ class BusinessDiscoveryEngine:
         search_query = f"{industry} {' '.join(keywords)}"
         
         try:
-            response = self.yelp.search_query(
+            response = await self._call_provider(
+                'yelp',
+                self.yelp.search_query,
                 term=search_query,
                 location=region,
                 limit=50
             )
             
-            for business in response['businesses']:
-                biz_details = self.yelp.business_query(business['id'])
+            yelp_ids = [business['id'] for business in response['businesses']]
+            for yelp_id, biz_details in zip(yelp_ids, await self._gather_details('yelp', self.yelp.business_query,
+                                                                                 yelp_ids)):
+                if biz_details is None:
+                    continue
                 
                 business_data = {
                     'name': biz_details['name'],
                     'address': f"{biz_details['location']['address1']}, {biz_details['location']['city']}",
                     'phone': biz_details.get('phone', ''),
-                    'yelp_id': business['id'],
+                    'yelp_id': yelp_id,
                     'processing_purpose': 'business_outreach',
                     'collection_date': datetime.now().isoformat()
                 }
@@ -220,17 +356,12 @@ class BusinessDiscoveryEngine:
         return []
     
     def _remove_duplicates(self, businesses: List[BusinessContact]) -> List[BusinessContact]:
-        """Remove duplicate businesses based on name and address"""
-        seen = set()
-        unique_businesses = []
-        
-        for business in businesses:
-            key = f"{business.name.lower()}|{business.address.lower()}"
-            if key not in seen:
-                seen.add(key)
-                unique_businesses.append(business)
-                
-        return unique_businesses
+        """Remove duplicate businesses using fuzzy name, phone and address matching"""
+        index = DedupIndex()
+        try:
+            return [business for business in businesses if index.check_and_add(vars(business))]
+        finally:
+            index.close()
     
     async def _enrich_business_data(self, businesses: List[BusinessContact]) -> List[BusinessContact]:
         """Enrich business data with additional information"""
@@ -285,11 +416,117 @@ class BusinessDiscoveryEngine:
             return f"({numbers_only[:3]}) {numbers_only[3:6]}-{numbers_only[6:]}"
         return phone
     
+    @staticmethod
+    def _region_key(region: str) -> str:
+        """Normalize a region so 'Atlanta,GA' and ' atlanta, ga ' share a cache entry"""
+        key = re.sub(r'\s*,\s*', ', ', region.strip().casefold())
+        return re.sub(r'\s+', ' ', key).strip(' ,.')
+    
+    def _geocode(self, region: str) -> Optional[Dict]:
+        """Coordinates of a region, from the geocode cache or the Geocoding API"""
+        key = self._region_key(region)
+        location = self.geocode_cache.get(key)
+        if location is None:
+            geocode_result = self.gmaps.geocode(region)
+            if not geocode_result:
+                return None
+            location = geocode_result[0]['geometry']['location']
+            self.geocode_cache.set(key, location)
+        return location
+    
+    def warm_geocodes(self, regions: Optional[Iterable[str]] = None) -> int:
+        """
+        Geocode regions that aren't cached yet, on the Google pool.
+        Defaults to the regions in GEOCODE_WARM_FILE, one per line.
+        Returns how many regions were added to the cache.
+        """
+        if not self.gmaps:
+            return 0
+        if regions is None:
+            if not os.path.exists(self.geocode_warm_file):
+                return 0
+            with open(self.geocode_warm_file) as f:
+                regions = [line for line in f if not line.startswith('#')]
+        
+        regions = {self._region_key(region): region.strip() for region in regions if region.strip()}
+        cached = self.geocode_cache.get_many(regions)
+        missing = [region for key, region in regions.items() if key not in cached]
+        
+        def fetch(region):
+            try:
+                return self._geocode(region)
+            except Exception as e:
+                self.logger.error(f"Error geocoding {region}: {str(e)}")
+                return None
+        
+        warmed = sum(1 for location in self._provider_pools['google'].map(fetch, missing) if location)
+        self.logger.info(f"Geocode cache warmed with {warmed} of {len(missing)} uncached regions")
+        return warmed
+    
+    def _search_key(self, region: str, business_type: str, radius) -> tuple:
+        return (self._region_key(region), ' '.join(business_type.casefold().split()), float(radius))
+    
+    def _search_and_cache(self, key: tuple, region: str, business_type: str, radius) -> List[Dict]:
+        """
+        Run a search and cache its results; concurrent identical searches share one run.
+        Results are only cached if every provider answered and something was found,
+        so an outage doesn't overwrite (or pin) the previous results.
+        """
+        def search():
+            businesses, failed = self._discover_uncached(region, business_type, radius)
+            if failed:
+                # Don't replace the cached results with incomplete ones
+                self.logger.warning(f"Not caching {business_type} in {region}: {', '.join(failed)} failed")
+            elif businesses:
+                self.search_cache.set(key, (time.monotonic(), businesses))
+            return businesses
+        return self._flights.do(('search',) + key, search)
+    
+    def search_cache_stats(self) -> Dict:
+        """Search cache counters, plus how many searches joined one already in flight"""
+        return {**self.search_cache.stats(), 'coalesced': self._flights.coalesced}
+    
+    def _refresh_search(self, key: tuple, region: str, business_type: str, radius):
+        """Re-run a cached search in the background, keeping the stale results if it fails"""
+        try:
+            self._search_and_cache(key, region, business_type, radius)
+        except Exception as e:
+            self.logger.error(f"Background refresh of {business_type} in {region} failed: {str(e)}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+    
     def discover_businesses_sync(self, region: str, business_type: str, radius: int = 50) -> List[Dict]:
         """
-        Synchronous version of business discovery for immediate results
+        Synchronous version of business discovery for immediate results.
+        Results are cached for SEARCH_CACHE_TTL_SECONDS; for SEARCH_CACHE_STALE_SECONDS
+        after that, the cached results are still returned while a background refresh runs.
+        """
+        key = self._search_key(region, business_type, radius)
+        entry = self.search_cache.get(key)
+        if entry is not None:
+            fetched_at, businesses = entry
+            age = time.monotonic() - fetched_at
+            if age < self.search_cache_ttl + self.search_cache_stale:
+                if age >= self.search_cache_ttl:
+                    with self._refresh_lock:
+                        start_refresh = key not in self._refreshing
+                        self._refreshing.add(key)
+                    if start_refresh:
+                        self._refresh_pool.submit(self._refresh_search, key, region, business_type, radius)
+                return [dict(business) for business in businesses]
+        
+        businesses = self._search_and_cache(key, region, business_type, radius)
+        return [dict(business) for business in businesses]
+    
+    def _discover_uncached(self, region: str, business_type: str, radius) -> Tuple[List[Dict], List[str]]:
+        """
+        Search Google Places and Yelp for businesses.
+        Returns (businesses, providers that failed); a failed provider's businesses
+        are missing or lack their details.
         """
         businesses = []
+        failed = []
         
         try:
             # Try Google Places API first
@@ -297,11 +534,9 @@ class BusinessDiscoveryEngine:
                 self.logger.info(f"Searching Google Places for {business_type} in {region}")
                 
                 try:
-                    # Get location coordinates
-                    geocode_result = self.gmaps.geocode(region)
-                    if geocode_result:
-                        location = geocode_result[0]['geometry']['location']
-                        
+                    # Get location coordinates (cached per normalized region)
+                    location = self._geocode(region)
+                    if location:
                         # Search for businesses
                         places_result = self.gmaps.places_nearby(
                             location=location,
@@ -309,8 +544,18 @@ class BusinessDiscoveryEngine:
                             keyword=business_type
                         )
                         
+                        # Request every hit's details at once on the Google pool; a hit
+                        # without a place_id has no details to look up
+                        places = places_result.get('results', [])
+                        detail_futures = [
+                            self._provider_pools['google'].submit(
+                                self.gmaps.place, place['place_id'], fields=PLACE_CONTACT_FIELDS
+                            ) if place.get('place_id') else None
+                            for place in places
+                        ]
+                        
                         # Process results
-                        for place in places_result.get('results', []):
+                        for place, detail_future in zip(places, detail_futures):
                             business = {
                                 'name': place.get('name', ''),
                                 'address': place.get('vicinity', ''),
@@ -322,20 +567,24 @@ class BusinessDiscoveryEngine:
                             }
                             
                             # Get additional details
-                            try:
-                                details = self.gmaps.place(place['place_id'])['result']
-                                business.update({
-                                    'phone': details.get('formatted_phone_number', ''),
-                                    'website': details.get('website', ''),
-                                    'email': '',  # Email usually not available from Google
-                                    'business_type': business_type
-                                })
-                            except Exception as e:
-                                self.logger.error(f"Error getting place details: {str(e)}")
+                            if detail_future is not None:
+                                try:
+                                    details = detail_future.result()['result']
+                                    business.update({
+                                        'phone': details.get('formatted_phone_number', ''),
+                                        'website': details.get('website', ''),
+                                        'email': '',  # Email usually not available from Google
+                                        'business_type': business_type
+                                    })
+                                except Exception as e:
+                                    self.logger.error(f"Error getting place details: {str(e)}")
+                                    if 'google place details' not in failed:
+                                        failed.append('google place details')
                             
                             businesses.append(business)
                 except Exception as e:
                     self.logger.error(f"Google Places API error: {str(e)}")
+                    failed.append('google')
             
             # Try Yelp API
             if self.yelp:
@@ -362,24 +611,23 @@ class BusinessDiscoveryEngine:
                         businesses.append(business)
                 except Exception as e:
                     self.logger.error(f"Yelp API error: {str(e)}")
+                    failed.append('yelp')
             
             if not businesses:
                 self.logger.warning("No businesses found from any source")
                 if not self.gmaps and not self.yelp:
                     raise Exception("No API clients available - please check your API keys")
-                return []
+                return [], failed
             
-            # Remove duplicates based on name and address
-            seen = set()
-            unique_businesses = []
-            for b in businesses:
-                key = (b['name'], b['address'])
-                if key not in seen:
-                    seen.add(key)
-                    unique_businesses.append(b)
+            # Remove Google/Yelp duplicates using fuzzy name, phone and address matching
+            index = DedupIndex()
+            try:
+                unique_businesses = [b for b in businesses if index.check_and_add(b)]
+            finally:
+                index.close()
             
             self.logger.info(f"Found {len(unique_businesses)} unique businesses")
-            return unique_businesses
+            return unique_businesses, failed
             
         except Exception as e:
             self.logger.error(f"Error in discover_businesses_sync: {str(e)}")
@@ -404,9 +652,21 @@ class BusinessDiscoveryEngine:
             
         return ""
 
+_shared_engine: Optional[BusinessDiscoveryEngine] = None
+_shared_engine_lock = threading.Lock()
+
+
+def shared_engine() -> BusinessDiscoveryEngine:
+    """The process-wide engine, so every caller shares its caches and in-flight searches"""
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = BusinessDiscoveryEngine()
+        return _shared_engine
+
 # Usage Example:
 async def main():
-    engine = BusinessDiscoveryEngine()
+    engine = shared_engine()
     businesses = await engine.discover_businesses(
         region="Atlanta, GA",
         industry="Restaurant",
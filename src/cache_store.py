@@ -0,0 +1,127 @@
+"""
+Cache Store Module
+In-process and persistent caches:
+- LRUCache: bounded in-memory mapping with least-recently-used eviction
+- PersistentTTLCache: key/value cache with per-entry TTL, backed by SQLite
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Optional
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry, with hit/miss counters"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class PersistentTTLCache:
+    def __init__(self, db_file: str, namespace: str, ttl: float):
+        """
+        Args:
+            db_file: SQLite file holding the cache (shared by namespaces)
+            namespace: Table name for this cache
+            ttl: Default time-to-live of an entry, in seconds
+        """
+        if not namespace.isidentifier():
+            raise ValueError(f"Invalid cache namespace: {namespace}")
+        self.db_file = db_file
+        self.namespace = namespace
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._lock, self._conn:
+            self._conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {namespace} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a cached value, or None if missing or expired"""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get all unexpired cached values for the given keys"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT key, value FROM {self.namespace} WHERE key IN ({placeholders}) AND expires_at > ?',
+                    (*chunk, now)
+                )
+                for key, value in rows:
+                    found[key] = json.loads(value)
+        return found
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Cache a value"""
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None):
+        """Cache several values in one transaction"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO {self.namespace} (key, value, expires_at) VALUES (?, ?, ?)',
+                ((key, json.dumps(value), expires_at) for key, value in items.items())
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def purge_expired(self) -> int:
+        """Delete expired entries, returning how many were removed"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(f'DELETE FROM {self.namespace} WHERE expires_at <= ?', (time.time(),))
+            return cursor.rowcount
@@ -0,0 +1,272 @@
+"""
+Campaign Engine Module
+Checkpointed email campaigns with per-recipient state.
+
+Recipients are numbered in the order they were added. Each campaign keeps a
+cursor at the last recipient it processed, so a tick only reads the next
+batch past the cursor instead of rescanning every recipient. Progress
+counters are kept on the campaign row, so listing campaigns is also
+independent of their size.
+
+A tick claims its batch before sending by advancing the cursor only if no
+other tick moved it first, and marks the batch 'sending', so concurrent ticks
+(app, scheduler, scripts) never process the same recipients. A claim that
+isn't recorded within CAMPAIGN_CLAIM_TIMEOUT_SECONDS (e.g. the process died)
+is processed again; sends use an idempotency key per (campaign, lead), so a
+recipient processed again is not emailed twice.
+
+Environment Variables:
+- CAMPAIGNS_DB_FILE: Campaign database (default data/campaigns.db)
+- CAMPAIGN_BATCH_SIZE: Most recipients processed per tick across all campaigns (default 50)
+- CAMPAIGN_CLAIM_TIMEOUT_SECONDS: Age after which an unrecorded claim is processed again (default 300)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Campaign columns returned by get/all, in table order
+_CAMPAIGN_COLUMNS = ('id', 'name', 'template_id', 'status', 'total', 'cursor',
+                     'sent', 'failed', 'skipped', 'created_at', 'updated_at')
+
+
+class CampaignEngine:
+    def __init__(self, db_file: Optional[str] = None, batch_size: Optional[int] = None,
+                 claim_timeout: Optional[float] = None):
+        """
+        Args:
+            db_file: SQLite file for campaigns and recipients
+            batch_size: Most recipients processed per tick across all campaigns
+            claim_timeout: Seconds after which claimed but unrecorded recipients are processed again
+        """
+        self.db_file = db_file or os.getenv('CAMPAIGNS_DB_FILE', 'data/campaigns.db')
+        self.batch_size = batch_size or int(os.getenv('CAMPAIGN_BATCH_SIZE', '50'))
+        self.claim_timeout = claim_timeout or float(os.getenv('CAMPAIGN_CLAIM_TIMEOUT_SECONDS', '300'))
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS campaigns (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    template_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    total INTEGER NOT NULL,
+                    cursor INTEGER NOT NULL DEFAULT 0,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    skipped INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_campaigns_status ON campaigns(status, created_at);
+                CREATE TABLE IF NOT EXISTS campaign_recipients (
+                    campaign_id TEXT NOT NULL,
+                    seq INTEGER NOT NULL,
+                    lead_id TEXT,
+                    email TEXT,
+                    lead TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    message TEXT,
+                    updated_at TEXT,
+                    PRIMARY KEY (campaign_id, seq)
+                );
+                CREATE INDEX IF NOT EXISTS idx_recipients_state ON campaign_recipients(campaign_id, state, updated_at);
+            """)
+
+    def create(self, name: str, template_id: str, leads: Iterable[Dict]) -> str:
+        """Create an active campaign for the leads; returns its ID"""
+        campaign_id = uuid.uuid4().hex[:12]
+        now = datetime.now().isoformat()
+        rows = [
+            (campaign_id, seq, None if lead.get('id') is None else str(lead['id']), lead.get('email'), json.dumps(lead))
+            for seq, lead in enumerate(leads, 1)
+        ]
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO campaigns (id, name, template_id, status, total, created_at, updated_at) '
+                "VALUES (?, ?, ?, 'active', ?, ?, ?)",
+                (campaign_id, name, template_id, len(rows), now, now)
+            )
+            self._conn.executemany(
+                'INSERT INTO campaign_recipients (campaign_id, seq, lead_id, email, lead) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            if not rows:
+                self._conn.execute("UPDATE campaigns SET status = 'completed' WHERE id = ?", (campaign_id,))
+        return campaign_id
+
+    @staticmethod
+    def _campaign(row) -> Dict:
+        campaign = dict(zip(_CAMPAIGN_COLUMNS, row))
+        done = campaign['sent'] + campaign['failed'] + campaign['skipped']
+        campaign['pending'] = campaign['total'] - campaign['cursor']
+        campaign['progress'] = round(100 * done / campaign['total'], 1) if campaign['total'] else 100.0
+        return campaign
+
+    def get(self, campaign_id: str) -> Optional[Dict]:
+        """Get a campaign with its progress counters"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_CAMPAIGN_COLUMNS)} FROM campaigns WHERE id = ?", (campaign_id,)
+            ).fetchone()
+        return self._campaign(row) if row else None
+
+    def all(self) -> List[Dict]:
+        """Get all campaigns, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(_CAMPAIGN_COLUMNS)} FROM campaigns ORDER BY created_at DESC"
+            ).fetchall()
+        return [self._campaign(row) for row in rows]
+
+    def set_status(self, campaign_id: str, status: str) -> bool:
+        """Pause ('paused') or resume ('active') a campaign that isn't completed"""
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE campaigns SET status = ?, updated_at = ? WHERE id = ? AND status != 'completed'",
+                (status, datetime.now().isoformat(), campaign_id)
+            ).rowcount > 0
+
+    def recipients(self, campaign_id: str, state: Optional[str] = None, after_seq: int = 0,
+                   limit: int = 100) -> List[Dict]:
+        """Page through a campaign's recipients in order"""
+        query = ('SELECT seq, lead_id, email, state, message, updated_at FROM campaign_recipients '
+                 'WHERE campaign_id = ? AND seq > ?')
+        params = [campaign_id, after_seq]
+        if state:
+            query += ' AND state = ?'
+            params.append(state)
+        query += ' ORDER BY seq LIMIT ?'
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        columns = ('seq', 'lead_id', 'email', 'state', 'message', 'updated_at')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _claim_next(self, campaign_id: str, cursor: int, limit: int) -> List[Tuple[int, Dict]]:
+        """
+        Claim the next recipients past the cursor, as (seq, lead).
+        The cursor only moves if it is still where this tick read it, so a batch
+        claimed by a concurrent tick is left alone (an empty list is returned).
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                'SELECT seq, lead FROM campaign_recipients WHERE campaign_id = ? AND seq > ? ORDER BY seq LIMIT ?',
+                (campaign_id, cursor, limit)
+            ).fetchall()
+            if not rows:
+                return []
+            claimed = self._conn.execute(
+                "UPDATE campaigns SET cursor = ?, updated_at = ? WHERE id = ? AND cursor = ? AND status = 'active'",
+                (rows[-1][0], now, campaign_id, cursor)
+            ).rowcount
+            if not claimed:
+                return []
+            self._conn.execute(
+                "UPDATE campaign_recipients SET state = 'sending', updated_at = ? "
+                'WHERE campaign_id = ? AND seq > ? AND seq <= ?',
+                (now, campaign_id, cursor, rows[-1][0])
+            )
+        return [(seq, json.loads(lead)) for seq, lead in rows]
+
+    def _reclaim_stale(self, campaign_id: str, limit: int) -> List[Tuple[int, Dict]]:
+        """Claim recipients whose claim was never recorded within the claim timeout, as (seq, lead)"""
+        now = datetime.now()
+        expired = (now - timedelta(seconds=self.claim_timeout)).isoformat()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT seq, lead, updated_at FROM campaign_recipients "
+                "WHERE campaign_id = ? AND state = 'sending' AND updated_at <= ? ORDER BY seq LIMIT ?",
+                (campaign_id, expired, limit)
+            ).fetchall()
+            reclaimed = []
+            for seq, lead, claimed_at in rows:
+                # Only take over the claim if no other tick took it over first
+                if self._conn.execute(
+                    'UPDATE campaign_recipients SET updated_at = ? '
+                    "WHERE campaign_id = ? AND seq = ? AND state = 'sending' AND updated_at = ?",
+                    (now.isoformat(), campaign_id, seq, claimed_at)
+                ).rowcount:
+                    reclaimed.append((seq, json.loads(lead)))
+        return reclaimed
+
+    def _record(self, campaign_id: str, outcomes: List[Tuple[int, str, str]]):
+        """Save claimed recipients' outcomes and counters in one transaction"""
+        now = datetime.now().isoformat()
+        counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+        for _, state, _ in outcomes:
+            counts[state] += 1
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE campaign_recipients SET state = ?, message = ?, updated_at = ? WHERE campaign_id = ? AND seq = ?',
+                ((state, message, now, campaign_id, seq) for seq, state, message in outcomes)
+            )
+            self._conn.execute(
+                'UPDATE campaigns SET sent = sent + ?, failed = failed + ?, skipped = skipped + ?, updated_at = ? '
+                'WHERE id = ?',
+                (counts['sent'], counts['failed'], counts['skipped'], now, campaign_id)
+            )
+            self._complete_if_done(campaign_id)
+
+    def _complete_if_done(self, campaign_id: str):
+        """Mark a campaign completed once every recipient is claimed and recorded; caller holds the lock"""
+        self._conn.execute(
+            "UPDATE campaigns SET status = 'completed' WHERE id = ? AND status = 'active' AND cursor >= total "
+            "AND NOT EXISTS (SELECT 1 FROM campaign_recipients WHERE campaign_id = ? AND state = 'sending')",
+            (campaign_id, campaign_id)
+        )
+
+    def tick(self, send: Callable[[Dict, Dict], Tuple[Optional[bool], str]],
+             limit: Optional[int] = None) -> Dict[str, int]:
+        """
+        Process up to `limit` pending recipients across active campaigns, oldest campaign first.
+        Each batch is claimed before any of it is sent.
+
+        Args:
+            send: Called as send(campaign, lead); returns (success, message), with
+                success None when the recipient was skipped (e.g. no email address)
+            limit: Most recipients processed; defaults to batch_size
+
+        Returns:
+            Recipients processed per campaign ID
+        """
+        budget = self.batch_size if limit is None else limit
+        processed = {}
+        with self._lock:
+            active = self._conn.execute(
+                f"SELECT {', '.join(_CAMPAIGN_COLUMNS)} FROM campaigns WHERE status = 'active' ORDER BY created_at"
+            ).fetchall()
+
+        for row in active:
+            if budget <= 0:
+                break
+            campaign = self._campaign(row)
+            batch = self._reclaim_stale(campaign['id'], budget)
+            batch += self._claim_next(campaign['id'], campaign['cursor'], budget - len(batch))
+            outcomes = []
+            for seq, lead in batch:
+                try:
+                    success, message = send(campaign, lead)
+                except Exception as e:
+                    success, message = False, str(e)
+                state = 'skipped' if success is None else ('sent' if success else 'failed')
+                outcomes.append((seq, state, message))
+            if outcomes:
+                self._record(campaign['id'], outcomes)
+            elif campaign['cursor'] >= campaign['total']:
+                with self._lock, self._conn:
+                    self._complete_if_done(campaign['id'])
+            budget -= len(outcomes)
+            processed[campaign['id']] = len(outcomes)
+        return processed
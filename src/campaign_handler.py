@@ -1,11 +1,16 @@
 from flask import Blueprint, jsonify
-from email_sender import EmailSender
-from lead_finder import LeadFinder
 import traceback
 
 campaign_bp = Blueprint('campaign', __name__)
-email_sender = EmailSender()
-lead_finder = LeadFinder()
+# Set by the registering app through use_services, so the routes share its
+# EmailSender (and send queue) and LeadFinder instead of opening their own
+email_sender = None
+lead_finder = None
+
+def use_services(sender, finder):
+    """Serve the campaign routes with the app's EmailSender and LeadFinder"""
+    global email_sender, lead_finder
+    email_sender, lead_finder = sender, finder
 
 @campaign_bp.route('/api/campaign/start', methods=['POST'])
 def start_campaign():
@@ -6,16 +6,24 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# One sender per process, so every tick reuses its ledger, queue and connections
+email_sender = None
+
 def process_campaigns():
     """Process all active email campaigns"""
-    email_sender = EmailSender()
+    global email_sender
+    if email_sender is None:
+        email_sender = EmailSender()
     email_sender.process_campaigns()
 
 def find_new_leads():
     """Find new leads without websites"""
     lead_finder = LeadFinder()
-    new_leads = lead_finder.find_leads()
-    print(f"Found {len(new_leads)} new leads!")
+    try:
+        new_leads = lead_finder.find_leads()
+        print(f"Found {len(new_leads)} new leads!")
+    finally:
+        lead_finder.close()
 
 def main():
     # Schedule lead finding every day at 9 AM
@@ -1,13 +1,17 @@
 import os
 from typing import List, Dict
+from uuid import uuid4
 from hubspot import HubSpot
 from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail, Email, To, Content
+from mail_delivery import DeliveryLedger, DeliveryResult, RetryPolicy, send_with_retry
 
 class CRMIntegration:
     def __init__(self):
         self.hubspot_client = HubSpot(access_token=os.getenv('HUBSPOT_API_KEY'))
         self.sendgrid_client = SendGridAPIClient(os.getenv('SENDGRID_API_KEY'))
+        self.retry_policy = RetryPolicy()
+        self.ledger = DeliveryLedger()
 
     def export_to_hubspot(self, businesses: List[Dict]) -> List[str]:
         """Export businesses to HubSpot and return created contact IDs."""
@@ -36,8 +40,22 @@ class CRMIntegration:
         
         return contact_ids
 
-    def send_email_campaign(self, business: Dict, template_id: str) -> bool:
-        """Send personalized email using SendGrid template."""
+    def send_email_campaign(self, business: Dict, template_id: str, campaign_id: str = None,
+                            idempotency_key: str = None) -> bool:
+        """
+        Send personalized email using SendGrid template.
+        Transient failures are retried with backoff and permanent ones dead-lettered.
+        The send is deduplicated by idempotency_key if given, otherwise the business
+        is emailed at most once per campaign_id; without either, every call sends.
+        """
+        if not idempotency_key:
+            lead = business.get('id') or business.get('email')
+            idempotency_key = (self.ledger.key(campaign_id, lead) if campaign_id
+                               else f"crm_template:{uuid4().hex}")
+        if not self.ledger.begin(idempotency_key):
+            print(f"Skipping {business.get('name')}: already sent ({idempotency_key})")
+            return self.ledger.is_sent(idempotency_key)
+        
         try:
             message = Mail(
                 from_email=Email(os.getenv('SENDER_EMAIL')),
@@ -53,9 +71,31 @@ class CRMIntegration:
                 'address': business['address'],
             }
             
-            response = self.sendgrid_client.send(message)
-            return response.status_code == 202
-            
+            result = send_with_retry(lambda: self.sendgrid_client.send(message), self.retry_policy)
         except Exception as e:
-            print(f"Error sending email to {business['name']}: {str(e)}")
-            return False
+            result = DeliveryResult(False, None, str(e), 1)
+        
+        if result.success:
+            self.ledger.complete(idempotency_key)
+            return True
+        
+        print(f"Error sending email to {business.get('name')}: {result.message}")
+        self.ledger.release(idempotency_key)
+        self.ledger.dead_letter('crm_template', {
+            'business': business,
+            'template_id': template_id,
+            'campaign_id': campaign_id
+        }, result, idempotency_key)
+        return False
+
+    def replay_dead_letters(self, ids: List[int] = None, limit: int = 100) -> List[Dict]:
+        """Send dead-lettered template emails again; returns one {id, email, success} per message"""
+        letters = self.ledger.dead_letters('crm_template', ids=ids, limit=limit)
+        self.ledger.mark_replayed([letter['id'] for letter in letters])
+        results = []
+        for letter in letters:
+            payload = letter['payload']
+            success = self.send_email_campaign(payload['business'], payload['template_id'], payload.get('campaign_id'),
+                                               idempotency_key=letter['key'])
+            results.append({'id': letter['id'], 'email': payload['business'].get('email'), 'success': success})
+        return results
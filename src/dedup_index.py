@@ -0,0 +1,273 @@
+"""
+Dedup Index Module
+Persistent fuzzy duplicate detection for businesses across providers and runs.
+
+Each business is reduced to a normalized name, phone, website domain and
+location, and filed under a few blocking keys (phone, domain, geohash, address,
+name). A new business is only compared against the handful of records sharing
+one of its blocking keys. A business without a name only matches on the same
+phone or street address, and a name alone only matches when neither record has
+a location, phone or website, so one bare manual lead does not swallow every
+branch of a chain.
+"""
+
+import re
+import sqlite3
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Words that don't help tell businesses apart
+_NAME_STOPWORDS = {'the', 'llc', 'inc', 'co', 'corp', 'corporation', 'ltd', 'company', 'and'}
+
+_ADDRESS_ABBREVIATIONS = {
+    'street': 'st', 'avenue': 'ave', 'road': 'rd', 'boulevard': 'blvd', 'drive': 'dr',
+    'lane': 'ln', 'court': 'ct', 'place': 'pl', 'highway': 'hwy', 'parkway': 'pkwy',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w', 'suite': 'ste'
+}
+
+
+def geohash(lat: float, lng: float, precision: int = 6) -> str:
+    """Encode coordinates as a geohash (precision 6 is a cell of about 1.2km x 0.6km)"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, bit_count, even = 0, 0, True
+    result = []
+    while len(result) < precision:
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            result.append(_GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return ''.join(result)
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase and drop punctuation and legal suffixes, e.g. "Joe's Pizza, LLC" -> "joes pizza\""""
+    name = (name or '').lower().replace('&', ' and ').replace("'", '')
+    tokens = re.findall(r'[a-z0-9]+', name)
+    return ' '.join(token for token in tokens if token not in _NAME_STOPWORDS)
+
+
+def normalize_phone(phone: str) -> Optional[str]:
+    """Last 10 digits of a phone number, or None if it is too short to be useful"""
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-10:] if len(digits) >= 7 else None
+
+
+def normalize_address(address: str) -> Optional[str]:
+    """Street number plus first street word, e.g. '123 main' for '123 Main Street, Atlanta'"""
+    street = (address or '').lower().split(',')[0]
+    tokens = [_ADDRESS_ABBREVIATIONS.get(token, token) for token in re.findall(r'[a-z0-9]+', street)]
+    if len(tokens) < 2 or not tokens[0].isdigit():
+        return None
+    return ' '.join(tokens[:2])
+
+
+def normalize_domain(website: str) -> Optional[str]:
+    """Host of a website without 'www.', e.g. 'joespizza.com' for 'https://www.JoesPizza.com/menu'"""
+    website = (website or '').strip().lower()
+    if not website:
+        return None
+    host = urlsplit(website if '//' in website else f"//{website}").hostname or ''
+    host = host[4:] if host.startswith('www.') else host
+    return host if '.' in host else None
+
+
+def business_fields(business: Dict) -> Tuple[str, str, str, Optional[float], Optional[float]]:
+    """Extract (name, phone, address, lat, lng) from a Google, Yelp or internal business record"""
+    location = business.get('location')
+    if isinstance(location, dict) and 'address1' in location:
+        # Yelp: location is an address object
+        yelp_address = ', '.join(filter(None, [location.get('address1'), location.get('city')]))
+    else:
+        yelp_address = ''
+
+    address = (business.get('formatted_address') or business.get('vicinity')
+               or business.get('address') or yelp_address or '')
+    phone = (business.get('formatted_phone_number') or business.get('international_phone_number')
+             or business.get('phone') or '')
+
+    lat = lng = None
+    coordinates = (business.get('geometry') or {}).get('location') or business.get('coordinates')
+    if coordinates:
+        lat = coordinates.get('lat', coordinates.get('latitude'))
+        lng = coordinates.get('lng', coordinates.get('longitude'))
+
+    return business.get('name') or business.get('business_name') or '', phone, address, lat, lng
+
+
+class Fingerprint(NamedTuple):
+    name: str
+    phone: Optional[str]
+    domain: Optional[str]
+    location_keys: List[str]
+    keys: List[str]
+
+
+class DedupIndex:
+    def __init__(self, db_file: str = ':memory:', name_threshold: float = 0.85, max_block_size: int = 50):
+        """
+        Args:
+            db_file: SQLite file for the index; ':memory:' for a throwaway per-call index
+            name_threshold: Minimum name similarity for two nearby businesses to be duplicates
+            max_block_size: Most candidates compared per blocking key
+        """
+        self.db_file = db_file
+        self.name_threshold = name_threshold
+        self.max_block_size = max_block_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS records (
+                    rid INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    phone TEXT,
+                    domain TEXT,
+                    located INTEGER NOT NULL,
+                    ref TEXT
+                );
+                CREATE TABLE IF NOT EXISTS blocks (
+                    key TEXT NOT NULL,
+                    rid INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_blocks_key ON blocks(key);
+                CREATE INDEX IF NOT EXISTS idx_blocks_rid ON blocks(rid);
+                CREATE INDEX IF NOT EXISTS idx_records_ref ON records(ref);
+            """)
+            # Indexes built before websites were compared lack the domain column
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(records)')}
+            if 'domain' not in columns:
+                self._conn.execute('ALTER TABLE records ADD COLUMN domain TEXT')
+
+    @staticmethod
+    def _fingerprint(business: Dict) -> Fingerprint:
+        """Reduce a business to its normalized fields and blocking keys"""
+        name, phone, address, lat, lng = business_fields(business)
+        name = normalize_name(name)
+        phone = normalize_phone(phone)
+        domain = normalize_domain(business.get('website'))
+
+        location_keys = []
+        if lat is not None and lng is not None:
+            location_keys.append(f"geo:{geohash(lat, lng)}")
+        address_key = normalize_address(address)
+        if address_key:
+            location_keys.append(f"addr:{address_key}")
+
+        keys = list(location_keys)
+        if phone:
+            keys.append(f"phone:{phone}")
+        if domain:
+            keys.append(f"domain:{domain}")
+        if name:
+            keys.append(f"name:{name}")
+        return Fingerprint(name, phone, domain, location_keys, keys)
+
+    @staticmethod
+    def _similarity(a: str, b: str) -> float:
+        """Name similarity that ignores word order"""
+        return SequenceMatcher(None, ' '.join(sorted(a.split())), ' '.join(sorted(b.split()))).ratio()
+
+    def _find(self, fingerprint: Fingerprint) -> Optional[Tuple]:
+        """Find the first indexed record that duplicates the fingerprint"""
+        name, phone, domain, location_keys, keys = fingerprint
+        bare = not (location_keys or phone or domain)
+        seen = set()
+        for key in keys:
+            rows = self._conn.execute(
+                'SELECT r.rid, r.name, r.phone, r.domain, r.located, r.ref FROM blocks b '
+                'JOIN records r ON r.rid = b.rid WHERE b.key = ? LIMIT ?',
+                (key, self.max_block_size)
+            ).fetchall()
+            for rid, other_name, other_phone, other_domain, located, ref in rows:
+                if rid in seen:
+                    continue
+                seen.add(rid)
+                if not name or not other_name:
+                    # Without a name to compare, only an exact phone or street address match counts
+                    if (phone and phone == other_phone) or key.startswith('addr:'):
+                        return rid, ref
+                    continue
+                similarity = self._similarity(name, other_name)
+
+                # Same phone number or website: only a loose name match is needed
+                if ((phone and phone == other_phone) or (domain and domain == other_domain)) and similarity >= 0.5:
+                    return rid, ref
+                # Same neighbourhood or street address with a close name
+                if key in location_keys and similarity >= self.name_threshold:
+                    return rid, ref
+                # Identical name, and nothing else to tell the two apart
+                if key.startswith('name:') and bare and not (located or other_phone or other_domain):
+                    return rid, ref
+        return None
+
+    def find_duplicate(self, business: Dict) -> Optional[Tuple[int, Optional[str]]]:
+        """Return (record id, ref) of an indexed duplicate of the business, or None"""
+        fingerprint = self._fingerprint(business)
+        if not fingerprint.keys:
+            return None
+        with self._lock:
+            return self._find(fingerprint)
+
+    def add(self, business: Dict, ref: Optional[str] = None):
+        """Index a business without checking for duplicates"""
+        fingerprint = self._fingerprint(business)
+        if not fingerprint.keys:
+            return
+        with self._lock, self._conn:
+            self._insert(fingerprint, ref)
+
+    def remove(self, ref: str) -> int:
+        """Forget every business indexed under ref, e.g. a deleted lead; returns how many"""
+        with self._lock, self._conn:
+            rids = [(rid,) for rid, in self._conn.execute('SELECT rid FROM records WHERE ref = ?', (ref,))]
+            self._conn.executemany('DELETE FROM blocks WHERE rid = ?', rids)
+            self._conn.executemany('DELETE FROM records WHERE rid = ?', rids)
+            return len(rids)
+
+    def _insert(self, fingerprint: Fingerprint, ref: Optional[str]):
+        """Insert a fingerprint and its blocking keys; caller holds the lock and transaction"""
+        cursor = self._conn.execute(
+            'INSERT INTO records (name, phone, domain, located, ref) VALUES (?, ?, ?, ?, ?)',
+            (fingerprint.name, fingerprint.phone, fingerprint.domain, int(bool(fingerprint.location_keys)), ref)
+        )
+        self._conn.executemany(
+            'INSERT INTO blocks (key, rid) VALUES (?, ?)',
+            ((key, cursor.lastrowid) for key in fingerprint.keys)
+        )
+
+    def check_and_add(self, business: Dict, ref: Optional[str] = None) -> bool:
+        """
+        Index the business unless it duplicates an indexed one.
+        Returns True if it was new, False if it is a duplicate. A business with
+        nothing to compare on (no name, phone or address) is always new.
+        """
+        fingerprint = self._fingerprint(business)
+        if not fingerprint.keys:
+            return True
+        with self._lock, self._conn:
+            if self._find(fingerprint):
+                return False
+            self._insert(fingerprint, ref)
+            return True
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def is_empty(self) -> bool:
+        """Check whether nothing has been indexed yet"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM records LIMIT 1').fetchone() is None
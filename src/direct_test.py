@@ -3,6 +3,7 @@ from sendgrid.helpers.mail import Mail
 import os
 from dotenv import load_dotenv
 import json
+from template_engine import compile_email
 
 load_dotenv()
 
@@ -36,13 +37,17 @@ except Exception as e:
 print("Template loaded successfully")
 
 # Replace placeholders
-subject = template['subject'].replace('{{business_name}}', business_name)
-content = template['content']
-content = content.replace('{{business_name}}', business_name)
-content = content.replace('{{business_type}}', business_type)
-content = content.replace('{{location}}', location)
-content = content.replace('{{sender_name}}', sender_name)
-content = content.replace('{{company_name}}', company_name)
+rendered = compile_email(template).render({
+    'business_name': business_name,
+    'business_type': business_type,
+    'location': location,
+    'sender_name': sender_name,
+    'company_name': company_name
+})
+subject = rendered['subject']
+content = rendered['content']
+if rendered['missing']:
+    print(f"Unresolved placeholders: {', '.join(rendered['missing'])}")
 
 print("\nEmail Details:")
 print(f"From: {sender_name} <{from_email}>")
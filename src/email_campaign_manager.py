@@ -1,6 +1,7 @@
 import os
 from typing import List, Dict
 from datetime import datetime
+from uuid import uuid4
 import json
 from crm_integration import CRMIntegration
 
@@ -55,8 +56,11 @@ class EmailCampaignManager:
             # Send email campaigns
             template_id = self.templates.get('no_website', {}).get('template_id')
             if template_id:
+                # Scope deduplication to this run, so a business listed twice
+                # gets one email while later runs may email it again
+                run_id = f"{template_id}:{uuid4().hex}"
                 for business in no_website_businesses:
-                    if self.crm.send_email_campaign(business, template_id):
+                    if self.crm.send_email_campaign(business, template_id, campaign_id=run_id):
                         results['emails_sent'] += 1
 
         except Exception as e:
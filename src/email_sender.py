@@ -26,108 +26,585 @@ Date: January 2025
 
 import json
 import os
+import re
 from datetime import datetime
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content
+from sendgrid.helpers.mail import Email
 from dotenv import load_dotenv
 from flask import Flask, render_template, request, jsonify
-from business_discovery import BusinessDiscoveryEngine
+from business_discovery import shared_engine as shared_discovery_engine
+from template_registry import TemplateRegistry
+from template_engine import compile_email
+from cache_store import LRUCache
+from mail_delivery import DeliveryLedger, DeliveryResult, RetryPolicy, send_with_retry
+from mail_transport import create_transport
+from send_queue import SendQueue
+from campaign_engine import CampaignEngine
 
 load_dotenv()
 
 app = Flask(__name__)
 
+# SendGrid accepts at most this many personalizations per mail/send request
+MAX_PERSONALIZATIONS = 1000
+
+# Matches the personalization index in SendGrid error fields like "personalizations.3.to.0.email"
+_PERSONALIZATION_FIELD = re.compile(r'^personalizations\.(\d+)\.')
+
 class EmailSender:
-    def __init__(self):
+    def __init__(self, ledger=None, send_queue=None):
+        """
+        Args:
+            ledger: DeliveryLedger shared with the process's other senders
+            send_queue: The process's SendQueue, through which campaign ticks reserve
+                the shared hourly/daily send limits; opened on first use if not given
+        """
         self.api_key = os.environ.get('SENDGRID_API_KEY')
-        if not self.api_key:
-            raise ValueError("SENDGRID_API_KEY not found in environment variables")
-        self.sg = SendGridAPIClient(self.api_key)
         self.from_email = Email('sam@webreachconnect.com', 'Sam from Web Reach Connect')
+        # SendGrid HTTP API or a pooled SMTP relay, per MAIL_TRANSPORT
+        self.transport = create_transport(os.environ.get('MAIL_TRANSPORT', 'sendgrid'),
+                                          from_email=self.from_email.email, from_name=self.from_email.name)
+        # Batched personalizations go through the SendGrid transport's client; None over SMTP
+        self.sg = getattr(self.transport, 'client', None)
+        self.sender_name = os.environ.get('SENDER_NAME', 'Sam')
+        self.company_name = os.environ.get('COMPANY_NAME', 'Web Reach Connect')
+        self.sender_contact = os.environ.get('CONTACT_PHONE') or self.from_email.email
         self.templates_file = os.path.join(os.path.dirname(__file__), 'data/email_templates.json')
+        # Parsed once and indexed by ID; reloaded only when the file changes
+        self.templates = TemplateRegistry(self.templates_file)
+        # Retries transient SendGrid failures; the ledger dedupes and dead-letters sends
+        self.retry_policy = RetryPolicy()
+        self.ledger = ledger or (send_queue.ledger if send_queue else None) or DeliveryLedger()
+        # Single-template files (data/templates/*.json) looked up when a template isn't in the registry
+        self.template_dir = os.path.join(os.path.dirname(__file__), 'data/templates')
+        self.campaigns = CampaignEngine()
+        # Hourly/daily send limits (EMAIL_HOURLY_LIMIT / EMAIL_DAILY_LIMIT) are shared by every queue
+        self.send_queue = send_queue
+        # Compiled templates keyed by (id, version) and rendered previews keyed by
+        # (id, version, values of the variables the template uses)
+        self._compiled_templates = LRUCache(int(os.getenv('COMPILED_TEMPLATE_CACHE_SIZE', '256')))
+        self.preview_cache = LRUCache(int(os.getenv('PREVIEW_CACHE_SIZE', '4096')))
 
     def get_all_templates(self):
         """Get all available email templates"""
-        try:
-            with open(self.templates_file, 'r') as f:
-                data = json.load(f)
-                return data.get('templates', []) + data.get('templates_with_website', [])
-        except Exception as e:
-            print(f"Error loading templates: {e}")
-            return []
+        return self.templates.all()
 
     def get_template(self, template_id):
         """Get a specific template by ID"""
+        template = self.templates.get(template_id)
+        if template is None and template_id:
+            template = self._template_file(template_id)
+        return template
+
+    def _template_path(self, template_id):
+        return os.path.join(self.template_dir, f"{os.path.basename(template_id)}.json")
+
+    def _template_file(self, template_id):
+        """Load data/templates/<template_id>.json, if present"""
+        path = self._template_path(template_id)
         try:
-            with open(self.templates_file, 'r') as f:
-                data = json.load(f)
-                # Search in both template lists
-                for template in data.get('templates', []) + data.get('templates_with_website', []):
-                    if template['id'] == template_id:
-                        return template
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
             return None
-        except Exception as e:
-            print(f"Error loading template: {e}")
+
+    def get_active_template(self):
+        """Template used for new campaigns (ACTIVE_TEMPLATE_ID, default business_template)"""
+        return self.get_template(os.getenv('ACTIVE_TEMPLATE_ID', 'business_template'))
+
+    def template_variables(self, lead):
+        """Placeholder values for a lead, covering all template dialects"""
+        business_name = lead.get('business_name') or lead.get('name')
+        values = {
+            'business_name': business_name,
+            'recipient_name': lead.get('contact_name') or business_name,
+            'contact_name': lead.get('contact_name'),
+            'business_type': lead.get('business_type') or lead.get('detected_type') or lead.get('type'),
+            'location': lead.get('location') or lead.get('address'),
+            'email': lead.get('email'),
+            'sender_name': self.sender_name,
+            'company_name': self.company_name,
+            'sender_contact': self.sender_contact
+        }
+        return {key: value for key, value in values.items() if value}
+
+    def render_template(self, template_id, lead):
+        """
+        Render a template for a lead.
+        Returns dict with subject, content and missing (unresolved variables),
+        or None if the template doesn't exist.
+        """
+        compiled = self._compiled_template(template_id, self.template_version(template_id))
+        if compiled is None:
+            return None
+        return compiled.render(self.template_variables(lead or {}))
+
+    def template_version(self, template_id):
+        """
+        Version of a template's source: the registry's content hash, or the
+        modification time of its file in data/templates. None if it doesn't exist.
+        """
+        template, version = self.templates.lookup(template_id)
+        if template is not None:
+            return version
+        try:
+            return os.stat(self._template_path(template_id)).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def _compiled_template(self, template_id, version):
+        """Compiled template for a template version, compiled on first use"""
+        key = (template_id, version)
+        compiled = self._compiled_templates.get(key)
+        if compiled is None:
+            template = self.get_template(template_id)
+            if template is None:
+                return None
+            compiled = compile_email(template)
+            self._compiled_templates.set(key, compiled)
+        return compiled
+
+    def preview_template(self, template_id, lead):
+        """
+        Preview a template rendered for a lead.
+        Memoized on the template version and the lead values the template uses,
+        so editing unrelated lead fields doesn't miss the cache.
+        """
+        version = self.template_version(template_id)
+        if version is None:
             return None
+        compiled = self._compiled_template(template_id, version)
+        if compiled is None:
+            return None
+        
+        values = self.template_variables(lead or {})
+        key = (template_id, version, tuple(values.get(variable) for variable in compiled.variables))
+        preview = self.preview_cache.get(key)
+        if preview is None:
+            rendered = compiled.render(values)
+            preview = {
+                'success': True,
+                'template_id': template_id,
+                'subject': rendered['subject'],
+                'content': rendered['content'],
+                'missing_variables': rendered['missing']
+            }
+            self.preview_cache.set(key, preview)
+        return dict(preview, missing_variables=list(preview['missing_variables']))
 
-    def send_email(self, to_email, subject, content):
+    def preview_many(self, template_id, leads):
         """
-        Send an email using SendGrid.
+        Preview a template for many leads, one result at a time.
+        Results flag leads whose preview still has unresolved placeholders.
+        
+        Args:
+            template_id (str): Template to render
+            leads: Iterable of (lead_id, lead) pairs; a lead of None means it wasn't found
+        
+        Yields:
+            dict: lead_id, email, subject, content, missing_variables and unresolved,
+            or lead_id and error
+        """
+        for lead_id, lead in leads:
+            if lead is None:
+                yield {'lead_id': lead_id, 'error': 'Lead not found'}
+                continue
+            preview = self.preview_template(template_id, lead)
+            if preview is None:
+                yield {'lead_id': lead_id, 'error': f"Template not found: {template_id}"}
+                continue
+            yield {
+                'lead_id': lead_id,
+                'email': lead.get('email'),
+                'subject': preview['subject'],
+                'content': preview['content'],
+                'missing_variables': preview['missing_variables'],
+                'unresolved': bool(preview['missing_variables'])
+            }
+
+    def send_email_to_lead(self, lead, template_id, campaign_id=None):
+        """
+        Render a template for a lead and send it.
+        With a campaign_id the lead is sent to at most once per campaign.
+        
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        if not lead.get('email'):
+            return False, "Lead has no email address"
+        rendered = self.render_template(template_id, lead)
+        if rendered is None:
+            return False, f"Template not found: {template_id}"
+        idempotency_key = None
+        if campaign_id is not None:
+            idempotency_key = self.ledger.key(campaign_id, lead.get('id') or lead['email'])
+        return self.send_email(lead['email'], rendered['subject'], rendered['content'],
+                               idempotency_key=idempotency_key)
+
+    def send_email(self, to_email, subject, content, idempotency_key=None):
+        """
+        Send an email through the configured transport (SendGrid or SMTP).
+        Rate limits (429), server errors and network failures are retried with
+        backoff; messages that still fail are kept as dead letters for replay.
         
         Args:
             to_email (str): Recipient's email address
             subject (str): Email subject
             content (str): Email content (plain text)
+            idempotency_key (str): Optional key, e.g. "<campaign>:<lead>"; a key
+                that was already sent is not sent again
             
         Returns:
             tuple: (success: bool, message: str)
         """
+        success, message, _ = self._send_once(to_email, subject, content, idempotency_key)
+        return success, message
+
+    def _send_once(self, to_email, subject, content, idempotency_key=None):
+        """
+        send_email, also telling whether the send was skipped because the key
+        was already sent or is held by another send.
+        
+        Returns:
+            tuple: (success: bool, message: str, skipped: bool)
+        """
+        if idempotency_key and not self.ledger.begin(idempotency_key):
+            if self.ledger.is_sent(idempotency_key):
+                print(f"Skipping {to_email}: already sent ({idempotency_key})")
+                return True, "Email already sent", True
+            return False, "Email send already in progress", True
+        
         try:
             print(f"Attempting to send email to {to_email}")
             print(f"Subject: {subject}")
             print(f"Content: {content}")
             
-            # Create message
-            message = Mail(
-                from_email=self.from_email,
-                to_emails=to_email,
-                subject=subject,
-                plain_text_content=content
-            )
-            
-            # Convert the Mail object to a SendGrid-formatted dictionary
-            message_dict = message.get()
-            
-            # Send email using the SendGrid client
-            response = self.sg.client.mail.send.post(request_body=message_dict)
-            
-            print(f"SendGrid Response Status Code: {response.status_code}")
-            print(f"SendGrid Response Headers: {response.headers}")
-            
-            if response.status_code in [200, 201, 202]:
-                print("Email sent successfully!")
-                return True, "Email sent successfully"
-            else:
-                error_msg = f"SendGrid error: Status {response.status_code}"
-                print(error_msg)
-                return False, error_msg
+            message = {'to': to_email, 'subject': subject, 'content': content}
             
+            # Send through the configured transport, retrying transient failures
+            result = send_with_retry(lambda: self.transport.send(message), self.retry_policy)
+        except Exception as e:
+            result = DeliveryResult(False, None, f"Failed to send email: {str(e)}", 1)
+        
+        if result.success:
+            print("Email sent successfully!")
+            if idempotency_key:
+                self.ledger.complete(idempotency_key)
+            return True, result.message, False
+        
+        print(f"Error details: {result.message} after {result.attempts} attempt(s)")
+        if idempotency_key:
+            self.ledger.release(idempotency_key)
+        self.ledger.dead_letter('email', {
+            'to_email': to_email,
+            'subject': subject,
+            'content': content,
+            'idempotency_key': idempotency_key
+        }, result, idempotency_key)
+        return False, result.message, False
+
+    def replay_dead_letters(self, ids=None, limit=100):
+        """
+        Send dead-lettered emails again.
+        Messages that fail again are dead-lettered anew.
+        
+        Returns:
+            list: One {id, email, success, message} result per replayed message
+        """
+        letters = self.ledger.dead_letters('email', ids=ids, limit=limit)
+        self.ledger.mark_replayed([letter['id'] for letter in letters])
+        results = []
+        for letter in letters:
+            payload = letter['payload']
+            success, message = self.send_email(payload['to_email'], payload['subject'], payload['content'],
+                                               idempotency_key=payload.get('idempotency_key'))
+            results.append({'id': letter['id'], 'email': payload['to_email'], 'success': success, 'message': message})
+        return results
+
+    def create_campaign(self, name, template_id, leads):
+        """
+        Create a campaign sending a template to the leads.
+        Recipients are processed in batches by process_campaigns().
+        
+        Returns:
+            str: Campaign ID
+        """
+        if not self.get_template(template_id):
+            raise ValueError(f"Template not found: {template_id}")
+        campaign_id = self.campaigns.create(name, template_id, leads)
+        print(f"Created campaign {campaign_id} ({name}) with {len(leads)} leads")
+        return campaign_id
+
+    def start_campaign(self, leads, template):
+        """Create a campaign for the leads with a template dict; returns its ID"""
+        name = f"{template.get('name', template['id'])} {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        return self.create_campaign(name, template['id'], leads)
+
+    def get_all_campaigns(self):
+        """All campaigns with their progress, newest first"""
+        return self.campaigns.all()
+
+    def process_campaigns(self, limit=None):
+        """
+        Send the next batch of pending recipients of active campaigns.
+        Each call only reads recipients past each campaign's cursor, so its cost
+        is bounded by the batch size (CAMPAIGN_BATCH_SIZE) rather than campaign size.
+        The batch is also bounded by what the sender's hourly and daily limits
+        allow, shared with the send queue; recipients beyond it wait for a later call.
+        
+        Returns:
+            dict: Recipients processed per campaign ID
+        """
+        compiled = {}
+        attempted = 0
+        
+        def send(campaign, lead):
+            nonlocal attempted
+            if not lead.get('email'):
+                return None, "Lead has no email address"
+            template_id = campaign['template_id']
+            if template_id not in compiled:
+                # Looked up once per tick; a missing template fails its recipients
+                template = self.get_template(template_id)
+                compiled[template_id] = compile_email(template) if template else None
+            if compiled[template_id] is None:
+                return False, f"Template not found: {template_id}"
+            rendered = compiled[template_id].render(self.template_variables(lead))
+            idempotency_key = self.ledger.key(campaign['id'], lead.get('id') or lead['email'])
+            success, message, skipped = self._send_once(lead['email'], rendered['subject'], rendered['content'],
+                                                        idempotency_key)
+            if skipped:
+                # Already sent, or being sent by another tick: nothing was sent here
+                return None, message
+            attempted += 1
+            return success, message
+        
+        if self.send_queue is None:
+            self.send_queue = SendQueue(self.transport.send_many, default_sender=self.from_email.email,
+                                        ledger=self.ledger)
+        budget, grant = self.send_queue.reserve(limit or self.campaigns.batch_size)
+        if not budget:
+            print("Send limits reached; campaigns resume when the hourly/daily window allows")
+            return {}
+        try:
+            processed = self.campaigns.tick(send, budget)
+        finally:
+            self.send_queue.settle(grant, attempted)
+        if processed:
+            print(f"Processed campaigns: {processed}")
+        return processed
+
+    @staticmethod
+    def _substitution_tag(variable):
+        """Substitution tag standing in for a variable in batched content"""
+        return f"-{variable}-"
+
+    def send_batch(self, items, campaign_id=None):
+        """
+        Send many (lead, template_id) pairs, grouping leads of the same template
+        into SendGrid personalizations.
+        With a campaign_id each lead is sent to at most once per campaign.
+        
+        Returns:
+            list: One result dict per item, in input order, with lead_id,
+            email, success and message
+        """
+        groups = {}
+        for index, (lead, template_id) in enumerate(items):
+            groups.setdefault(template_id, []).append((index, lead))
+        
+        results = [None] * len(items)
+        for template_id, members in groups.items():
+            group_results = self.send_template_batch(template_id, [lead for _, lead in members], campaign_id)
+            for (index, _), result in zip(members, group_results):
+                results[index] = result
+        return results
+
+    def _batch_key(self, campaign_id, lead):
+        """Idempotency key of a lead in a batch send, if it belongs to a campaign"""
+        if campaign_id is None:
+            return None
+        return self.ledger.key(campaign_id, lead.get('id') or lead['email'])
+
+    def send_template_batch(self, template_id, leads, campaign_id=None):
+        """
+        Send one template to many leads with as few requests as possible.
+        Each request carries up to MAX_PERSONALIZATIONS recipients, each with its
+        own substitutions, and failures are mapped back to individual leads.
+        Each lead's key is reserved in the ledger before it is sent, and leads
+        that still fail are kept as dead letters.
+        
+        Returns:
+            list: One result dict per lead, in input order, with lead_id,
+            email, success and message
+        """
+        results = [
+            {'lead_id': lead.get('id'), 'email': lead.get('email'), 'success': False, 'message': ''}
+            for lead in leads
+        ]
+        
+        template = self.get_template(template_id)
+        if not template:
+            for result in results:
+                result['message'] = f"Template not found: {template_id}"
+            return results
+        
+        compiled = compile_email(template)
+        if self.transport.name != 'sendgrid':
+            return self._send_rendered_batch(compiled, leads, results, campaign_id)
+        
+        # Subject and content with a substitution tag in place of every variable
+        tagged = compiled.render({variable: self._substitution_tag(variable) for variable in compiled.variables})
+        
+        personalizations = []
+        keys = {}
+        for index, lead in enumerate(leads):
+            if not lead.get('email'):
+                results[index]['message'] = "Lead has no email address"
+                continue
+            key = self._batch_key(campaign_id, lead)
+            if key and not self.ledger.begin(key):
+                sent = self.ledger.is_sent(key)
+                results[index].update(success=sent, skipped=True,
+                                      message="Email already sent" if sent else "Email send already in progress")
+                continue
+            keys[index] = key
+            values = self.template_variables(lead)
+            substitutions = {
+                self._substitution_tag(variable): str(values.get(variable) or compiled.placeholders[variable])
+                for variable in compiled.variables
+            }
+            personalizations.append((index, {
+                'to': [{'email': lead['email']}],
+                'substitutions': substitutions
+            }))
+        
+        for start in range(0, len(personalizations), MAX_PERSONALIZATIONS):
+            chunk = personalizations[start:start + MAX_PERSONALIZATIONS]
+            try:
+                self._send_personalizations(tagged['subject'], tagged['content'], chunk, results)
+            except Exception as e:
+                for index, _ in chunk:
+                    results[index]['message'] = f"Failed to send email: {str(e)}"
+        
+        for index, key in keys.items():
+            if results[index]['success']:
+                if key:
+                    self.ledger.complete(key)
+                continue
+            if key:
+                self.ledger.release(key)
+            rendered = compiled.render(self.template_variables(leads[index]))
+            self.ledger.dead_letter('email', {
+                'to_email': leads[index]['email'],
+                'subject': rendered['subject'],
+                'content': rendered['content'],
+                'idempotency_key': key
+            }, DeliveryResult(False, None, results[index]['message'], 1), key)
+        
+        sent = sum(1 for result in results if result['success'])
+        print(f"Batch send of {template_id}: {sent}/{len(leads)} sent")
+        return results
+
+    def _send_rendered_batch(self, compiled, leads, results, campaign_id=None):
+        """Render each lead and send over the transport's pooled connections, once per key"""
+        indexes, messages = [], []
+        for index, lead in enumerate(leads):
+            if not lead.get('email'):
+                results[index]['message'] = "Lead has no email address"
+                continue
+            rendered = compiled.render(self.template_variables(lead))
+            indexes.append(index)
+            messages.append({'to': lead['email'], 'subject': rendered['subject'], 'content': rendered['content'],
+                             'idempotency_key': self._batch_key(campaign_id, lead)})
+        
+        for index, outcome in zip(indexes, self.ledger.send_many(self.transport.send_many, messages)):
+            results[index].update(success=outcome['success'], message=outcome['message'])
+            if outcome.get('skipped'):
+                results[index]['skipped'] = True
+        sent = sum(1 for result in results if result['success'])
+        print(f"Batch send of {compiled.template_id}: {sent}/{len(leads)} sent")
+        return results
+
+    def _send_personalizations(self, subject, content, chunk, results, retry=True):
+        """
+        Send one mail/send request for a chunk of (lead index, personalization) pairs.
+        Transient failures are retried with backoff. If SendGrid rejects specific
+        personalizations, those leads are marked failed and the rest of the chunk
+        is retried once without them.
+        """
+        body = {
+            'from': {'email': self.from_email.email, 'name': self.from_email.name},
+            'subject': subject,
+            'content': [{'type': 'text/plain', 'value': content}],
+            'personalizations': [personalization for _, personalization in chunk]
+        }
+        
+        try:
+            result = send_with_retry(lambda: self.sg.client.mail.send.post(request_body=body), self.retry_policy)
         except Exception as e:
-            error_msg = f"Failed to send email: {str(e)}"
-            print(f"Error details: {error_msg}")
-            return False, error_msg
+            result = DeliveryResult(False, None, f"Failed to send email: {str(e)}", 1)
+        if result.success:
+            for index, _ in chunk:
+                results[index].update(success=True, message=result.message)
+            return
+        error = result.message
+        rejected = self._rejected_personalizations(result.body) if result.body else {}
+        
+        if rejected:
+            # Attribute the failure to the offending recipients only
+            remaining = []
+            for position, (index, personalization) in enumerate(chunk):
+                if position in rejected:
+                    results[index]['message'] = f"SendGrid rejected recipient: {rejected[position]}"
+                else:
+                    remaining.append((index, personalization))
+            if remaining and retry:
+                self._send_personalizations(subject, content, remaining, results, retry=False)
+                return
+            chunk = remaining
+        
+        for index, _ in chunk:
+            results[index]['message'] = error
+        print(f"Error sending batch of {len(chunk)}: {error}")
+
+    @staticmethod
+    def _rejected_personalizations(body):
+        """Map SendGrid error details to {personalization position: message}"""
+        try:
+            errors = json.loads(body).get('errors', [])
+        except (TypeError, ValueError, AttributeError):
+            return {}
+        rejected = {}
+        for error in errors:
+            match = _PERSONALIZATION_FIELD.match(error.get('field') or '')
+            if match:
+                rejected[int(match.group(1))] = error.get('message', 'invalid')
+        return rejected
 
     def send_direct_email(self, to_email, subject, content, from_email=None, from_name=None):
+        """
+        Send one email right away through the configured transport (SendGrid or SMTP),
+        without retries, idempotency key or dead letter.
+        
+        Args:
+            from_email: Sender address or Email, defaults to the configured sender
+            from_name: Sender name, defaults to the configured sender's
+        
+        Returns:
+            tuple: (success: bool, message: str)
+        """
+        if isinstance(from_email, Email):
+            from_name = from_name or from_email.name
+            from_email = from_email.email
         try:
-            message = Mail(
-                from_email=from_email or self.from_email,
-                to_emails=to_email,
-                subject=subject,
-                plain_text_content=content
-            )
-            
-            response = self.sg.client.mail.send.post(request_body=message.get())
-            return response.status_code in [200, 201, 202], "Email sent successfully"
+            self.transport.send({
+                'to': to_email,
+                'subject': subject,
+                'content': content,
+                'from_email': from_email,
+                'from_name': from_name
+            })
+            return True, "Email sent successfully"
         except Exception as e:
             return False, str(e)
 
@@ -198,9 +675,8 @@ async def discover_businesses():
     if not region or not industry:
         return jsonify({'error': 'Location and business type are required'}), 400
 
-    engine = BusinessDiscoveryEngine()
     try:
-        businesses = await engine.discover_businesses(region, industry, keywords)
+        businesses = await shared_discovery_engine().discover_businesses(region, industry, keywords)
         return jsonify({
             'success': True,
             'businesses': [vars(b) for b in businesses],
@@ -11,9 +11,19 @@ import requests
 from bs4 import BeautifulSoup
 import yfinance as yf
 from dotenv import load_dotenv
+from business_classifier import KeywordClassifier
 
 load_dotenv()
 
+# Chat intents and their trigger phrases, compiled once into a single matcher
+CHAT_INTENTS = {
+    'analyze': ['analyze', 'review', 'check', 'look at'],
+    'template': ['template', 'email', 'message', 'write'],
+    'insights': ['insights', 'trends', 'data', 'performance'],
+    'help': ['help', 'how to', 'what is', 'explain']
+}
+intent_classifier = KeywordClassifier(CHAT_INTENTS)
+
 class EnhancedAIAgent:
     def __init__(self):
         self.openai_key = os.getenv('OPENAI_API_KEY')
@@ -335,18 +345,7 @@ class EnhancedAIAgent:
 
     def _analyze_intent(self, message):
         """Analyze user message intent"""
-        intents = {
-            'analyze': ['analyze', 'review', 'check', 'look at'],
-            'template': ['template', 'email', 'message', 'write'],
-            'insights': ['insights', 'trends', 'data', 'performance'],
-            'help': ['help', 'how to', 'what is', 'explain']
-        }
-        
-        message = message.lower()
-        for intent, keywords in intents.items():
-            if any(keyword in message for keyword in keywords):
-                return intent
-        return 'general'
+        return intent_classifier.first_category(message.lower()) or 'general'
 
     def _get_relevant_context(self, intent):
         """Get relevant context based on intent"""
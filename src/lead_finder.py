@@ -1,11 +1,48 @@
-import json
+import atexit
+import base64
 import os
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from datetime import datetime
+from email_validator import validate_email, EmailNotValidError
+from lead_store import LeadStore
+from cache_store import PersistentTTLCache
+from business_classifier import BUSINESS_CATEGORIES, business_type_classifier
+from dedup_index import DedupIndex
+from lead_io import parse_records, serialize_leads
 
 load_dotenv()
 
+# Pipeline stages a lead can be in, as offered by the dashboard
+LEAD_STATUSES = ('new', 'contacted', 'interested', 'negotiating', 'converted', 'lost')
+
+# One store per database file for the whole process, so every LeadFinder on
+# that file shares a single compaction thread and exit hook
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _shared_store(db_file, leads_file, compact_interval):
+    """The process-wide LeadStore for db_file, opened and compacting on first use"""
+    key = os.path.abspath(db_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = LeadStore(db_file)
+            # Import leads.json on first start
+            if store.is_empty():
+                imported = store.import_json(leads_file)
+                if imported:
+                    print(f"Imported {imported} leads from {leads_file}")
+            # Keep leads.json as a periodically compacted snapshot of the store
+            store.start_compaction(leads_file, compact_interval)
+            atexit.register(store.stop_compaction, leads_file)
+            _stores[key] = store
+        return store
+
 class LeadFinder:
     def __init__(self):
         self.google_api_key = os.getenv('GOOGLE_PLACES_API_KEY')
@@ -14,53 +51,98 @@ class LeadFinder:
         self.target_location = os.getenv('TARGET_LOCATION', 'Atlanta, GA')
         self.search_radius = int(os.getenv('SEARCH_RADIUS_METERS', 10000))
         
-        # Define business categories and their keywords
-        self.business_categories = {
-            'restaurant': ['restaurant', 'cafe', 'diner', 'bistro', 'eatery', 'food'],
-            'retail': ['retail', 'store', 'shop', 'boutique', 'market'],
-            'salon': ['salon', 'spa', 'beauty', 'hair', 'nails', 'barber'],
-            'gym': ['gym', 'fitness', 'workout', 'training', 'yoga', 'crossfit'],
-            'automotive': ['auto', 'car', 'mechanic', 'repair', 'service', 'tire'],
-            'professional': ['lawyer', 'accountant', 'consultant', 'insurance', 'real estate', 'professional']
+        # Concurrent search settings: total worker threads and per-provider in-flight caps
+        self.concurrent_search = os.getenv('LEAD_SEARCH_CONCURRENT', 'True').lower() == 'true'
+        self.search_workers = int(os.getenv('LEAD_SEARCH_WORKERS', 8))
+        self.provider_limits = {
+            'google': int(os.getenv('GOOGLE_MAX_CONCURRENCY', 4)),
+            'yelp': int(os.getenv('YELP_MAX_CONCURRENCY', 2))
+        }
+        self._provider_slots = {
+            provider: threading.BoundedSemaphore(limit)
+            for provider, limit in self.provider_limits.items()
+        }
+        self.sessions = {
+            provider: self._create_session(limit)
+            for provider, limit in self.provider_limits.items()
         }
         
+        # Business categories and their keywords, with the shared precompiled matcher
+        self.business_categories = BUSINESS_CATEGORIES
+        self.classifier = business_type_classifier
+        
         self.leads_file = os.getenv('LEADS_FILE', 'data/leads.json')
+        self.leads_db_file = os.getenv('LEADS_DB_FILE', 'data/leads.db')
+        self.compact_interval = float(os.getenv('LEADS_COMPACT_INTERVAL_SECONDS', 60))
         
         # Create data directory if it doesn't exist
         os.makedirs(os.path.dirname(self.leads_file), exist_ok=True)
+        os.makedirs(os.path.dirname(self.leads_db_file), exist_ok=True)
+        
+        # Open the indexed lead store shared by every LeadFinder on this file
+        self.store = _shared_store(self.leads_db_file, self.leads_file, self.compact_interval)
+        
+        # Persistent fuzzy dedup index of every business already evaluated,
+        # seeded from the stored leads on first use
+        self.dedup_index_file = os.getenv('DEDUP_INDEX_FILE', 'data/dedup_index.db')
+        os.makedirs(os.path.dirname(self.dedup_index_file), exist_ok=True)
+        self.dedup_index = DedupIndex(self.dedup_index_file)
+        if self.dedup_index.is_empty():
+            for lead in self.store.all():
+                self.dedup_index.add(lead, ref=str(lead['id']))
         
-        # Load existing leads
-        self.leads = self._load_leads()
+        # Persistent cache of Place Details website lookups, keyed by place_id
+        self.cache_file = os.getenv('CACHE_FILE', 'data/cache.db')
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        self.place_cache = PersistentTTLCache(
+            self.cache_file,
+            'place_websites',
+            ttl=float(os.getenv('PLACE_DETAILS_CACHE_TTL_SECONDS', 7 * 24 * 3600))
+        )
+        # Failed lookups are retried within the batch, then cached briefly so a
+        # flaky API isn't asked again on every check
+        self.place_details_retries = int(os.getenv('PLACE_DETAILS_RETRIES', 2))
+        self.place_failure_ttl = float(os.getenv('PLACE_DETAILS_FAILURE_TTL_SECONDS', 300))
+
+    @staticmethod
+    def _business_text(business):
+        """Combine all available business information into one string"""
+        categories = business.get('categories')
+        if not isinstance(categories, list):
+            categories = []
+        return ' '.join([
+            business.get('name', '').lower(),
+            ' '.join(business.get('types', [])),
+            business.get('description', ''),
+            # Yelp categories are {'alias', 'title'} objects
+            ' '.join(c.get('title', '') if isinstance(c, dict) else c for c in categories)
+        ])
 
     def _detect_business_type(self, business):
         """
         Detect business type based on place types, categories, and name
         Returns tuple of (primary_type, confidence_score)
         """
-        # Combine all available business information
-        business_info = ' '.join([
-            business.get('name', '').lower(),
-            ' '.join(business.get('types', [])),
-            business.get('description', ''),
-            ' '.join(business.get('categories', []) if isinstance(business.get('categories'), list) else [])
-        ])
+        return self.classifier.classify(self._business_text(business))
 
-        # Score each category
-        scores = {}
-        for category, keywords in self.business_categories.items():
-            score = 0
-            for keyword in keywords:
-                if keyword.lower() in business_info:
-                    score += 1
-            scores[category] = score / len(keywords)  # Normalize score
+    def _detect_business_types(self, businesses):
+        """Detect business types for a batch of raw provider records in one pass"""
+        return self.classifier.classify_many([self._business_text(business) for business in businesses])
 
-        # Get the highest scoring category
-        if scores:
-            best_category = max(scores.items(), key=lambda x: x[1])
-            if best_category[1] > 0:  # If we have any matches
-                return best_category
-        
-        return ('professional', 0.1)  # Default to professional if no clear match
+    def close(self):
+        """Release this finder's HTTP sessions and database connections; the shared lead store stays open"""
+        for session in self.sessions.values():
+            session.close()
+        self.dedup_index.close()
+        self.place_cache.close()
+
+    @staticmethod
+    def _create_session(pool_size):
+        """Create a requests session with a connection pool sized for the provider"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        return session
 
     def _search_google_places(self, business_type):
         """Search for businesses using Google Places API"""
@@ -72,7 +154,8 @@ class LeadFinder:
         }
         
         try:
-            response = requests.get(url, params=params)
+            with self._provider_slots['google']:
+                response = self.sessions['google'].get(url, params=params)
             response.raise_for_status()
             return response.json().get('results', [])
         except Exception as e:
@@ -90,139 +173,371 @@ class LeadFinder:
         }
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            with self._provider_slots['yelp']:
+                response = self.sessions['yelp'].get(url, headers=headers, params=params)
             response.raise_for_status()
             return response.json().get('businesses', [])
         except Exception as e:
             print(f"Error searching Yelp: {e}")
             return []
 
-    def _has_website(self, business):
-        """Check if a business has a website"""
+    def _fetch_place_website(self, place_id):
+        """
+        Look up a place's website with the Place Details API.
+        Returns the website ('' if it has none), or None if the lookup failed.
+        """
+        try:
+            url = 'https://maps.googleapis.com/maps/api/place/details/json'
+            params = {
+                'place_id': place_id,
+                'fields': 'website',
+                'key': self.google_api_key
+            }
+            with self._provider_slots['google']:
+                response = self.sessions['google'].get(url, params=params)
+            response.raise_for_status()
+            return response.json().get('result', {}).get('website') or ''
+        except Exception as e:
+            print(f"Error checking website: {e}")
+            return None
+
+    def _resolve_websites(self, place_ids):
+        """
+        Resolve websites for many place IDs at once.
+        Cached IDs cost nothing; the rest are fetched concurrently and cached.
+        Failed lookups are retried concurrently, then cached as failed for a short TTL.
+        Returns a dict of place_id -> website ('' if none, None if the lookup failed).
+        """
+        place_ids = list(dict.fromkeys(place_ids))
+        websites = self.place_cache.get_many(place_ids)
+        pending = [place_id for place_id in place_ids if place_id not in websites]
+        
+        if pending:
+            fetched = {}
+            with ThreadPoolExecutor(max_workers=self.provider_limits['google']) as pool:
+                for _ in range(1 + self.place_details_retries):
+                    results = dict(zip(pending, pool.map(self._fetch_place_website, pending)))
+                    fetched.update((place_id, website) for place_id, website in results.items() if website is not None)
+                    pending = [place_id for place_id, website in results.items() if website is None]
+                    if not pending:
+                        break
+            self.place_cache.set_many(fetched)
+            failed = dict.fromkeys(pending)
+            if failed:
+                self.place_cache.set_many(failed, ttl=self.place_failure_ttl)
+            websites.update(fetched)
+            websites.update(failed)
+        
+        return websites
+
+    def _has_website(self, business, websites=None):
+        """
+        Check if a business has a website.
+        `websites` is an optional place_id -> website map from _resolve_websites.
+        """
         # Check Google Places details
         if business.get('website'):
             return True
             
-        # Additional check using Place Details API
-        if business.get('place_id'):
-            try:
-                url = 'https://maps.googleapis.com/maps/api/place/details/json'
-                params = {
-                    'place_id': business['place_id'],
-                    'fields': 'website',
-                    'key': self.google_api_key
-                }
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                result = response.json().get('result', {})
-                if result.get('website'):
-                    return True
-            except Exception as e:
-                print(f"Error checking website: {e}")
+        # Additional check using (cached) Place Details API
+        place_id = business.get('place_id')
+        if place_id:
+            if websites is None or place_id not in websites:
+                websites = self._resolve_websites([place_id])
+            return bool(websites.get(place_id))
         
         return False
 
-    def find_leads(self):
+    def _search_all_categories(self, concurrent):
+        """
+        Search Google Places and Yelp for every business category.
+        Returns one combined result list per category, in category order.
+        """
+        categories = list(self.business_categories.keys())
+        
+        if not concurrent:
+            results = []
+            for category in categories:
+                print(f"Searching for {category} businesses...")
+                results.append(self._search_google_places(category) + self._search_yelp(category))
+            return results
+        
+        # Fan out every (provider, category) search at once; per-provider
+        # semaphores keep each API under its own concurrency cap
+        print(f"Searching {len(categories)} categories concurrently...")
+        with ThreadPoolExecutor(max_workers=self.search_workers) as pool:
+            google = [pool.submit(self._search_google_places, category) for category in categories]
+            yelp = [pool.submit(self._search_yelp, category) for category in categories]
+            return [g.result() + y.result() for g, y in zip(google, yelp)]
+
+    def find_leads(self, concurrent=None):
         """Find new leads without websites"""
+        if concurrent is None:
+            concurrent = self.concurrent_search
+        
         new_leads = []
-        processed_names = set()  # To avoid duplicates
         
-        # Search for each business type
-        for category in self.business_categories.keys():
-            print(f"Searching for {category} businesses...")
-            
-            # Search both Google Places and Yelp
-            businesses = self._search_google_places(category) + self._search_yelp(category)
-            
+        # Search both Google Places and Yelp for each business type, dropping
+        # cross-provider and previously stored duplicates before any enrichment.
+        # The persistent index is only read here; businesses are added to it once
+        # their lead has been stored, so nothing is suppressed by an unfinished run
+        candidates = []
+        duplicates = 0
+        run_index = DedupIndex()
+        for businesses in self._search_all_categories(concurrent):
             for business in businesses:
-                name = business.get('name')
-                if not name or name in processed_names:
+                if not business.get('name'):
                     continue
-                    
-                processed_names.add(name)
-                
-                if not self._has_website(business):
-                    # Detect business type
-                    detected_type, confidence = self._detect_business_type(business)
-                    
-                    lead = {
-                        'id': len(self.leads) + len(new_leads) + 1,
-                        'name': name,
-                        'detected_type': detected_type,
-                        'type_confidence': confidence,
-                        'address': business.get('formatted_address') or business.get('location', {}).get('address1', ''),
-                        'phone': business.get('formatted_phone_number') or business.get('phone', ''),
-                        'found_date': datetime.now().isoformat(),
-                        'status': 'new'
-                    }
-                    
-                    new_leads.append(lead)
-        
-        # Add new leads and save
-        self.leads.extend(new_leads)
-        self._save_leads()
+                if not self.dedup_index.find_duplicate(business) and run_index.check_and_add(business):
+                    candidates.append(business)
+                else:
+                    duplicates += 1
+        run_index.close()
+        
+        if duplicates:
+            print(f"Skipped {duplicates} duplicate businesses")
+        
+        # Resolve missing websites in one cached, concurrent batch
+        websites = self._resolve_websites(
+            business['place_id'] for business in candidates
+            if business.get('place_id') and not business.get('website')
+        )
+        
+        # Classify only the businesses that will become leads
+        no_website = [business for business in candidates if not self._has_website(business, websites)]
+        
+        sources = []
+        for business, (detected_type, confidence) in zip(no_website, self._detect_business_types(no_website)):
+            lead = {
+                'name': business['name'],
+                'detected_type': detected_type,
+                'type_confidence': confidence,
+                'address': business.get('formatted_address') or business.get('location', {}).get('address1', ''),
+                'phone': business.get('formatted_phone_number') or business.get('phone', ''),
+                'found_date': datetime.now().isoformat(),
+                'status': 'new'
+            }
+            
+            new_leads.append(lead)
+            sources.append(business)
+        
+        # Add new leads under IDs allocated by the store, then remember their
+        # businesses for later runs
+        self.store.insert_new(new_leads)
+        for lead, business in zip(new_leads, sources):
+            self.dedup_index.add(business, ref=lead['id'])
         
         return new_leads
 
-    def _load_leads(self):
-        """Load existing leads from file"""
+    def _save_leads(self):
+        """Flush pending mutations and write the leads.json snapshot now"""
+        self.store.compact(self.leads_file)
+
+    @staticmethod
+    def validate_lead_input(data):
+        """Check a manually entered or imported lead; returns an error message or None"""
+        if not isinstance(data, dict):
+            return 'Lead must be an object'
+        if not data.get('name') or not data.get('email'):
+            return 'Name and email are required'
+        for field in ('name', 'email', 'phone', 'address', 'type', 'status'):
+            if data.get(field) is not None and not isinstance(data[field], str):
+                return f"Invalid {field} {data[field]!r}: must be a string"
         try:
-            with open(self.leads_file, 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+            validate_email(data['email'], check_deliverability=False)
+        except EmailNotValidError as e:
+            return f"Invalid email {data['email']}: {e}"
+        return None
 
-    def _save_leads(self):
-        """Save leads to file"""
-        with open(self.leads_file, 'w') as f:
-            json.dump(self.leads, f, indent=2)
+    @staticmethod
+    def build_lead(data, source='manual'):
+        """Create a lead record from validated input; the store assigns its ID"""
+        lead = {
+            'name': data['name'],
+            'email': data['email'],
+            'type': data.get('type', 'other'),
+            'status': 'new',
+            'found_date': datetime.now().isoformat(),
+            'source': source
+        }
+        for field in ('phone', 'address'):
+            if data.get(field):
+                lead[field] = data[field]
+        return lead
+
+    def add_lead(self, lead):
+        """Add a single lead under a new ID; returns the stored lead"""
+        self.store.insert_new([lead])
+        self.dedup_index.add(lead, ref=lead['id'])
+        return lead
+
+    def import_leads(self, lines, fmt='ndjson', chunk_size=1000, max_errors=100):
+        """
+        Bulk import leads from an iterable of NDJSON or CSV lines.
+        Records are validated with the same checks as manual entry, leads whose
+        email is already stored are skipped, and valid leads are inserted one
+        chunk per transaction, so memory stays bounded by chunk_size.
+        Returns dict with imported/skipped/failed counts and the first errors.
+        """
+        result = {'imported': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+        chunk = []
+        chunk_lines = []
+        chunk_emails = set()
+        
+        def add_error(line_number, error):
+            result['failed'] += 1
+            if len(result['errors']) < max_errors:
+                result['errors'].append({'line': line_number, 'error': error})
+        
+        def flush():
+            # Emails are checked again inside the insert, so a lead stored by
+            # another writer since it was parsed is reported instead of duplicated
+            inserted = {id(lead) for lead in self.store.insert_new(chunk, skip_existing_emails=True)}
+            for line_number, lead in zip(chunk_lines, chunk):
+                if id(lead) in inserted:
+                    self.dedup_index.add(lead, ref=lead['id'])
+                    result['imported'] += 1
+                else:
+                    add_error(line_number, f"Email {lead['email']} was stored by another writer during the import")
+            chunk.clear()
+            chunk_lines.clear()
+            chunk_emails.clear()
+        
+        for line_number, record, error in parse_records(lines, fmt):
+            if not error:
+                try:
+                    error = self.validate_lead_input(record)
+                except Exception as e:
+                    error = f"Invalid record: {e}"
+            if error:
+                add_error(line_number, error)
+                continue
+            
+            email = record['email'].lower()
+            if email in chunk_emails or self.store.get_by_email(email):
+                result['skipped'] += 1
+                continue
+            
+            lead = self.build_lead(record, source='import')
+            if record.get('status'):
+                lead['status'] = record['status']
+            chunk.append(lead)
+            chunk_lines.append(line_number)
+            chunk_emails.add(email)
+            
+            if len(chunk) >= chunk_size:
+                flush()
+        
+        if chunk:
+            flush()
+        return result
+
+    def iter_leads(self, status=None, business_type=None, batch_size=1000):
+        """Iterate over leads one page at a time, without loading them all"""
+        cursor = None
+        while True:
+            page = self.get_leads_page(cursor, batch_size, status, business_type)
+            yield from page['leads']
+            cursor = page['next_cursor']
+            if not cursor:
+                return
+
+    def export_leads(self, fmt='ndjson', status=None, business_type=None, fields=None):
+        """Stream leads as NDJSON or CSV text chunks"""
+        leads = self.iter_leads(status, business_type)
+        if fields and fmt == 'ndjson':
+            leads = (self._project_lead(lead, fields) for lead in leads)
+        return serialize_leads(leads, fmt, fields)
 
     def get_all_leads(self):
         """Get all leads"""
-        return self.leads
+        return self.store.all()
+
+    def get_leads_page(self, cursor=None, limit=50, status=None, business_type=None, fields=None):
+        """
+        Get one page of leads.
+        `cursor` is the opaque next_cursor of the previous page, a `limit` of None
+        returns every matching lead, and `fields` optionally limits each lead to
+        the given keys (the id is always kept).
+        Returns dict with 'leads' and 'next_cursor' (None on the last page).
+        """
+        after_seq = 0
+        if cursor:
+            try:
+                after_seq = int(base64.urlsafe_b64decode(cursor.encode()).decode())
+            except (ValueError, UnicodeDecodeError):
+                raise ValueError(f"Invalid cursor: {cursor}")
+        
+        leads, last_seq = self.store.page(after_seq, limit, status, business_type)
+        if fields:
+            leads = [self._project_lead(lead, fields) for lead in leads]
+        
+        next_cursor = None
+        if last_seq is not None:
+            next_cursor = base64.urlsafe_b64encode(str(last_seq).encode()).decode()
+        return {'leads': leads, 'next_cursor': next_cursor}
+
+    @staticmethod
+    def _project_lead(lead, fields):
+        """Keep only the requested fields of a lead"""
+        projected = {'id': lead['id']}
+        for field in fields:
+            if field in lead:
+                projected[field] = lead[field]
+        return projected
+
+    def leads_version(self):
+        """Version number that changes whenever any lead changes"""
+        return self.store.version()
+
+    def get_lead_stats(self):
+        """Lead totals per status and per detected type, in constant time"""
+        return self.store.counts()
 
     def get_lead(self, lead_id):
         """Get a specific lead by ID"""
-        for lead in self.leads:
-            if str(lead['id']) == str(lead_id):
-                return lead
-        return None
+        return self.store.get(lead_id)
+
+    def get_leads(self, lead_ids):
+        """Get leads by ID, in the given order; missing IDs map to None"""
+        found = self.store.get_many(lead_ids)
+        return [(lead_id, found.get(str(lead_id))) for lead_id in lead_ids]
+
+    def get_lead_by_email(self, email):
+        """Get a specific lead by email address"""
+        return self.store.get_by_email(email)
 
     def update_lead_status(self, lead_id, status):
         """Update the status of a lead"""
-        for lead in self.leads:
-            if lead['id'] == lead_id:
-                lead['status'] = status
-                self._save_leads()
-                return True
-        return False
+        return self.store.update_status(lead_id, status)
+
+    def update_statuses(self, lead_ids, status):
+        """
+        Update the status of many leads with a single transaction and write.
+        Returns the list of IDs that were updated; unknown IDs are ignored.
+        """
+        return self.store.update_statuses(lead_ids, status)
 
     def get_leads_by_status(self, status):
         """Get leads by status"""
-        return [lead for lead in self.leads if lead['status'] == status]
+        return self.store.by_status(status)
+
+    def get_leads_by_type(self, business_type):
+        """Get leads by detected business type"""
+        return self.store.by_type(business_type)
 
     def get_active_leads(self):
         """Get all leads that haven't been contacted yet"""
-        try:
-            with open(self.leads_file, 'r') as f:
-                leads = json.load(f)
-                return [lead for lead in leads if not lead.get('contacted', False)]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        return [lead for lead in self.store.all() if not lead.get('contacted', False)]
 
     def delete_lead(self, lead_id):
         """Delete a lead by ID."""
         try:
-            # Find the lead
-            lead_index = next((i for i, lead in enumerate(self.leads) if lead['id'] == lead_id), -1)
-            
-            if lead_index >= 0:
-                # Remove the lead
-                self.leads.pop(lead_index)
-                # Save changes
-                self._save_leads()
-                return True
-            return False
+            deleted = self.store.delete(lead_id)
+            if deleted:
+                # A deleted lead's business may be found again
+                self.dedup_index.remove(str(lead_id))
+            return deleted
             
         except Exception as e:
             print(f"Error deleting lead: {e}")
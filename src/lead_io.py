@@ -0,0 +1,117 @@
+"""
+Lead Import/Export Module
+Streaming NDJSON and CSV parsing and serialization for bulk lead transfers.
+
+Usage:
+    python lead_io.py import leads.csv
+    python lead_io.py export --format ndjson --status new -o leads.ndjson
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+FORMATS = ('ndjson', 'csv')
+
+# Columns written by CSV export when no fields are requested
+DEFAULT_CSV_FIELDS = ['id', 'name', 'business_name', 'email', 'phone', 'address',
+                      'type', 'detected_type', 'status', 'source', 'found_date']
+
+
+def detect_format(filename: str, default: str = 'ndjson') -> str:
+    """Guess the format from a file name"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return default
+
+
+def parse_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """
+    Parse records one line at a time.
+    Yields (line_number, record, error); exactly one of record and error is set.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            # Drop empty cells so optional fields fall back to their defaults
+            yield reader.line_num, {k: v for k, v in record.items() if k and v not in (None, '')}, None
+        return
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, 'Expected a JSON object'
+            continue
+        yield line_number, record, None
+
+
+def serialize_leads(leads: Iterable[Dict], fmt: str, fields: Optional[List[str]] = None) -> Iterator[str]:
+    """Serialize leads one row at a time"""
+    if fmt == 'csv':
+        fields = fields or DEFAULT_CSV_FIELDS
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for lead in leads:
+            writer.writerow(lead)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+        return
+
+    for lead in leads:
+        yield json.dumps(lead) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk lead import/export')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Import leads from an NDJSON or CSV file')
+    import_parser.add_argument('file', help="Input file, or '-' for stdin")
+    import_parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+
+    export_parser = subparsers.add_parser('export', help='Export leads as NDJSON or CSV')
+    export_parser.add_argument('--format', choices=FORMATS, default='ndjson')
+    export_parser.add_argument('--status', help='Only export leads with this status')
+    export_parser.add_argument('--type', dest='business_type', help='Only export leads of this type')
+    export_parser.add_argument('--fields', help='Comma-separated fields to export')
+    export_parser.add_argument('-o', '--output', default='-', help="Output file, or '-' for stdout")
+
+    args = parser.parse_args()
+
+    # Imported here so `--help` works without the app's environment
+    from lead_finder import LeadFinder
+    lead_finder = LeadFinder()
+
+    if args.command == 'import':
+        fmt = args.format or detect_format(args.file)
+        stream = sys.stdin if args.file == '-' else open(args.file, 'r', newline='', encoding='utf-8')
+        with stream:
+            result = lead_finder.import_leads(stream, fmt)
+        print(json.dumps(result, indent=2), file=sys.stderr)
+    else:
+        fields = [f for f in (args.fields or '').split(',') if f] or None
+        stream = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+        with stream:
+            for chunk in lead_finder.export_leads(args.format, args.status, args.business_type, fields):
+                stream.write(chunk)
+
+
+if __name__ == '__main__':
+    main()
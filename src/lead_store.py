@@ -0,0 +1,397 @@
+"""
+Lead Store Module
+SQLite-backed lead storage with primary-key, email, status and type indexes.
+Mutations are appended to the write-ahead log and compacted in the background.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class LeadStore:
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        # WAL mode: each commit appends only its own pages to the journal
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+        self._compacted_version = None
+        self._compaction_thread = None
+        self._stop_compaction = threading.Event()
+
+    def _create_schema(self):
+        """Create the leads table and its lookup indexes"""
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS leads (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    id TEXT NOT NULL UNIQUE,
+                    email TEXT,
+                    status TEXT,
+                    type TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_leads_email ON leads(email);
+                CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status);
+                CREATE INDEX IF NOT EXISTS idx_leads_type ON leads(type);
+                CREATE INDEX IF NOT EXISTS idx_leads_numeric_id ON leads(CAST(id AS INTEGER));
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+                -- Materialized counts per status and type, kept current by triggers
+                CREATE TABLE IF NOT EXISTS lead_counts (
+                    dimension TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (dimension, value)
+                );
+                CREATE TRIGGER IF NOT EXISTS leads_count_insert AFTER INSERT ON leads BEGIN
+                    INSERT OR IGNORE INTO lead_counts VALUES ('total', '', 0);
+                    INSERT OR IGNORE INTO lead_counts VALUES ('status', COALESCE(NEW.status, ''), 0);
+                    INSERT OR IGNORE INTO lead_counts VALUES ('type', COALESCE(NEW.type, ''), 0);
+                    UPDATE lead_counts SET count = count + 1 WHERE
+                        (dimension = 'total') OR
+                        (dimension = 'status' AND value = COALESCE(NEW.status, '')) OR
+                        (dimension = 'type' AND value = COALESCE(NEW.type, ''));
+                END;
+                CREATE TRIGGER IF NOT EXISTS leads_count_delete AFTER DELETE ON leads BEGIN
+                    UPDATE lead_counts SET count = count - 1 WHERE
+                        (dimension = 'total') OR
+                        (dimension = 'status' AND value = COALESCE(OLD.status, '')) OR
+                        (dimension = 'type' AND value = COALESCE(OLD.type, ''));
+                END;
+                CREATE TRIGGER IF NOT EXISTS leads_count_update AFTER UPDATE OF status, type ON leads BEGIN
+                    INSERT OR IGNORE INTO lead_counts VALUES ('status', COALESCE(NEW.status, ''), 0);
+                    INSERT OR IGNORE INTO lead_counts VALUES ('type', COALESCE(NEW.type, ''), 0);
+                    UPDATE lead_counts SET count = count - 1 WHERE
+                        (dimension = 'status' AND value = COALESCE(OLD.status, '')) OR
+                        (dimension = 'type' AND value = COALESCE(OLD.type, ''));
+                    UPDATE lead_counts SET count = count + 1 WHERE
+                        (dimension = 'status' AND value = COALESCE(NEW.status, '')) OR
+                        (dimension = 'type' AND value = COALESCE(NEW.type, ''));
+                END;
+            """)
+            # Stores created before the counters existed need a one-off backfill
+            if self._conn.execute('SELECT 1 FROM lead_counts LIMIT 1').fetchone() is None:
+                self._rebuild_counts()
+
+    def _rebuild_counts(self):
+        """Recompute lead_counts from scratch; caller holds the lock and transaction"""
+        self._conn.executescript("""
+            DELETE FROM lead_counts;
+            INSERT INTO lead_counts SELECT 'total', '', COUNT(*) FROM leads;
+            INSERT INTO lead_counts SELECT 'status', COALESCE(status, ''), COUNT(*) FROM leads GROUP BY 1, 2;
+            INSERT INTO lead_counts SELECT 'type', COALESCE(type, ''), COUNT(*) FROM leads GROUP BY 1, 2;
+        """)
+
+    def counts(self) -> Dict:
+        """Lead totals per status and per type, read from the materialized counters"""
+        stats = {'total': 0, 'by_status': {}, 'by_type': {}}
+        with self._lock:
+            rows = self._conn.execute('SELECT dimension, value, count FROM lead_counts WHERE count > 0').fetchall()
+        for dimension, value, count in rows:
+            if dimension == 'total':
+                stats['total'] = count
+            else:
+                stats[f"by_{dimension}"][value or 'unknown'] = count
+        return stats
+
+    def _bump_version(self):
+        """Record a mutation; must run inside the mutating transaction"""
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def version(self) -> int:
+        """Monotonic counter incremented by every mutation"""
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    @staticmethod
+    def _row_values(lead: Dict) -> tuple:
+        """Extract the indexed columns for a lead"""
+        email = lead.get('email')
+        return (
+            str(lead['id']),
+            email.lower() if email else None,
+            lead.get('status'),
+            lead.get('detected_type') or lead.get('type'),
+            json.dumps(lead)
+        )
+
+    def count(self) -> int:
+        """Number of stored leads"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM leads').fetchone()[0]
+
+    def is_empty(self) -> bool:
+        """Check whether the store holds no leads"""
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM leads LIMIT 1').fetchone() is None
+
+    def _next_id(self) -> int:
+        row = self._conn.execute('SELECT MAX(CAST(id AS INTEGER)) FROM leads').fetchone()
+        return (row[0] or 0) + 1
+
+    def next_id(self) -> int:
+        """Next free numeric lead ID; only a hint, since another writer may take it first"""
+        with self._lock:
+            return self._next_id()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that holds the database lock from the start, across processes"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def get(self, lead_id) -> Optional[Dict]:
+        """Get a lead by ID"""
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM leads WHERE id = ?', (str(lead_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, lead_ids: Iterable, chunk_size: int = 500) -> Dict[str, Dict]:
+        """Get leads by ID in a few IN queries; returns {id: lead} for the IDs that exist"""
+        ids = list(dict.fromkeys(str(lead_id) for lead_id in lead_ids))
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM leads WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                found.update((lead_id, json.loads(data)) for lead_id, data in rows)
+        return found
+
+    def get_by_email(self, email: str) -> Optional[Dict]:
+        """Get a lead by email address"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT data FROM leads WHERE email = ? ORDER BY seq LIMIT 1', (email.lower(),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def all(self) -> List[Dict]:
+        """Get all leads in insertion order"""
+        with self._lock:
+            rows = self._conn.execute('SELECT data FROM leads ORDER BY seq').fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def by_status(self, status: str) -> List[Dict]:
+        """Get leads with the given status"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT data FROM leads WHERE status = ? ORDER BY seq', (status,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def by_type(self, business_type: str) -> List[Dict]:
+        """Get leads with the given business type"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT data FROM leads WHERE type = ? ORDER BY seq', (business_type,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def page(self, after_seq: int = 0, limit: Optional[int] = 50, status: Optional[str] = None,
+             business_type: Optional[str] = None) -> Tuple[List[Dict], Optional[int]]:
+        """
+        Get one page of leads in insertion order, starting after `after_seq`.
+        A limit of None returns every matching lead.
+        Returns (leads, last_seq), where last_seq is None when there are no more pages.
+        """
+        query = 'SELECT seq, data FROM leads WHERE seq > ?'
+        params = [after_seq]
+        if status is not None:
+            query += ' AND status = ?'
+            params.append(status)
+        if business_type is not None:
+            query += ' AND type = ?'
+            params.append(business_type)
+        query += ' ORDER BY seq LIMIT ?'
+        params.append(-1 if limit is None else limit + 1)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+        leads = [json.loads(data) for _, data in rows]
+        return leads, (rows[-1][0] if has_more else None)
+
+    def insert(self, lead: Dict):
+        """Insert a single lead"""
+        self.insert_many([lead])
+
+    def insert_many(self, leads: Iterable[Dict]) -> int:
+        """Insert leads in a single transaction, skipping IDs that already exist"""
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                'INSERT OR IGNORE INTO leads (id, email, status, type, data) VALUES (?, ?, ?, ?, ?)',
+                (self._row_values(lead) for lead in leads)
+            )
+            if cursor.rowcount > 0:
+                self._bump_version()
+            return cursor.rowcount
+
+    def insert_new(self, leads: Iterable[Dict], skip_existing_emails: bool = False) -> List[Dict]:
+        """
+        Insert leads under newly allocated numeric IDs in a single transaction.
+        The IDs are taken while the write lock is held, so concurrent writers
+        never collide. With skip_existing_emails, leads whose email is already
+        stored are left out, checked in the same transaction.
+        Sets each inserted lead's 'id' (a string) and returns the inserted leads.
+        """
+        leads = list(leads)
+        if not leads:
+            return leads
+        with self._transaction():
+            if skip_existing_emails:
+                leads = [lead for lead in leads if not lead.get('email') or self._conn.execute(
+                    'SELECT 1 FROM leads WHERE email = ? LIMIT 1', (lead['email'].lower(),)
+                ).fetchone() is None]
+                if not leads:
+                    return leads
+            next_id = self._next_id()
+            for offset, lead in enumerate(leads):
+                lead['id'] = str(next_id + offset)
+            self._conn.executemany(
+                'INSERT INTO leads (id, email, status, type, data) VALUES (?, ?, ?, ?, ?)',
+                (self._row_values(lead) for lead in leads)
+            )
+            self._bump_version()
+        return leads
+
+    def update_status(self, lead_id, status: str) -> bool:
+        """Update the status of a lead"""
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT data FROM leads WHERE id = ?', (str(lead_id),)).fetchone()
+            if not row:
+                return False
+            lead = json.loads(row[0])
+            lead['status'] = status
+            self._conn.execute(
+                'UPDATE leads SET status = ?, data = ? WHERE id = ?',
+                (status, json.dumps(lead), str(lead_id))
+            )
+            self._bump_version()
+            return True
+
+    def update_statuses(self, lead_ids: Iterable, status: str) -> List[str]:
+        """Update the status of many leads in one transaction, returning the IDs that were updated"""
+        lead_ids = [str(lead_id) for lead_id in dict.fromkeys(lead_ids)]
+        updated = []
+        with self._lock, self._conn:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(lead_ids), 500):
+                chunk = lead_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f'SELECT id, data FROM leads WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                changes = []
+                for lead_id, data in rows:
+                    lead = json.loads(data)
+                    lead['status'] = status
+                    changes.append((status, json.dumps(lead), lead_id))
+                    updated.append(lead_id)
+                self._conn.executemany('UPDATE leads SET status = ?, data = ? WHERE id = ?', changes)
+            if updated:
+                self._bump_version()
+        return updated
+
+    def delete(self, lead_id) -> bool:
+        """Delete a lead by ID"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM leads WHERE id = ?', (str(lead_id),))
+            if cursor.rowcount > 0:
+                self._bump_version()
+                return True
+            return False
+
+    def import_json(self, json_file: str) -> int:
+        """Import leads from a JSON list file, returning the number imported"""
+        try:
+            with open(json_file, 'r') as f:
+                leads = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+        return self.insert_many(lead for lead in leads if 'id' in lead)
+
+    def write_snapshot(self, json_file: str):
+        """
+        Atomically write all leads to a JSON file.
+        Rows are streamed from a separate read connection so writers are not blocked,
+        and the file is swapped in with os.replace so it is never left half-written.
+        """
+        directory = os.path.dirname(json_file) or '.'
+        reader = sqlite3.connect(self.db_file)
+        try:
+            fd, tmp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write('[')
+                    for i, (data,) in enumerate(reader.execute('SELECT data FROM leads ORDER BY seq')):
+                        f.write(',\n  ' if i else '\n  ')
+                        f.write(data)
+                    f.write('\n]\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, json_file)
+            except BaseException:
+                os.unlink(tmp_file)
+                raise
+        finally:
+            reader.close()
+
+    def compact(self, json_file: Optional[str] = None) -> bool:
+        """
+        Fold the write-ahead log back into the database and refresh the JSON snapshot.
+        Does nothing when no mutation happened since the last compaction.
+        """
+        version = self.version()
+        if version == self._compacted_version:
+            return False
+        if json_file:
+            self.write_snapshot(json_file)
+        with self._lock:
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._compacted_version = version
+        return True
+
+    def start_compaction(self, json_file: Optional[str] = None, interval: float = 60):
+        """Run compact() every `interval` seconds in a daemon thread"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+
+        def run():
+            while not self._stop_compaction.wait(interval):
+                try:
+                    self.compact(json_file)
+                except Exception as e:
+                    print(f"Error compacting lead store: {e}")
+
+        self._stop_compaction.clear()
+        self._compaction_thread = threading.Thread(target=run, name='lead-store-compaction', daemon=True)
+        self._compaction_thread.start()
+
+    def stop_compaction(self, json_file: Optional[str] = None):
+        """Stop the background compaction thread and run a final compaction"""
+        self._stop_compaction.set()
+        if self._compaction_thread:
+            self._compaction_thread.join()
+            self._compaction_thread = None
+        self.compact(json_file)
@@ -0,0 +1,350 @@
+"""
+Mail Delivery Module
+Retry policy, idempotency ledger and dead-letter store for outbound mail.
+
+- RetryPolicy / send_with_retry: retry 429, 5xx and network errors with jittered
+  exponential backoff, waiting at least as long as the Retry-After header asks.
+- DeliveryLedger: records an idempotency key per (campaign, lead) so a message
+  that was accepted is never sent again, and keeps permanently failed messages
+  as dead letters that can be replayed in bulk. DeliveryLedger.send_many (and
+  send_many_async for coroutine senders) wraps any bulk sender with both.
+
+Environment Variables:
+- DELIVERY_DB_FILE: Ledger database (default data/delivery.db)
+- SEND_MAX_ATTEMPTS: Attempts per message including the first (default 5)
+- SEND_RETRY_BASE_SECONDS: Backoff before the first retry (default 1)
+- SEND_RETRY_MAX_SECONDS: Longest backoff or Retry-After honored (default 60)
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from python_http_client.exceptions import HTTPError
+
+SUCCESS_STATUSES = (200, 201, 202)
+
+
+def is_retryable(status: Optional[int]) -> bool:
+    """Rate limits, server errors and network failures (no status) are worth retrying"""
+    return status is None or status == 429 or status >= 500
+
+
+def retry_after(headers) -> Optional[float]:
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), if any"""
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None):
+        """
+        Args:
+            max_attempts: Attempts per message including the first
+            base_delay: Backoff before the first retry, doubled for each later one
+            max_delay: Longest wait between attempts; a longer Retry-After ends the retries
+        """
+        self.max_attempts = max_attempts or int(os.getenv('SEND_MAX_ATTEMPTS', '5'))
+        self.base_delay = base_delay or float(os.getenv('SEND_RETRY_BASE_SECONDS', '1'))
+        self.max_delay = max_delay or float(os.getenv('SEND_RETRY_MAX_SECONDS', '60'))
+
+    def delay(self, attempt: int, requested: Optional[float] = None) -> Optional[float]:
+        """
+        Seconds to wait after the given failed attempt (1-based), or None to stop retrying.
+        Full jitter spreads retries of many senders; Retry-After is a lower bound.
+        """
+        if attempt >= self.max_attempts:
+            return None
+        if requested is not None and requested > self.max_delay:
+            return None
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return max(backoff, requested or 0.0)
+
+
+class TransportError(Exception):
+    """A failed delivery attempt, classified by the transport that made it"""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = True,
+                 retry_after: Optional[float] = None, body: Optional[bytes] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+        self.body = body
+
+
+class DeliveryResult(NamedTuple):
+    success: bool
+    status: Optional[int]
+    message: str
+    attempts: int
+    # Error response body of the last attempt, if any
+    body: Optional[bytes] = None
+
+
+def send_with_retry(send: Callable, policy: Optional[RetryPolicy] = None,
+                    sleep: Callable[[float], None] = time.sleep) -> DeliveryResult:
+    """
+    Call send() until it succeeds, fails permanently or runs out of attempts.
+    send() returns a SendGrid response (or None from a transport), or raises
+    HTTPError, TransportError or a network error.
+    """
+    policy = policy or RetryPolicy()
+    attempt = 0
+    while True:
+        attempt += 1
+        requested = body = None
+        try:
+            response = send()
+            status = getattr(response, 'status_code', None)
+            if response is None or status in SUCCESS_STATUSES:
+                return DeliveryResult(True, status, "Email sent successfully", attempt)
+            error = f"SendGrid error: Status {status}"
+            retryable = is_retryable(status)
+            requested = retry_after(getattr(response, 'headers', None))
+        except HTTPError as e:
+            status, body = e.status_code, e.body
+            error = f"SendGrid error: Status {status}"
+            retryable = is_retryable(status)
+            requested = retry_after(e.headers)
+        except TransportError as e:
+            status, body = e.status, e.body
+            error = str(e)
+            retryable = e.retryable
+            requested = e.retry_after
+        except OSError as e:
+            # Connection refused/reset, DNS failure, timeout
+            status = None
+            error = f"Failed to send email: {str(e)}"
+            retryable = True
+
+        wait = policy.delay(attempt, requested) if retryable else None
+        if wait is None:
+            return DeliveryResult(False, status, error, attempt, body)
+        print(f"{error}; retrying in {wait:.1f}s (attempt {attempt + 1}/{policy.max_attempts})")
+        sleep(wait)
+
+
+class DeliveryLedger:
+    def __init__(self, db_file: Optional[str] = None, lease: float = 300):
+        """
+        Args:
+            db_file: SQLite file for idempotency keys and dead letters
+            lease: Seconds an unfinished send holds its key before another send may take over
+        """
+        self.db_file = db_file or os.getenv('DELIVERY_DB_FILE', 'data/delivery.db')
+        self.lease = lease
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    key TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    key TEXT,
+                    payload TEXT NOT NULL,
+                    error TEXT,
+                    status INTEGER,
+                    attempts INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    replayed_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_dead_letters_pending ON dead_letters(kind, replayed_at, id);
+            """)
+
+    @staticmethod
+    def key(campaign_id, lead_id) -> str:
+        """Idempotency key of a lead within a campaign"""
+        return f"{campaign_id}:{lead_id}"
+
+    def begin(self, key: str) -> bool:
+        """
+        Reserve a key before sending.
+        Returns False if the message was already sent or another send holds the key.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT state, updated_at FROM deliveries WHERE key = ?', (key,)).fetchone()
+            if row and (row[0] == 'sent' or now - row[1] < self.lease):
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO deliveries (key, state, updated_at) VALUES (?, 'pending', ?)", (key, now)
+            )
+            return True
+
+    def complete(self, key: str):
+        """Record that the message was accepted"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE deliveries SET state = 'sent', updated_at = ? WHERE key = ?", (time.time(), key)
+            )
+
+    def release(self, key: str):
+        """Free a key after a failed send so it may be sent again"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM deliveries WHERE key = ? AND state = 'pending'", (key,))
+
+    def is_sent(self, key: str) -> bool:
+        with self._lock:
+            row = self._conn.execute('SELECT state FROM deliveries WHERE key = ?', (key,)).fetchone()
+        return bool(row and row[0] == 'sent')
+
+    def send_many(self, send_many: Callable[[List[Dict]], List[Dict]], messages: List[Dict],
+                  kind: str = 'email') -> List[Dict]:
+        """
+        Send messages through a bulk sender (a transport's or AsyncEmailSender's send_many)
+        at most once per idempotency key, dead-lettering messages that still fail.
+
+        A message may carry an 'idempotency_key'; it is reserved before the send,
+        and a key that was already sent or is held by another send is skipped.
+        send_many retries transient failures itself, so a failure here is final.
+        If send_many raises instead of reporting per message, the outcome of the
+        batch is unknown: its keys stay held for the lease and nothing is dead-lettered.
+
+        Returns:
+            One {email, success, message} result per message, in order; skipped
+            messages also have 'skipped': True
+        """
+        results, pending = self._reserve_batch(messages)
+        if not pending:
+            return results
+        try:
+            outcomes = send_many([messages[index] for index in pending])
+        except Exception as e:
+            return self._unknown_outcome(messages, results, pending, e)
+        return self._record_batch(messages, results, pending, outcomes, kind)
+
+    async def send_many_async(self, send_many: Callable[[List[Dict]], Awaitable[List[Dict]]],
+                              messages: List[Dict], kind: str = 'email') -> List[Dict]:
+        """send_many for a coroutine bulk sender such as AsyncEmailSender.send_many"""
+        results, pending = self._reserve_batch(messages)
+        if not pending:
+            return results
+        try:
+            outcomes = await send_many([messages[index] for index in pending])
+        except Exception as e:
+            return self._unknown_outcome(messages, results, pending, e)
+        return self._record_batch(messages, results, pending, outcomes, kind)
+
+    def _reserve_batch(self, messages: List[Dict]) -> Tuple[List[Optional[Dict]], List[int]]:
+        """Reserve each message's key; returns the results so far and the indexes left to send"""
+        results = [None] * len(messages)
+        pending = []
+        for index, message in enumerate(messages):
+            key = message.get('idempotency_key')
+            if not all(message.get(field) for field in ('to', 'subject', 'content')):
+                results[index] = {'email': message.get('to'), 'success': False,
+                                  'message': 'Missing required fields: to, subject, content'}
+            elif key and not self.begin(key):
+                sent = self.is_sent(key)
+                results[index] = {'email': message['to'], 'success': sent, 'skipped': True,
+                                  'message': "Email already sent" if sent else "Email send already in progress"}
+            else:
+                pending.append(index)
+        return results, pending
+
+    @staticmethod
+    def _unknown_outcome(messages: List[Dict], results: List[Optional[Dict]], pending: List[int],
+                         error: Exception) -> List[Dict]:
+        # Some messages may have been accepted before the sender failed, so keep
+        # their keys held until the lease runs out instead of freeing them for a resend
+        print(f"Bulk send failed, outcome of {len(pending)} messages unknown: {str(error)}")
+        for index in pending:
+            results[index] = {'email': messages[index]['to'], 'success': False,
+                              'message': f"Failed to send email: {str(error)}"}
+        return results
+
+    def _record_batch(self, messages: List[Dict], results: List[Optional[Dict]], pending: List[int],
+                      outcomes: List[Dict], kind: str) -> List[Dict]:
+        """Complete the keys of accepted messages; release and dead-letter the rest"""
+        for index, outcome in zip(pending, outcomes):
+            message = messages[index]
+            key = message.get('idempotency_key')
+            results[index] = {'email': message['to'], 'success': bool(outcome.get('success')),
+                              'message': outcome.get('message')}
+            if outcome.get('success'):
+                if key:
+                    self.complete(key)
+                continue
+            if key:
+                self.release(key)
+            self.dead_letter(kind, {
+                'to_email': message['to'],
+                'subject': message['subject'],
+                'content': message['content'],
+                'idempotency_key': key
+            }, DeliveryResult(False, outcome.get('status'), outcome.get('message') or '', outcome.get('attempts', 1)),
+                key)
+        return results
+
+    def dead_letter(self, kind: str, payload: Dict, result: DeliveryResult, key: Optional[str] = None) -> int:
+        """Store a permanently failed message for later replay; returns its ID"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO dead_letters (kind, key, payload, error, status, attempts, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (kind, key, json.dumps(payload), result.message, result.status, result.attempts,
+                 datetime.now().isoformat())
+            )
+        return cursor.lastrowid
+
+    def dead_letters(self, kind: Optional[str] = None, ids: Optional[List[int]] = None,
+                     include_replayed: bool = False, limit: int = 100) -> List[Dict]:
+        """Get dead letters, oldest first"""
+        query = 'SELECT id, kind, key, payload, error, status, attempts, created_at, replayed_at FROM dead_letters'
+        conditions, params = [], []
+        if kind:
+            conditions.append('kind = ?')
+            params.append(kind)
+        if ids:
+            conditions.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        if not include_replayed:
+            conditions.append('replayed_at IS NULL')
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id LIMIT ?'
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        columns = ('id', 'kind', 'key', 'payload', 'error', 'status', 'attempts', 'created_at', 'replayed_at')
+        letters = [dict(zip(columns, row)) for row in rows]
+        for letter in letters:
+            letter['payload'] = json.loads(letter['payload'])
+        return letters
+
+    def mark_replayed(self, ids: List[int]):
+        """Retire dead letters that were handed back for sending"""
+        if not ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE dead_letters SET replayed_at = ? WHERE id = ?',
+                ((datetime.now().isoformat(), letter_id) for letter_id in ids)
+            )
@@ -0,0 +1,313 @@
+"""
+Mail Transport Module
+Pluggable outbound mail transports: the SendGrid HTTP API or an SMTP relay.
+
+The SMTP transport keeps a small pool of persistent, authenticated
+connections and reuses them across messages. When the relay advertises
+PIPELINING (RFC 2920), MAIL FROM and RCPT TO go out in one write, saving a
+round trip per message; DATA is only sent once the recipient is accepted.
+
+Environment Variables:
+- MAIL_TRANSPORT: 'sendgrid' (default) or 'smtp'
+- SMTP_HOST, SMTP_PORT: Relay address (default localhost:587)
+- SMTP_USERNAME, SMTP_PASSWORD: Credentials, if the relay requires them
+- SMTP_SECURITY: 'starttls' (default), 'ssl' or 'none'
+- SMTP_POOL_SIZE: Most open connections (default 4)
+- SMTP_TIMEOUT_SECONDS: Socket timeout (default 30)
+- SMTP_MAX_MESSAGES_PER_CONNECTION: Messages before a connection is recycled (default 100)
+- SMTP_IDLE_SECONDS: Idle time after which a pooled connection is checked with NOOP (default 30)
+
+Local testing against a stand-in relay:
+    python -m aiosmtpd -n -l localhost:8025
+    MAIL_TRANSPORT=smtp SMTP_PORT=8025 SMTP_SECURITY=none python app.py
+"""
+
+import os
+import queue
+import re
+import smtplib
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+from typing import Dict, List, Optional
+
+from python_http_client.exceptions import HTTPError
+from sendgrid import SendGridAPIClient
+from sendgrid.helpers.mail import Email, Mail
+
+from mail_delivery import SUCCESS_STATUSES, RetryPolicy, TransportError, is_retryable, retry_after, send_with_retry
+
+ADDRESS_PATTERN = re.compile(r'[^@\s<>]+@[^@\s<>]+')
+
+
+def invalid_message(message: Dict) -> Optional[str]:
+    """Why a message cannot be sent as given, or None if it can"""
+    if not all(message.get(field) for field in ('to', 'subject', 'content')):
+        return "Missing required fields: to, subject, content"
+    for field in ('to', 'subject', 'from_email', 'from_name'):
+        value = message.get(field)
+        if value is not None and (not isinstance(value, str) or '\r' in value or '\n' in value):
+            return f"Invalid {field}: must be a single line of text"
+    for field in ('to', 'from_email'):
+        if message.get(field) and not ADDRESS_PATTERN.fullmatch(message[field]):
+            return f"Invalid {field}: {message[field]!r} is not an email address"
+    return None
+
+
+class Transport:
+    """Sends one message at a time; send_many sends a batch"""
+
+    name = 'base'
+
+    def __init__(self, from_email: str = 'sam@webreachconnect.com', from_name: str = 'Sam from Web Reach Connect'):
+        self.from_email = from_email
+        self.from_name = from_name
+        self.retry_policy = RetryPolicy()
+
+    def send(self, message: Dict):
+        """
+        Send a {to, subject, content} message (optionally from_email, from_name).
+        Returns None on success and raises TransportError on failure.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    def _check(message: Dict):
+        """Reject a malformed message before any connection is made"""
+        error = invalid_message(message)
+        if error:
+            raise TransportError(error, retryable=False)
+
+    def _send_result(self, message: Dict) -> Dict:
+        # Never raise: one bad message must not fail the rest of its batch
+        try:
+            result = send_with_retry(lambda: self.send(message), self.retry_policy)
+        except Exception as e:
+            return {'email': message.get('to'), 'success': False, 'message': f"Failed to send email: {str(e)}"}
+        return {'email': message.get('to'), 'success': result.success, 'message': result.message,
+                'status': result.status, 'attempts': result.attempts}
+
+    def send_many(self, messages: List[Dict]) -> List[Dict]:
+        """Send messages with retries; one {email, success, message} result per message, in order"""
+        return [self._send_result(message) for message in messages]
+
+    def close(self):
+        pass
+
+
+class SendGridTransport(Transport):
+    name = 'sendgrid'
+
+    def __init__(self, api_key: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        api_key = api_key or os.environ.get('SENDGRID_API_KEY')
+        if not api_key:
+            raise ValueError("SENDGRID_API_KEY not found in environment variables")
+        self.client = SendGridAPIClient(api_key)
+
+    def send(self, message: Dict):
+        self._check(message)
+        mail = Mail(
+            from_email=Email(message.get('from_email') or self.from_email, message.get('from_name') or self.from_name),
+            to_emails=message['to'],
+            subject=message['subject'],
+            plain_text_content=message['content']
+        )
+        try:
+            response = self.client.client.mail.send.post(request_body=mail.get())
+        except HTTPError as e:
+            raise TransportError(f"SendGrid error: Status {e.status_code}", e.status_code,
+                                 is_retryable(e.status_code), retry_after(e.headers), e.body)
+        if response.status_code not in SUCCESS_STATUSES:
+            raise TransportError(f"SendGrid error: Status {response.status_code}", response.status_code,
+                                 is_retryable(response.status_code), retry_after(response.headers))
+
+
+class _PooledConnection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+        self.pipelining = smtp.has_extn('pipelining')
+
+
+class SMTPTransport(Transport):
+    name = 'smtp'
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None, username: Optional[str] = None,
+                 password: Optional[str] = None, security: Optional[str] = None, pool_size: Optional[int] = None,
+                 timeout: Optional[float] = None, max_messages_per_connection: Optional[int] = None,
+                 idle_seconds: Optional[float] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.host = host or os.getenv('SMTP_HOST', 'localhost')
+        self.port = port or int(os.getenv('SMTP_PORT', '587'))
+        self.username = username or os.getenv('SMTP_USERNAME')
+        self.password = password or os.getenv('SMTP_PASSWORD')
+        self.security = (security or os.getenv('SMTP_SECURITY', 'starttls')).lower()
+        self.pool_size = pool_size or int(os.getenv('SMTP_POOL_SIZE', '4'))
+        self.timeout = timeout or float(os.getenv('SMTP_TIMEOUT_SECONDS', '30'))
+        self.max_messages_per_connection = (max_messages_per_connection
+                                            or int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100')))
+        self.idle_seconds = idle_seconds or float(os.getenv('SMTP_IDLE_SECONDS', '30'))
+
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='smtp')
+        self.connections_opened = 0
+
+    def _connect(self) -> _PooledConnection:
+        """Open, secure and authenticate a new connection"""
+        if self.security == 'ssl':
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout, context=ssl.create_default_context())
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.security == 'starttls':
+                smtp.starttls(context=ssl.create_default_context())
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password or '')
+        except Exception:
+            self._discard(_PooledConnection(smtp))
+            raise
+        self.connections_opened += 1
+        return _PooledConnection(smtp)
+
+    def _acquire(self) -> _PooledConnection:
+        """Take an idle connection, checking it if it sat idle, or open a new one"""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - connection.last_used < self.idle_seconds:
+                    return connection
+                try:
+                    if connection.smtp.noop()[0] == 250:
+                        return connection
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self._discard(connection)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, connection: Optional[_PooledConnection]):
+        """Return a connection to the pool, or close it once it has sent its quota"""
+        try:
+            if connection is not None:
+                if connection.sent >= self.max_messages_per_connection:
+                    self._discard(connection)
+                else:
+                    connection.last_used = time.monotonic()
+                    self._idle.put(connection)
+        finally:
+            self._slots.release()
+
+    @staticmethod
+    def _discard(connection: _PooledConnection):
+        try:
+            connection.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.smtp.close()
+
+    def _build(self, message: Dict) -> EmailMessage:
+        email = EmailMessage()
+        sender = message.get('from_email') or self.from_email
+        email['From'] = formataddr((message.get('from_name') or self.from_name, sender))
+        email['To'] = message['to']
+        email['Subject'] = message['subject']
+        email['Date'] = formatdate(localtime=True)
+        email['Message-ID'] = make_msgid(domain=sender.rpartition('@')[2] or None)
+        email.set_content(message['content'])
+        return email
+
+    @staticmethod
+    def _pipelined_send(smtp: smtplib.SMTP, sender: str, recipient: str, data: bytes):
+        """
+        Send MAIL FROM and RCPT TO in one write, then DATA and the message body.
+        Like smtplib's sendmail, a refused transaction is reset before raising.
+        """
+        smtp.send(f"MAIL FROM:<{sender}>\r\nRCPT TO:<{recipient}>\r\n")
+        mail_reply = smtp.getreply()
+        rcpt_reply = smtp.getreply()
+        if mail_reply[0] != 250:
+            smtp.rset()
+            raise smtplib.SMTPSenderRefused(mail_reply[0], mail_reply[1], sender)
+        if rcpt_reply[0] not in (250, 251):
+            # No recipient was accepted, so there is nothing to send DATA for
+            smtp.rset()
+            raise smtplib.SMTPRecipientsRefused({recipient: rcpt_reply})
+        data_reply = smtp.docmd('DATA')
+        if data_reply[0] != 354:
+            smtp.rset()
+            raise smtplib.SMTPDataError(*data_reply)
+
+        # Dot-stuff lines starting with '.', normalize line endings and terminate
+        body = re.sub(rb'(?m)^\.', b'..', re.sub(rb'\r\n|\r|\n', b'\r\n', data))
+        if not body.endswith(b'\r\n'):
+            body += b'\r\n'
+        smtp.send(body + b'.\r\n')
+        code, reply = smtp.getreply()
+        if code != 250:
+            smtp.rset()
+            raise smtplib.SMTPDataError(code, reply)
+
+    def send(self, message: Dict):
+        self._check(message)
+        email = self._build(message)
+        sender = message.get('from_email') or self.from_email
+        try:
+            connection = self._acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            raise TransportError(f"SMTP connection failed: {e}")
+
+        try:
+            if connection.pipelining:
+                self._pipelined_send(connection.smtp, sender, message['to'], email.as_bytes())
+            else:
+                connection.smtp.sendmail(sender, [message['to']], email.as_bytes())
+            connection.sent += 1
+        except smtplib.SMTPRecipientsRefused as e:
+            # The transaction was already reset, so the connection stays usable
+            code, reply = next(iter(e.recipients.values()))
+            raise TransportError(f"SMTP recipient refused: {code} {reply.decode(errors='replace')}",
+                                 code, retryable=400 <= code < 500)
+        except smtplib.SMTPResponseException as e:
+            raise TransportError(f"SMTP error: {e.smtp_code} {e.smtp_error.decode(errors='replace')}",
+                                 e.smtp_code, retryable=400 <= e.smtp_code < 500)
+        except (smtplib.SMTPException, OSError) as e:
+            # Connection is unusable; drop it and let the retry open a new one
+            self._discard(connection)
+            connection = None
+            raise TransportError(f"SMTP connection lost: {e}")
+        finally:
+            self._release(connection)
+
+    def send_many(self, messages: List[Dict]) -> List[Dict]:
+        """Send messages over the pooled connections in parallel, with retries"""
+        return list(self._executor.map(self._send_result, messages))
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+def create_transport(name: Optional[str] = None, **kwargs) -> Transport:
+    """Build the transport selected by name or MAIL_TRANSPORT"""
+    name = (name or os.getenv('MAIL_TRANSPORT', 'sendgrid')).lower()
+    if name == 'smtp':
+        return SMTPTransport(**kwargs)
+    if name == 'sendgrid':
+        return SendGridTransport(**kwargs)
+    raise ValueError(f"Unknown MAIL_TRANSPORT: {name}")
@@ -1,10 +1,15 @@
 import os
 import json
 import schedule
+import threading
 import time
 from datetime import datetime
 from lead_finder import LeadFinder
 from email_sender import EmailSender
+from send_queue import SendQueue
+
+email_sender = EmailSender()
+_sent_emails_lock = threading.Lock()
 
 def save_leads(leads, filename="leads.json"):
     """Save leads to a JSON file."""
@@ -50,23 +55,50 @@ def find_new_leads(location):
     print(f"Added {len(new_leads)} new leads to the database!")
     return new_leads
 
+def record_sent_email(message, result):
+    """Mark a lead as emailed once its queued message has actually been sent."""
+    if not result.get('success') or not message.get('lead_id'):
+        return
+    with _sent_emails_lock:
+        sent_emails = load_sent_emails()
+        sent_emails[message['lead_id']] = {
+            "sent_date": datetime.now().isoformat(),
+            "email": message["to"]
+        }
+        save_sent_emails(sent_emails)
+
+# Drains queued emails within EMAIL_HOURLY_LIMIT / EMAIL_DAILY_LIMIT instead of sleeping between sends
+send_queue = SendQueue(email_sender.transport.send_many, default_sender=email_sender.from_email.email,
+                       on_result=record_sent_email, ledger=email_sender.ledger)
+email_sender.send_queue = send_queue
+
 def send_emails_to_leads():
-    """Send emails to leads that haven't been contacted."""
-    sender = EmailSender()
+    """Queue emails to leads that haven't been contacted; the send queue paces delivery."""
+    sender = email_sender
     leads = load_leads()
     sent_emails = load_sent_emails()
+    template_id = os.getenv('EMAIL_TEMPLATE_ID', 'local_restaurants_1')
+    queued = send_queue.pending_lead_ids(campaign_id=template_id)
     
+    messages = []
     for lead in leads:
         key = f"{lead['business_name']}_{lead['address']}"
-        if key not in sent_emails and lead.get("email"):  # Only send if we have email and haven't sent before
-            if sender.send_email(lead["email"], lead):
-                sent_emails[key] = {
-                    "sent_date": datetime.now().isoformat(),
-                    "business_name": lead["business_name"],
-                    "email": lead["email"]
-                }
-                save_sent_emails(sent_emails)
-                time.sleep(5)  # Add delay between emails to avoid triggering spam filters
+        # Only send if we have email and haven't sent (or queued) before
+        if key not in sent_emails and key not in queued and lead.get("email"):
+            rendered = sender.render_template(template_id, lead)
+            if rendered is None:
+                print(f"Template not found: {template_id}")
+                return
+            messages.append({
+                "to": lead["email"],
+                "subject": rendered["subject"],
+                "content": rendered["content"],
+                "lead_id": key
+            })
+    
+    # Leads are recorded in sent_emails.json by record_sent_email once delivered
+    send_queue.enqueue(messages, campaign_id=template_id)
+    print(f"Queued {len(messages)} emails")
 
 def main():
     # Schedule lead finding daily at 9 AM
@@ -76,6 +108,7 @@ def main():
     schedule.every().day.at("10:00").do(send_emails_to_leads)
     
     print("Starting automated lead finder and email sender...")
+    send_queue.start()
     while True:
         schedule.run_pending()
         time.sleep(60)
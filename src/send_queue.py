@@ -0,0 +1,380 @@
+"""
+Send Queue Module
+Durable outbound email queue drained at the rate allowed by hourly and daily limits.
+
+Messages are stored in SQLite as soon as they are enqueued, so a large campaign
+is queued in one transaction and keeps draining across restarts.
+
+Every batch of sends granted to a sender identity is logged in the database.
+A sender may send only what its last hour and last day of grants leave of the
+hourly and daily limits, so neither limit can be exceeded over any window.
+Grants are taken inside one BEGIN IMMEDIATE transaction, so every process
+sharing the database (app, scheduler, scripts) shares the same limits.
+Senders outside the queue (campaign ticks) take their sends from the same
+limits with reserve() and settle().
+
+Every message has an idempotency key reserved in the DeliveryLedger before it is
+handed to the transport, so a message is never sent twice, even when a claim is
+recovered after a crash. Messages that still fail after the transport's retries
+are kept as dead letters for replay.
+
+Environment Variables:
+- SEND_QUEUE_DB_FILE: Queue database (default data/send_queue.db)
+- EMAIL_HOURLY_LIMIT: Sends per hour per sender (default 50)
+- EMAIL_DAILY_LIMIT: Sends per day per sender (default 500)
+- SEND_QUEUE_BATCH_SIZE: Most messages handed to the transport at once (default 50)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from uuid import uuid4
+
+from mail_delivery import DeliveryLedger
+
+HOUR = 3600
+DAY = 86400
+
+
+class SendQueue:
+    def __init__(self, send_many: Callable[[List[Dict]], List[Dict]], db_file: Optional[str] = None,
+                 default_sender: str = 'sam@webreachconnect.com', hourly_limit: Optional[int] = None,
+                 daily_limit: Optional[int] = None, batch_size: Optional[int] = None,
+                 on_result: Optional[Callable[[Dict, Dict], None]] = None,
+                 ledger: Optional[DeliveryLedger] = None):
+        """
+        Args:
+            send_many: Sends a list of {to, subject, content, from_email, from_name} messages,
+                returning one {success, message} result per message (e.g. AsyncEmailSender.send_many_sync)
+            db_file: SQLite file for the queue and send grant log
+            default_sender: Sender identity of messages without a from_email
+            hourly_limit: Sends per hour per sender
+            daily_limit: Sends per day per sender
+            batch_size: Most messages handed to send_many at once
+            on_result: Optional callback, called as on_result(message, result) for each
+                message once its outcome is recorded
+            ledger: Idempotency ledger and dead-letter store; its lease is also how long
+                a claimed message may stay unsent before another drain takes it over
+        """
+        self.send_many = send_many
+        self.db_file = db_file or os.getenv('SEND_QUEUE_DB_FILE', 'data/send_queue.db')
+        self.default_sender = default_sender
+        self.hourly_limit = hourly_limit or int(os.getenv('EMAIL_HOURLY_LIMIT', '50'))
+        self.daily_limit = daily_limit or int(os.getenv('EMAIL_DAILY_LIMIT', '500'))
+        self.batch_size = batch_size or int(os.getenv('SEND_QUEUE_BATCH_SIZE', '50'))
+        self.on_result = on_result
+        self.ledger = ledger or DeliveryLedger()
+
+        directory = os.path.dirname(self.db_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+        self._recover()
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _create_schema(self):
+        """Create the queue and send grant tables"""
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS outbound (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sender TEXT NOT NULL,
+                    from_name TEXT,
+                    to_email TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    lead_id TEXT,
+                    campaign_id TEXT,
+                    idempotency_key TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    claimed_at REAL,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    sent_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_outbound_pending ON outbound(status, sender, id);
+                CREATE INDEX IF NOT EXISTS idx_outbound_campaign ON outbound(campaign_id, status);
+                CREATE TABLE IF NOT EXISTS send_grants (
+                    sender TEXT NOT NULL,
+                    granted_at REAL NOT NULL,
+                    tokens INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_send_grants ON send_grants(sender, granted_at);
+            """)
+
+    def _migrate(self):
+        """Add columns missing from queues created by earlier versions"""
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(outbound)')}
+        for column, definition in (('idempotency_key', 'TEXT'), ('claimed_at', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE outbound ADD COLUMN {column} {definition}')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_outbound_claimed ON outbound(status, claimed_at)')
+
+    def _requeue_expired(self, now: float) -> int:
+        """
+        Requeue messages claimed longer ago than the ledger lease, i.e. by a drain
+        that stopped before recording them. Their keys have expired too, so they
+        are sent again unless the ledger shows they were accepted. Caller holds the lock.
+        """
+        return self._conn.execute(
+            "UPDATE outbound SET status = 'queued' WHERE status = 'sending' "
+            "AND (claimed_at IS NULL OR claimed_at <= ?)",
+            (now - self.ledger.lease,)
+        ).rowcount
+
+    def _recover(self):
+        """Requeue messages that were being sent when a process stopped"""
+        with self._lock, self._conn:
+            self._migrate()
+            recovered = self._requeue_expired(time.time())
+        if recovered:
+            print(f"Requeued {recovered} interrupted sends")
+
+    def enqueue(self, messages: Iterable[Dict], campaign_id: Optional[str] = None) -> int:
+        """
+        Queue messages for sending; returns how many were queued.
+        Each message needs to, subject and content, and may set from_email,
+        from_name, lead_id and idempotency_key. Messages missing a required field are skipped.
+        A lead is sent at most one message per campaign; other messages get a key of their own.
+        """
+        now = datetime.now().isoformat()
+        rows = []
+        for message in messages:
+            if not all(message.get(key) for key in ('to', 'subject', 'content')):
+                continue
+            lead_id = None if message.get('lead_id') is None else str(message['lead_id'])
+            key = message.get('idempotency_key')
+            if not key:
+                key = (DeliveryLedger.key(campaign_id, lead_id) if campaign_id is not None and lead_id is not None
+                       else f"outbound:{uuid4().hex}")
+            rows.append((message.get('from_email') or self.default_sender, message.get('from_name'),
+                         message['to'], message['subject'], message['content'], lead_id, campaign_id, key, now))
+        if not rows:
+            return 0
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO outbound (sender, from_name, to_email, subject, content, lead_id, campaign_id, '
+                'idempotency_key, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        self._wakeup.set()
+        return len(rows)
+
+    def pending_lead_ids(self, campaign_id: Optional[str] = None) -> Set[str]:
+        """Lead IDs with a message still queued or being sent, optionally for one campaign"""
+        query = "SELECT DISTINCT lead_id FROM outbound WHERE status IN ('queued', 'sending') AND lead_id IS NOT NULL"
+        params = []
+        if campaign_id is not None:
+            query += ' AND campaign_id = ?'
+            params.append(campaign_id)
+        with self._lock:
+            return {lead_id for (lead_id,) in self._conn.execute(query, params)}
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that holds the database lock from the start, across processes"""
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def _remaining(self, sender: str, now: float) -> Tuple[int, float]:
+        """
+        Sends a sender may make now within both limits, and when nothing is
+        left, seconds until the oldest grant counted against the limit expires.
+        Caller holds the lock.
+        """
+        remaining = []
+        wait = 0.0
+        for limit, window in ((self.hourly_limit, HOUR), (self.daily_limit, DAY)):
+            used, oldest = self._conn.execute(
+                'SELECT COALESCE(SUM(tokens), 0), MIN(granted_at) FROM send_grants '
+                'WHERE sender = ? AND granted_at > ?',
+                (sender, now - window)
+            ).fetchone()
+            remaining.append(limit - used)
+            if used >= limit:
+                wait = max(wait, oldest + window - now)
+        return max(0, min(remaining)), wait
+
+    def _claim(self) -> Tuple[List[Tuple], float]:
+        """
+        Claim the next batch of sendable messages across all senders.
+        Returns (rows, seconds to wait before trying again when nothing is sendable).
+        """
+        now = time.time()
+        rows = []
+        wait = None
+        with self._transaction():
+            self._conn.execute('DELETE FROM send_grants WHERE granted_at <= ?', (now - DAY,))
+            self._requeue_expired(now)
+            senders = [row[0] for row in self._conn.execute(
+                "SELECT DISTINCT sender FROM outbound WHERE status = 'queued'"
+            )]
+            for sender in senders:
+                available, sender_wait = self._remaining(sender, now)
+                if not available:
+                    wait = sender_wait if wait is None else min(wait, sender_wait)
+                    continue
+                claimed = self._conn.execute(
+                    "SELECT id, sender, from_name, to_email, subject, content, lead_id, campaign_id, idempotency_key "
+                    "FROM outbound WHERE status = 'queued' AND sender = ? ORDER BY id LIMIT ?",
+                    (sender, min(available, self.batch_size - len(rows)))
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbound SET status = 'sending', claimed_at = ? WHERE id = ?",
+                    ((now, row[0]) for row in claimed)
+                )
+                # Log the grant so every process counts these sends against the limits
+                self._conn.execute(
+                    'INSERT INTO send_grants (sender, granted_at, tokens) VALUES (?, ?, ?)',
+                    (sender, now, len(claimed))
+                )
+                rows.extend(claimed)
+                if len(rows) >= self.batch_size:
+                    break
+        return rows, (wait if wait is not None else 60.0)
+
+    @staticmethod
+    def _status(result: Dict) -> str:
+        """Queue status for a send result"""
+        if result.get('success'):
+            return 'sent'
+        # Another send holds the key; it records the outcome
+        return 'skipped' if result.get('skipped') else 'failed'
+
+    def reserve(self, count: int, sender: Optional[str] = None) -> Tuple[int, Optional[int]]:
+        """
+        Take up to `count` sends from a sender's limits for sending outside the
+        queue (e.g. campaign ticks). Returns (sends granted, grant ID); report the
+        sends actually made with settle() so unused ones are given back.
+        """
+        sender = sender or self.default_sender
+        now = time.time()
+        with self._transaction():
+            available, _ = self._remaining(sender, now)
+            granted = min(count, available)
+            if not granted:
+                return 0, None
+            cursor = self._conn.execute(
+                'INSERT INTO send_grants (sender, granted_at, tokens) VALUES (?, ?, ?)', (sender, now, granted)
+            )
+        return granted, cursor.lastrowid
+
+    def settle(self, grant_id: Optional[int], used: int):
+        """Shrink a reserved grant to the sends actually made"""
+        if grant_id is None:
+            return
+        with self._transaction():
+            self._conn.execute(
+                'UPDATE send_grants SET tokens = MIN(tokens, ?) WHERE rowid = ?', (max(0, used), grant_id)
+            )
+
+    def _send(self, rows: List[Tuple]):
+        """
+        Send claimed messages and record their outcome. Each message's key is
+        reserved in the ledger first; failures end up as dead letters.
+        """
+        messages = [
+            {'to': to_email, 'subject': subject, 'content': content, 'from_email': sender, 'from_name': from_name,
+             'lead_id': lead_id, 'campaign_id': campaign_id, 'idempotency_key': key or f"outbound:{row_id}"}
+            for row_id, sender, from_name, to_email, subject, content, lead_id, campaign_id, key in rows
+        ]
+        results = self.ledger.send_many(self.send_many, messages)
+
+        sent_at = datetime.now().isoformat()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE outbound SET status = ?, error = ?, sent_at = ? WHERE id = ?',
+                (('sent', None, sent_at, row[0]) if result.get('success')
+                 else (self._status(result), result.get('message'), None, row[0])
+                 for row, result in zip(rows, results))
+            )
+
+        if self.on_result:
+            for message, result in zip(messages, results):
+                try:
+                    self.on_result(message, result)
+                except Exception as e:
+                    print(f"Error in send queue result callback: {e}")
+
+    def drain_once(self) -> float:
+        """Send one batch if the limits allow; returns seconds to wait before the next attempt"""
+        rows, wait = self._claim()
+        if rows:
+            self._send(rows)
+            return 0.0
+        return wait
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Clear before looking at the queue, so an enqueue during the drain still wakes us
+            self._wakeup.clear()
+            try:
+                wait = self.drain_once()
+            except Exception as e:
+                print(f"Error draining send queue: {e}")
+                wait = 5.0
+            if wait:
+                self._wakeup.wait(wait)
+
+    def start(self):
+        """Drain the queue on a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='send-queue', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after its current batch"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=30)
+            self._thread = None
+
+    def stats(self) -> Dict:
+        """Message counts per status and the remaining budget of each sender"""
+        now = time.time()
+        with self._lock:
+            by_status = dict(self._conn.execute('SELECT status, COUNT(*) FROM outbound GROUP BY status'))
+            senders = {}
+            for (sender,) in self._conn.execute(
+                'SELECT sender FROM outbound UNION SELECT sender FROM send_grants'
+            ).fetchall():
+                hourly_used, daily_used = (
+                    self._conn.execute(
+                        'SELECT COALESCE(SUM(tokens), 0) FROM send_grants WHERE sender = ? AND granted_at > ?',
+                        (sender, now - window)
+                    ).fetchone()[0]
+                    for window in (HOUR, DAY)
+                )
+                senders[sender] = {
+                    'hourly_remaining': max(0, self.hourly_limit - hourly_used),
+                    'daily_remaining': max(0, self.daily_limit - daily_used),
+                    'queued': self._conn.execute(
+                        "SELECT COUNT(*) FROM outbound WHERE status = 'queued' AND sender = ?", (sender,)
+                    ).fetchone()[0]
+                }
+        return {
+            'hourly_limit': self.hourly_limit,
+            'daily_limit': self.daily_limit,
+            'by_status': by_status,
+            'senders': senders
+        }
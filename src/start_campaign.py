@@ -9,7 +9,10 @@ def main():
     email_sender = EmailSender()
     
     print("Starting lead search...")
-    new_leads = lead_finder.find_leads()
+    try:
+        new_leads = lead_finder.find_leads()
+    finally:
+        lead_finder.close()
     print(f"Found {len(new_leads)} new leads!")
     
     if new_leads:
@@ -29,7 +32,8 @@ def main():
         email_sender.process_campaigns()
         
         print("\nCampaign is running!")
-        print("- Emails will be sent according to daily and hourly limits")
+        print("- Emails are sent within the daily and hourly limits (EMAIL_DAILY_LIMIT / EMAIL_HOURLY_LIMIT)")
+        print("- Run campaign_processor.py to keep sending the remaining batches")
         print("- Check the dashboard at http://localhost:5000 for progress")
         print("- Responses will come to webreachconnect@gmail.com")
 
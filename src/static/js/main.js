@@ -103,14 +103,25 @@ document.getElementById('lead-upload').addEventListener('change', async (event)
     }
 });
 
-// Load leads into table
-async function loadLeads() {
+// Load leads into table, one page at a time
+let leadsCursor = null;
+let leadsShown = 0;
+
+async function loadLeads(append = false) {
     try {
-        const response = await fetch('/api/leads');
-        const leads = await response.json();
+        // Fetch one page with only the columns the table shows
+        const params = new URLSearchParams({ limit: 100, fields: 'business_name,email,status' });
+        if (append && leadsCursor) {
+            params.set('cursor', leadsCursor);
+        }
+        const response = await fetch(`/api/leads?${params}`);
+        const { leads, next_cursor } = await response.json();
         
         const tableBody = document.getElementById('leads-table-body');
-        tableBody.innerHTML = '';
+        if (!append) {
+            tableBody.innerHTML = '';
+            leadsShown = 0;
+        }
         
         leads.forEach(lead => {
             const row = document.createElement('tr');
@@ -129,14 +140,37 @@ async function loadLeads() {
             `;
             tableBody.appendChild(row);
         });
+        leadsShown += leads.length;
+        leadsCursor = next_cursor || null;
 
-        // Update dashboard stats
-        document.getElementById('totalLeads').textContent = leads.length;
+        // Update dashboard stats from the server-side counters
+        const statsResponse = await fetch('/api/leads/stats');
+        const stats = await statsResponse.json();
+        document.getElementById('totalLeads').textContent = stats.total;
+        updateLeadsPager(tableBody, stats.total);
     } catch (error) {
         showNotification('Failed to load leads: ' + error.message, 'error');
     }
 }
 
+// Show how many leads are loaded, with a button for the next page
+function updateLeadsPager(tableBody, total) {
+    let pager = document.getElementById('leads-pager');
+    if (!pager) {
+        pager = document.createElement('div');
+        pager.id = 'leads-pager';
+        pager.className = 'flex items-center justify-between px-6 py-3 text-sm text-gray-500';
+        pager.innerHTML = `
+            <span id="leads-pager-count"></span>
+            <button id="leads-load-more" class="text-indigo-600 hover:text-indigo-900">Load more</button>
+        `;
+        (tableBody.closest('table') || tableBody).after(pager);
+        pager.querySelector('#leads-load-more').addEventListener('click', () => loadLeads(true));
+    }
+    pager.querySelector('#leads-pager-count').textContent = `Showing ${leadsShown} of ${total} leads`;
+    pager.querySelector('#leads-load-more').classList.toggle('hidden', !leadsCursor);
+}
+
 // Template management
 document.getElementById('new-template-btn').addEventListener('click', () => {
     // Show template creation modal
@@ -0,0 +1,175 @@
+"""
+Template Engine Module
+Compiles email templates once and renders them for many leads.
+
+Three placeholder dialects are supported and may be mixed:
+- [Recipient's Name]  (data/email_templates.json)
+- {business_name}     (data/templates.json)
+- {{business_name}}   (data/templates/*.json)
+
+Each template is compiled into a positional format string plus the list of
+variables it uses, so rendering a lead is a single str.format call.
+
+Usage:
+    python template_engine.py --bench
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_PLACEHOLDER = re.compile(r'\{\{\s*(\w+)\s*\}\}|\{(\w+)\}|\[([^\[\]\n]{1,60})\]')
+
+# Bracket labels that don't follow the "<Something> Name" -> business_name rule
+_BRACKET_ALIASES = {
+    "recipient's name": 'recipient_name',
+    'your name': 'sender_name',
+    'your contact information': 'sender_contact',
+    'your company': 'company_name',
+    'location': 'location'
+}
+
+
+def bracket_variable(label: str) -> str:
+    """Map a bracket label like '[Gym/Fitness Center Name]' to a variable name"""
+    label = label.strip().lower()
+    if label in _BRACKET_ALIASES:
+        return _BRACKET_ALIASES[label]
+    if label.endswith(' name'):
+        # [Restaurant Name], [Café Name], [Plumbing Business Name], ...
+        return 'business_name'
+    return re.sub(r'\W+', '_', label).strip('_')
+
+
+class CompiledTemplate:
+    def __init__(self, text: str):
+        self.text = text
+        self.variables: List[str] = []
+        self.placeholders: Dict[str, str] = {}
+
+        parts = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(text):
+            mustache, brace, bracket = match.groups()
+            variable = mustache or brace or bracket_variable(bracket)
+            if variable not in self.placeholders:
+                self.placeholders[variable] = match.group(0)
+                self.variables.append(variable)
+            parts.append(self._escape(text[position:match.start()]))
+            parts.append('{%d}' % self.variables.index(variable))
+            position = match.end()
+        parts.append(self._escape(text[position:]))
+        self._format = ''.join(parts)
+
+    @staticmethod
+    def _escape(literal: str) -> str:
+        """Escape braces so literal text survives str.format"""
+        return literal.replace('{', '{{').replace('}', '}}')
+
+    def render(self, values: Dict) -> Tuple[str, List[str]]:
+        """
+        Render with the given values.
+        Returns (text, missing) where missing lists variables without a value;
+        their placeholders are left in the text as written.
+        """
+        missing = []
+        args = []
+        for variable in self.variables:
+            value = values.get(variable)
+            if value in (None, ''):
+                missing.append(variable)
+                value = self.placeholders[variable]
+            args.append(value)
+        return self._format.format(*args), missing
+
+    def render_many(self, values_list: Iterable[Dict]) -> List[Tuple[str, List[str]]]:
+        """Render a batch against this one compiled plan"""
+        return [self.render(values) for values in values_list]
+
+
+@lru_cache(maxsize=1024)
+def compile_template(text: str) -> CompiledTemplate:
+    """Compile template text, reusing the plan for text seen before"""
+    return CompiledTemplate(text or '')
+
+
+class CompiledEmail:
+    def __init__(self, template: Dict):
+        self.template_id = template.get('id')
+        self.subject = compile_template(template.get('subject', ''))
+        self.content = compile_template(template.get('content', ''))
+        # Variables used anywhere in the email, in first-use order
+        self.variables = list(dict.fromkeys(self.subject.variables + self.content.variables))
+        # Placeholder text of each variable as written in the template
+        self.placeholders = {**self.content.placeholders, **self.subject.placeholders}
+
+    def render(self, values: Dict) -> Dict:
+        """Render subject and content; 'missing' lists unresolved variables"""
+        subject, missing_subject = self.subject.render(values)
+        content, missing_content = self.content.render(values)
+        return {
+            'subject': subject,
+            'content': content,
+            'missing': list(dict.fromkeys(missing_subject + missing_content))
+        }
+
+    def render_many(self, values_list: Iterable[Dict]) -> List[Dict]:
+        """Render a batch of leads against the compiled subject and content"""
+        return [self.render(values) for values in values_list]
+
+
+def compile_email(template: Dict) -> CompiledEmail:
+    """Compile a template dict with 'subject' and 'content'"""
+    return CompiledEmail(template)
+
+
+def benchmark(template: Dict, iterations: int = 100000) -> float:
+    """Renders per second of one compiled template"""
+    compiled = compile_email(template)
+    values = {variable: f"<{variable}>" for variable in compiled.variables}
+    batch = [values] * iterations
+    start = time.perf_counter()
+    compiled.render_many(batch)
+    return iterations / (time.perf_counter() - start)
+
+
+def _sample_templates(data_dir: str) -> List[Tuple[str, Optional[Dict]]]:
+    """One template of each dialect from the data directory"""
+    samples = []
+    try:
+        with open(os.path.join(data_dir, 'email_templates.json')) as f:
+            samples.append(('[Bracket]', json.load(f)['templates'][0]))
+    except (OSError, KeyError, IndexError, ValueError):
+        pass
+    try:
+        with open(os.path.join(data_dir, 'templates.json')) as f:
+            samples.append(('{brace}', json.load(f)[0]))
+    except (OSError, KeyError, IndexError, ValueError):
+        pass
+    try:
+        with open(os.path.join(data_dir, 'templates', 'default.json')) as f:
+            samples.append(('{{mustache}}', json.load(f)))
+    except (OSError, ValueError):
+        pass
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email template engine')
+    parser.add_argument('--bench', action='store_true', help='Benchmark renders per second')
+    parser.add_argument('--iterations', type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.bench:
+        data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+        for dialect, template in _sample_templates(data_dir):
+            rate = benchmark(template, args.iterations)
+            print(f"{dialect:14} {template.get('id')}: {rate:,.0f} renders/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Template Registry Module
+In-memory index of email templates, reloaded only when the templates file changes
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class TemplateRegistry:
+    def __init__(self, templates_file: str, list_keys=('templates', 'templates_with_website')):
+        """
+        Args:
+            templates_file: JSON file with one or more template lists
+            list_keys: Keys of the template lists to index, in lookup order
+        """
+        self.templates_file = templates_file
+        self.list_keys = list_keys
+        self._lock = threading.Lock()
+        self._stat = None
+        self._digest = None
+        self._templates: List[Dict] = []
+        self._by_id: Dict[str, Dict] = {}
+
+    @property
+    def version(self) -> Optional[str]:
+        """Content hash of the loaded templates file"""
+        self._refresh()
+        return self._digest
+
+    def _refresh(self):
+        """Reload the templates if the file's mtime/size changed and its content hash differs"""
+        try:
+            stat = os.stat(self.templates_file)
+        except OSError as e:
+            print(f"Error loading templates: {e}")
+            return
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature == self._stat:
+            return
+
+        with self._lock:
+            if signature == self._stat:
+                return
+            try:
+                with open(self.templates_file, 'rb') as f:
+                    raw = f.read()
+                digest = hashlib.sha1(raw).hexdigest()
+                if digest != self._digest:
+                    data = json.loads(raw)
+                    templates = [t for key in self.list_keys for t in data.get(key, [])]
+                    by_id = {}
+                    for template in templates:
+                        # First occurrence wins, matching the old linear scan
+                        by_id.setdefault(template['id'], template)
+                    self._templates, self._by_id, self._digest = templates, by_id, digest
+                self._stat = signature
+            except Exception as e:
+                # Keep serving the last good copy
+                print(f"Error loading templates: {e}")
+
+    def all(self) -> List[Dict]:
+        """Get all templates"""
+        self._refresh()
+        return list(self._templates)
+
+    def lookup(self, template_id: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Get a template by ID together with the registry version it came from"""
+        self._refresh()
+        return self._by_id.get(template_id), self._digest
+
+    def get(self, template_id: str) -> Optional[Dict]:
+        """Get a template by ID"""
+        self._refresh()
+        return self._by_id.get(template_id)
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# The application modules live in src/ and import each other by module name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def finder(tmp_path, monkeypatch):
+    """LeadFinder whose lead store, dedup index and caches live in tmp_path"""
+    monkeypatch.setenv('LEADS_FILE', str(tmp_path / 'leads.json'))
+    monkeypatch.setenv('LEADS_DB_FILE', str(tmp_path / 'leads.db'))
+    monkeypatch.setenv('DEDUP_INDEX_FILE', str(tmp_path / 'dedup_index.db'))
+    monkeypatch.setenv('CACHE_FILE', str(tmp_path / 'cache.db'))
+    from lead_finder import LeadFinder
+    finder = LeadFinder()
+    yield finder
+    finder.close()
@@ -0,0 +1,145 @@
+import json
+
+import pytest
+
+# Every data file app.py opens, relative to a scratch directory
+DATA_FILES = {
+    'LEADS_FILE': 'leads.json',
+    'LEADS_DB_FILE': 'leads.db',
+    'DEDUP_INDEX_FILE': 'dedup_index.db',
+    'CACHE_FILE': 'cache.db',
+    'DELIVERY_DB_FILE': 'delivery.db',
+    'SEND_QUEUE_DB_FILE': 'send_queue.db',
+    'CAMPAIGNS_DB_FILE': 'campaigns.db',
+    'GEOCODE_WARM_FILE': 'warm_regions.txt',
+}
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    """app.py imported against scratch data files; skipped where its integrations aren't installed"""
+    data = tmp_path_factory.mktemp('app')
+    with pytest.MonkeyPatch.context() as patch:
+        for name, filename in DATA_FILES.items():
+            patch.setenv(name, str(data / filename))
+        patch.setenv('SENDGRID_API_KEY', 'test-key')
+        patch.setenv('MAIL_TRANSPORT', 'sendgrid')
+        patch.chdir(data)
+        try:
+            import app
+        except ImportError as e:
+            pytest.skip(f"app.py dependencies are not installed: {e}")
+        yield app
+        app.send_queue.stop()
+
+
+@pytest.fixture
+def client(app_module):
+    """Test client over an empty lead store"""
+    finder = app_module.lead_finder
+    for lead in finder.get_all_leads():
+        finder.delete_lead(lead['id'])
+    return app_module.app.test_client()
+
+
+def add_leads(client, count, **fields):
+    ids = []
+    for index in range(count):
+        response = client.post('/api/leads', json=dict(fields, name=f"Lead {index}", email=f"lead{index}@example.com"))
+        assert response.status_code == 200
+        ids.append(response.get_json()['lead_id'])
+    return ids
+
+
+def test_leads_are_paged_with_an_opaque_cursor(client):
+    ids = add_leads(client, 5)
+    page = client.get('/api/leads?limit=2&fields=email').get_json()
+    assert page['leads'] == [{'id': ids[0], 'email': 'lead0@example.com'}, {'id': ids[1], 'email': 'lead1@example.com'}]
+    seen = [lead['id'] for lead in page['leads']]
+    while page['next_cursor']:
+        page = client.get(f"/api/leads?limit=2&cursor={page['next_cursor']}").get_json()
+        seen.extend(lead['id'] for lead in page['leads'])
+    assert seen == ids
+
+    # Without limit or cursor the route keeps returning a plain list
+    assert [lead['id'] for lead in client.get('/api/leads').get_json()] == ids
+    assert client.get('/api/leads?cursor=not-a-cursor!').status_code == 400
+
+
+def test_unchanged_leads_are_served_as_not_modified(client):
+    add_leads(client, 1)
+    first = client.get('/api/leads?limit=10')
+    etag = first.headers['ETag']
+    assert client.get('/api/leads?limit=10', headers={'If-None-Match': etag}).status_code == 304
+    # Another query has its own tag, and any mutation changes them all
+    assert client.get('/api/leads?limit=5', headers={'If-None-Match': etag}).status_code == 200
+    add_leads(client, 1)
+    assert client.get('/api/leads?limit=10', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_leads_are_imported_and_exported_as_streams(client):
+    body = 'name,email\nA,a@example.com\nB,b@example.com\n'
+    result = client.post('/api/leads/import', data=body, content_type='text/csv').get_json()
+    assert (result['imported'], result['skipped'], result['failed']) == (2, 0, 0)
+    result = client.post('/api/leads/import', data=body, content_type='text/csv').get_json()
+    assert (result['imported'], result['skipped']) == (0, 2)
+
+    response = client.get('/api/leads/export?format=csv&fields=name,email')
+    assert response.mimetype == 'text/csv'
+    assert response.get_data(as_text=True).splitlines() == ['name,email', 'A,a@example.com', 'B,b@example.com']
+    assert client.get('/api/leads/export?format=xml').status_code == 400
+
+
+
+def test_stats_count_leads_per_status(client):
+    ids = add_leads(client, 3)
+    client.put(f"/api/leads/{ids[0]}", json={'status': 'contacted'})
+    stats = client.get('/api/leads/stats').get_json()
+    assert stats['total'] == 3
+    assert stats['by_status'] == {'new': 2, 'contacted': 1}
+
+
+def test_bulk_status_update_reports_unknown_ids(client):
+    ids = add_leads(client, 2)
+    response = client.put('/api/leads/status', json={'ids': [ids[0], int(ids[1]), 'missing'], 'status': 'contacted'})
+    assert response.get_json() == {'success': True, 'updated': 2, 'not_found': ['missing']}
+    assert client.get('/api/leads/stats').get_json()['by_status'] == {'contacted': 2}
+
+
+@pytest.mark.parametrize('body', [
+    {'ids': 'all', 'status': 'contacted'},
+    {'ids': [{'id': 1}], 'status': 'contacted'},
+    {'ids': ['1']},
+    {'ids': ['1'], 'status': 'bogus'},
+    {'ids': ['1'], 'status': ['contacted']},
+])
+def test_bulk_status_update_rejects_bad_requests(client, body):
+    response = client.put('/api/leads/status', json=body)
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_batch_previews_stream_one_line_per_lead(client, app_module, tmp_path, monkeypatch):
+    from template_registry import TemplateRegistry
+    templates_file = tmp_path / 'email_templates.json'
+    templates_file.write_text(json.dumps({'templates': [
+        {'id': 'visit', 'subject': 'Hello [Business Name]', 'content': 'We serve [Location]'}
+    ]}))
+    monkeypatch.setattr(app_module.email_sender, 'templates', TemplateRegistry(str(templates_file)))
+    ids = add_leads(client, 2)
+    client.post('/api/leads', json={'name': 'Cafe', 'email': 'cafe@example.com', 'address': 'Austin'})
+
+    response = client.post('/api/templates/visit/preview/batch', json={'lead_ids': [ids[0], 'missing']})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines[0]['subject'] == 'Hello Lead 0' and lines[0]['missing_variables'] == ['location']
+    assert lines[1] == {'lead_id': 'missing', 'error': 'Lead not found'}
+    assert lines[2] == {'summary': {'total': 2, 'unresolved': 1, 'errors': 1}}
+
+    response = client.post('/api/templates/visit/preview/batch', json={'status': 'new', 'unresolved_only': True})
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line.get('lead_id') for line in lines[:-1]] == ids
+    assert lines[-1] == {'summary': {'total': 3, 'unresolved': 2, 'errors': 0}}
+
+    assert client.post('/api/templates/nope/preview/batch', json={}).status_code == 404
+    assert client.post('/api/templates/visit/preview/batch', json={'lead_ids': 'all'}).status_code == 400
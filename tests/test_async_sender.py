@@ -0,0 +1,107 @@
+import asyncio
+import threading
+
+import pytest
+from aiohttp import web
+
+import async_sender
+from async_sender import AsyncEmailSender
+
+
+class FakeSendGrid:
+    """Local mail/send endpoint that records requests, in-flight sends and client connections"""
+
+    def __init__(self):
+        self.recipients = []
+        self.peers = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.throttled = set()
+        self.runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post('/v3/mail/send', self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        return self.runner.addresses[0][1]
+
+    async def handle(self, request):
+        assert request.headers['Authorization'] == 'Bearer test-key'
+        body = await request.json()
+        email = body['personalizations'][0]['to'][0]['email']
+        self.recipients.append(email)
+        self.peers.add(request.transport.get_extra_info('peername'))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            self.in_flight -= 1
+        if email.startswith('bad'):
+            return web.Response(status=400, text='invalid recipient')
+        if email.startswith('busy') and email not in self.throttled:
+            self.throttled.add(email)
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        return web.Response(status=202)
+
+
+@pytest.fixture
+def sendgrid(monkeypatch):
+    monkeypatch.setenv('SEND_RETRY_BASE_SECONDS', '0.01')
+    server = FakeSendGrid()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    port = asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+    monkeypatch.setattr(async_sender, 'SENDGRID_SEND_URL', f"http://127.0.0.1:{port}/v3/mail/send")
+    yield server
+    asyncio.run_coroutine_threadsafe(server.runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+
+
+@pytest.fixture
+def sender(sendgrid):
+    sender = AsyncEmailSender(api_key='test-key', max_in_flight=3, pool_size=2)
+    yield sender
+    sender.close()
+
+
+def message(to):
+    return {'to': to, 'subject': 'Hi', 'content': 'Hello'}
+
+
+def test_sends_are_bounded_and_share_pooled_connections(sender, sendgrid):
+    results = asyncio.run(sender.send_many([message(f"lead{index}@example.com") for index in range(12)]))
+    assert [result['email'] for result in results] == [f"lead{index}@example.com" for index in range(12)]
+    assert all(result['success'] for result in results)
+    assert sendgrid.max_in_flight <= 2
+    assert len(sendgrid.peers) <= 2
+
+
+def test_in_flight_limit_caps_concurrency(sendgrid):
+    sender = AsyncEmailSender(api_key='test-key', max_in_flight=3, pool_size=10)
+    try:
+        sender.send_many_sync([message(f"lead{index}@example.com") for index in range(12)])
+    finally:
+        sender.close()
+    assert sendgrid.max_in_flight == 3
+
+
+def test_failures_are_per_message_and_throttling_is_retried(sender, sendgrid):
+    results = sender.send_many_sync([message('bad@example.com'), message('busy@example.com'),
+                                     {'to': 'incomplete@example.com'}])
+    assert [result['success'] for result in results] == [False, True, False]
+    assert results[0]['message'] == 'SendGrid error: Status 400 invalid recipient'
+    assert results[2]['message'] == 'Missing required fields: to, subject, content'
+    assert sendgrid.recipients.count('busy@example.com') == 2
+    assert 'incomplete@example.com' not in sendgrid.recipients
+
+
+def test_session_outlives_each_callers_loop(sender, sendgrid):
+    # Flask runs every async view on its own loop; the pooled session must survive them
+    assert asyncio.run(sender.send('a@example.com', 'Hi', 'Hello')) == (True, 'Email sent successfully')
+    assert asyncio.run(sender.send('b@example.com', 'Hi', 'Hello')) == (True, 'Email sent successfully')
+    assert len(sendgrid.peers) == 1
@@ -0,0 +1,44 @@
+import pytest
+
+from business_classifier import BUSINESS_CATEGORIES, KeywordClassifier, business_similarity_classifier, \
+    business_type_classifier
+
+
+def test_keyword_share_scoring():
+    assert business_type_classifier.classify("joe's pizza restaurant cafe") == ('restaurant', pytest.approx(2 / 6))
+    assert business_type_classifier.classify('hair & nails salon') == ('salon', 0.5)
+    assert business_type_classifier.classify('sunrise holdings llc') == ('professional', 0.1)
+
+
+def test_keywords_match_as_overlapping_substrings():
+    classifier = KeywordClassifier({'a': ['car', 'care', 'repair'], 'b': ['pair']})
+    assert classifier.matched_keywords('carepair') == {'car', 'care', 'repair', 'pair'}
+
+
+def test_classify_many_matches_classify():
+    texts = ['hair salon', '', "joe's diner", 'auto repair shop', 'yoga studio']
+    assert business_type_classifier.classify_many(texts) == [business_type_classifier.classify(text) for text in texts]
+
+
+def test_first_category_follows_definition_order():
+    assert business_type_classifier.first_category('yoga and tire shop') == 'retail'
+    assert business_type_classifier.first_category('nothing relevant') is None
+
+
+# Reference outputs of TfidfVectorizer().fit_transform(keyword documents + text)
+# followed by cosine_similarity and argmax, as AIAgent computed them before
+@pytest.mark.parametrize('text, expected', [
+    ("Joe's Pizza Restaurant", ('restaurant', 0.17616824260300104)),
+    ('Hair & Nails Salon, day spa', ('salon', 0.652085752389002)),
+    ('Real Estate Insurance Group', ('professional', 0.47919227657356994)),
+    ('Main Street Muffler and Tire Repair', ('automotive', 0.2562408551884329)),
+    ('Sunrise Holdings LLC', ('restaurant', 0.0)),
+])
+def test_similarity_matches_tfidf_cosine(text, expected):
+    category, score = business_similarity_classifier.classify(text)
+    assert (category, score) == (expected[0], pytest.approx(expected[1]))
+
+
+def test_similarity_covers_every_category():
+    for category, keywords in BUSINESS_CATEGORIES.items():
+        assert business_similarity_classifier.classify(' '.join(keywords)) == (category, pytest.approx(1.0))
@@ -0,0 +1,304 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+business_discovery = pytest.importorskip('business_discovery')
+
+from business_discovery import PLACE_CONTACT_FIELDS, PLACE_DETAIL_FIELDS, BusinessDiscoveryEngine
+
+
+class FakeProvider:
+    """Records each blocking client call with the thread it ran on and how many overlapped"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.calls = []
+        self.failing = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.release = threading.Event()
+        self.release.set()
+        self._lock = threading.Lock()
+
+    def _call(self, method, *args, **kwargs):
+        with self._lock:
+            self.calls.append((method, args, kwargs, threading.current_thread().name))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            self.release.wait(5)
+            time.sleep(self.delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        if method in self.failing or args[:1] and args[0] in self.failing:
+            raise RuntimeError(f"{method} failed")
+
+    def called(self, method):
+        return [call for call in self.calls if call[0] == method]
+
+
+class FakeGoogle(FakeProvider):
+    def __init__(self, place_ids=('p1', 'p2', 'p3', 'p4', 'p5', 'p6'), **kwargs):
+        super().__init__(**kwargs)
+        self.place_ids = place_ids
+
+    def places(self, query, location, radius):
+        self._call('places', query)
+        return {'results': [{'place_id': place_id} for place_id in self.place_ids] + [{'name': 'No id'}]}
+
+    def places_nearby(self, location, radius, keyword):
+        self._call('places_nearby', keyword)
+        return {'results': [{'place_id': place_id, 'name': f"Place {place_id}", 'vicinity': f"{place_id[1:]} Main St"}
+                            for place_id in self.place_ids] + [{'name': 'No id', 'vicinity': 'Side St'}]}
+
+    def place(self, place_id, fields=None):
+        self._call('place', place_id, fields=fields)
+        return {'result': {'name': f"Place {place_id}", 'formatted_address': f"{place_id[1:]} Main St",
+                           'formatted_phone_number': f"555-010-{int(place_id[1:]):04d}", 'website': ''}}
+
+    def geocode(self, region):
+        self._call('geocode', region)
+        return [{'geometry': {'location': {'lat': 33.7, 'lng': -84.4}}}]
+
+
+class FakeYelp(FakeProvider):
+    def search_query(self, term, location, **kwargs):
+        self._call('search_query', term)
+        return {'businesses': [{'id': 'y1', 'name': 'Yelp Diner', 'phone': '555-020-0000',
+                                'location': {'address1': '1 Elm St', 'city': 'Atlanta'}}]}
+
+    def business_query(self, business_id):
+        self._call('business_query', business_id)
+        return {'name': 'Yelp Diner', 'phone': '555-020-0000', 'location': {'address1': '1 Elm St', 'city': 'Atlanta'}}
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    """Engine with fake Google and Yelp clients and its caches in tmp_path"""
+    monkeypatch.setenv('CACHE_FILE', str(tmp_path / 'cache.db'))
+    monkeypatch.setenv('DEDUP_INDEX_FILE', str(tmp_path / 'dedup_index.db'))
+    monkeypatch.setenv('GEOCODE_WARM_FILE', str(tmp_path / 'warm_regions.txt'))
+    monkeypatch.setenv('GOOGLE_MAX_CONCURRENCY', '3')
+    monkeypatch.setenv('YELP_MAX_CONCURRENCY', '2')
+    # ComplianceManager logs to data/compliance.log
+    (tmp_path / 'data').mkdir()
+    monkeypatch.chdir(tmp_path)
+    engine = BusinessDiscoveryEngine()
+    engine.gmaps = FakeGoogle()
+    engine.yelp = FakeYelp()
+    # Compliance rules are not under test here
+    monkeypatch.setattr(engine.compliance_manager, 'validate_data_collection', lambda data: True)
+    return engine
+
+
+def threads(provider):
+    return {call[3].rsplit('_', 1)[0] for call in provider.calls}
+
+
+def test_async_searches_run_client_calls_on_provider_pools(engine):
+    async def search():
+        ticks = 0
+        task = asyncio.gather(engine._search_google_places('Atlanta, GA', 'restaurant', ['local']),
+                              engine._search_yelp('Atlanta, GA', 'restaurant', ['local']))
+        while not task.done():
+            ticks += 1
+            await asyncio.sleep(0.005)
+        return await task, ticks
+
+    (google, yelp), ticks = asyncio.run(search())
+    assert len(google) == 6 and [business.name for business in yelp] == ['Yelp Diner']
+    assert threads(engine.gmaps) == {'discovery-google'}
+    assert threads(engine.yelp) == {'discovery-yelp'}
+    # The event loop kept running while the clients blocked
+    assert ticks >= 10
+
+
+def test_provider_pools_cap_each_apis_concurrency(engine):
+    engine.gmaps.place_ids = tuple(f"p{index}" for index in range(12))
+
+    async def search():
+        return await asyncio.gather(*(engine._search_google_places(region, 'cafe', []) for region in ('A', 'B')))
+
+    asyncio.run(search())
+    assert engine.gmaps.max_in_flight == 3
+
+
+def test_async_details_are_fetched_concurrently_with_a_field_mask(engine):
+    engine.gmaps.failing = {'p2'}
+    started = time.monotonic()
+    businesses = asyncio.run(engine._search_google_places('Atlanta, GA', 'restaurant', []))
+    elapsed = time.monotonic() - started
+
+    details = engine.gmaps.called('place')
+    # Only hits with a place_id are looked up, and only for the fields the engine reads
+    assert sorted(call[1][0] for call in details) == ['p1', 'p2', 'p3', 'p4', 'p5', 'p6']
+    assert all(call[2] == {'fields': PLACE_DETAIL_FIELDS} for call in details)
+    # A failed lookup drops that place only
+    assert sorted(business.name for business in businesses) == ['Place p1', 'Place p3', 'Place p4', 'Place p5', 'Place p6']
+    # One search plus six lookups, three at a time, rather than one after another
+    assert engine.gmaps.max_in_flight == 3
+    assert elapsed < 6 * engine.gmaps.delay
+
+
+def test_yelp_details_keep_their_order(engine):
+    engine.yelp.delay = 0
+
+    def search_query(term, location, **kwargs):
+        return {'businesses': [{'id': f"y{index}"} for index in range(5)]}
+
+    def business_query(business_id):
+        time.sleep(0.05 if business_id == 'y0' else 0)
+        return {'name': business_id, 'location': {'address1': '1 Elm St', 'city': 'Atlanta'}, 'url': ''}
+
+    engine.yelp.search_query = search_query
+    engine.yelp.business_query = business_query
+    businesses = asyncio.run(engine._search_yelp('Atlanta, GA', 'diner', []))
+    assert [business.name for business in businesses] == ['y0', 'y1', 'y2', 'y3', 'y4']
+
+
+def test_sync_search_masks_details_and_reports_failed_lookups(engine):
+    engine.gmaps.failing = {'p3'}
+    businesses = engine.discover_businesses_sync('Atlanta, GA', 'restaurant')
+    details = engine.gmaps.called('place')
+    assert sorted(call[1][0] for call in details) == ['p1', 'p2', 'p3', 'p4', 'p5', 'p6']
+    assert all(call[2] == {'fields': PLACE_CONTACT_FIELDS} for call in details)
+    assert engine.gmaps.max_in_flight == 3
+    by_name = {business['name']: business for business in businesses}
+    assert by_name['Place p1']['phone'] == '555-010-0001'
+    assert 'phone' not in by_name['Place p3'] and 'No id' in by_name
+    # Incomplete results aren't cached
+    assert engine.search_cache_stats()['size'] == 0
+
+
+def test_geocodes_are_cached_per_normalized_region(engine, tmp_path):
+    engine.discover_businesses_sync('Atlanta, GA', 'restaurant', radius=10)
+    engine.discover_businesses_sync(' atlanta,GA ', 'restaurant', radius=20)
+    assert len(engine.gmaps.called('geocode')) == 1
+
+    # The cache outlives the engine
+    engine.geocode_cache.close()
+    other = BusinessDiscoveryEngine()
+    other.gmaps = FakeGoogle()
+    assert other._geocode('ATLANTA, GA') == {'lat': 33.7, 'lng': -84.4}
+    assert other.gmaps.called('geocode') == []
+
+
+def test_warm_geocodes_fetches_only_uncached_regions(engine, tmp_path):
+    engine._geocode('Austin, TX')
+    (tmp_path / 'warm_regions.txt').write_text('# regions\nAustin, TX\nDenver, CO\n\nBoise, ID\n')
+    assert engine.warm_geocodes() == 2
+    assert sorted(call[1][0] for call in engine.gmaps.called('geocode')) == ['Austin, TX', 'Boise, ID', 'Denver, CO']
+    assert engine.warm_geocodes() == 0
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_fresh_results_are_served_from_the_search_cache(engine):
+    first = engine.discover_businesses_sync('Atlanta, GA', 'restaurant')
+    calls = len(engine.gmaps.calls)
+    assert engine.discover_businesses_sync('atlanta, ga', ' Restaurant ') == first
+    assert len(engine.gmaps.calls) == calls
+    assert engine.search_cache_stats()['hits'] == 1
+
+
+def test_stale_results_are_served_while_a_refresh_runs(engine):
+    first = engine.discover_businesses_sync('Atlanta, GA', 'restaurant')
+    searches = len(engine.gmaps.called('places_nearby'))
+    engine.search_cache_ttl = 0
+
+    engine.gmaps.release.clear()
+    assert engine.discover_businesses_sync('Atlanta, GA', 'restaurant') == first
+    # Further stale reads don't start a second refresh
+    assert engine.discover_businesses_sync('Atlanta, GA', 'restaurant') == first
+    engine.gmaps.release.set()
+    wait_for(lambda: not engine._refreshing)
+    assert len(engine.gmaps.called('places_nearby')) == searches + 1
+
+    # Past the stale window the search runs in the caller
+    engine.search_cache_stale = 0
+    engine.discover_businesses_sync('Atlanta, GA', 'restaurant')
+    assert len(engine.gmaps.called('places_nearby')) == searches + 2
+
+
+def test_provider_failures_keep_the_previous_results(engine):
+    first = engine.discover_businesses_sync('Atlanta, GA', 'restaurant')
+    engine.search_cache_ttl = 0
+    engine.yelp.failing = {'search_query'}
+    assert engine.discover_businesses_sync('Atlanta, GA', 'restaurant') == first
+    wait_for(lambda: not engine._refreshing)
+    assert len(engine.yelp.called('search_query')) == 2
+
+    # The failed refresh left the cached results in place
+    engine.search_cache_ttl = 3600
+    assert engine.discover_businesses_sync('Atlanta, GA', 'restaurant') == first
+    assert len(engine.yelp.called('search_query')) == 2
+
+
+def test_concurrent_identical_searches_share_one_run(engine):
+    engine.gmaps.release.clear()
+    results = []
+    callers = [threading.Thread(target=lambda: results.append(engine.discover_businesses_sync('Atlanta, GA', 'cafe')))
+               for _ in range(5)]
+    for caller in callers:
+        caller.start()
+    wait_for(lambda: engine.search_cache_stats()['coalesced'] == 4)
+    engine.gmaps.release.set()
+    for caller in callers:
+        caller.join()
+
+    assert len(engine.gmaps.called('places_nearby')) == 1
+    assert len(results) == 5 and all(result == results[0] for result in results)
+    # Every caller gets its own copies
+    assert results[0][0] is not results[1][0]
+
+
+def test_errors_reach_every_coalesced_caller():
+    flights = business_discovery._SingleFlight()
+    release = threading.Event()
+    runs, errors = [], []
+
+    def search():
+        runs.append(1)
+        release.wait(5)
+        raise RuntimeError('provider down')
+
+    def call():
+        try:
+            flights.do('key', search)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    callers = [threading.Thread(target=call) for _ in range(3)]
+    for caller in callers:
+        caller.start()
+    wait_for(lambda: flights.coalesced == 2)
+    release.set()
+    for caller in callers:
+        caller.join()
+    assert len(runs) == 1 and errors == ['provider down'] * 3
+    # A finished flight doesn't capture later calls
+    assert flights.do('key', lambda: 'ok') == 'ok'
+
+
+def test_concurrent_async_discoveries_share_one_pipeline(engine, monkeypatch):
+    async def check_business_website(name, address):
+        await asyncio.sleep(0.05)
+        return business_discovery.WebsiteCheckResult(has_website=False, status='no_domains_found')
+
+    monkeypatch.setattr(engine.website_checker, 'check_business_website', check_business_website)
+
+    async def discover():
+        return await asyncio.gather(*(engine.discover_businesses('Atlanta, GA', 'Cafe', ['local']) for _ in range(3)))
+
+    first, second, third = asyncio.run(discover())
+    assert len(engine.gmaps.called('places')) == 1 and len(engine.yelp.called('search_query')) == 1
+    assert first == second == third and first is not second
+    assert engine.search_cache_stats()['coalesced'] == 2
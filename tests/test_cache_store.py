@@ -0,0 +1,64 @@
+import time
+
+import pytest
+
+from cache_store import LRUCache, PersistentTTLCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_lru_stats_count_hits_and_misses():
+    cache = LRUCache(maxsize=10)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('missing', 'default')
+    assert cache.stats() == {'size': 1, 'maxsize': 10, 'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+    cache.clear()
+    assert cache.stats()['size'] == 0
+
+
+@pytest.fixture
+def ttl_cache(tmp_path):
+    cache = PersistentTTLCache(str(tmp_path / 'cache.db'), 'places', ttl=60)
+    yield cache
+    cache.close()
+
+
+def test_ttl_cache_round_trips_json_values(ttl_cache):
+    ttl_cache.set('p1', {'website': 'https://example.com'})
+    ttl_cache.set_many({'p2': None, 'p3': ['a', 'b']})
+    assert ttl_cache.get('p1') == {'website': 'https://example.com'}
+    assert ttl_cache.get_many(['p2', 'p3', 'p4']) == {'p2': None, 'p3': ['a', 'b']}
+
+
+def test_ttl_cache_expires_entries(ttl_cache):
+    ttl_cache.set('short', 1, ttl=0.01)
+    ttl_cache.set('long', 2)
+    time.sleep(0.02)
+    assert ttl_cache.get('short') is None
+    assert ttl_cache.get('long') == 2
+    assert ttl_cache.purge_expired() == 1
+
+
+def test_ttl_cache_persists_and_separates_namespaces(tmp_path):
+    db_file = str(tmp_path / 'cache.db')
+    places = PersistentTTLCache(db_file, 'places', ttl=60)
+    places.set('key', 'place')
+    places.close()
+    geocodes = PersistentTTLCache(db_file, 'geocodes', ttl=60)
+    assert geocodes.get('key') is None
+    assert PersistentTTLCache(db_file, 'places', ttl=60).get('key') == 'place'
+
+
+def test_ttl_cache_rejects_unsafe_namespace(tmp_path):
+    with pytest.raises(ValueError):
+        PersistentTTLCache(str(tmp_path / 'cache.db'), 'places; DROP TABLE x', ttl=60)
@@ -0,0 +1,113 @@
+import threading
+
+import pytest
+
+from campaign_engine import CampaignEngine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return CampaignEngine(str(tmp_path / 'campaigns.db'), batch_size=3)
+
+
+def leads(count):
+    return [{'id': index, 'email': f"lead{index}@example.com"} for index in range(1, count + 1)]
+
+
+def sender(sent):
+    def send(campaign, lead):
+        sent.append(lead['id'])
+        return True, 'sent'
+    return send
+
+
+def test_ticks_advance_cursor_in_batches_until_completed(engine):
+    campaign_id = engine.create('Launch', 'welcome', leads(7))
+    sent = []
+    assert engine.tick(sender(sent)) == {campaign_id: 3}
+    campaign = engine.get(campaign_id)
+    assert (campaign['cursor'], campaign['pending'], campaign['status']) == (3, 4, 'active')
+
+    engine.tick(sender(sent))
+    engine.tick(sender(sent))
+    assert sent == list(range(1, 8))
+    campaign = engine.get(campaign_id)
+    assert (campaign['sent'], campaign['status'], campaign['progress']) == (7, 'completed', 100.0)
+    assert engine.tick(sender(sent)) == {}
+
+
+def test_outcomes_map_to_recipient_states(engine):
+    campaign_id = engine.create('Launch', 'welcome', leads(3))
+
+    def send(campaign, lead):
+        if lead['id'] == 1:
+            return None, 'Lead has no email address'
+        if lead['id'] == 2:
+            raise RuntimeError('boom')
+        return True, 'sent'
+
+    engine.tick(send)
+    campaign = engine.get(campaign_id)
+    assert (campaign['sent'], campaign['failed'], campaign['skipped']) == (1, 1, 1)
+    assert [(r['seq'], r['state']) for r in engine.recipients(campaign_id)] == [(1, 'skipped'), (2, 'failed'), (3, 'sent')]
+    assert [r['message'] for r in engine.recipients(campaign_id, state='failed')] == ['boom']
+
+
+def test_limit_caps_recipients_across_campaigns(engine):
+    first = engine.create('First', 'welcome', leads(2))
+    second = engine.create('Second', 'welcome', leads(2))
+    assert engine.tick(sender([]), limit=3) == {first: 2, second: 1}
+    assert engine.tick(sender([]), limit=0) == {}
+
+
+def test_paused_campaigns_are_not_processed(engine):
+    campaign_id = engine.create('Launch', 'welcome', leads(2))
+    assert engine.set_status(campaign_id, 'paused')
+    assert engine.tick(sender([])) == {}
+    engine.set_status(campaign_id, 'active')
+    assert engine.tick(sender([])) == {campaign_id: 2}
+    assert not engine.set_status(campaign_id, 'active')
+
+
+def test_concurrent_ticks_never_process_a_recipient_twice(tmp_path):
+    db_file = str(tmp_path / 'campaigns.db')
+    engines = [CampaignEngine(db_file, batch_size=4) for _ in range(3)]
+    campaign_id = engines[0].create('Launch', 'welcome', leads(60))
+    sent = []
+    lock = threading.Lock()
+
+    def send(campaign, lead):
+        with lock:
+            sent.append(lead['id'])
+        return True, 'sent'
+
+    def run(engine):
+        for _ in range(30):
+            engine.tick(send)
+
+    threads = [threading.Thread(target=run, args=(engine,)) for engine in engines]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(sent) == list(range(1, 61))
+    assert engines[0].get(campaign_id)['status'] == 'completed'
+
+
+def test_unrecorded_claims_are_processed_after_the_timeout(engine):
+    campaign_id = engine.create('Launch', 'welcome', leads(2))
+    # A tick that claimed the batch and died before recording it
+    assert len(engine._claim_next(campaign_id, 0, 2)) == 2
+    assert engine.tick(sender([])) == {campaign_id: 0}
+    assert engine.get(campaign_id)['status'] == 'active'
+
+    engine.claim_timeout = 0.000001
+    sent = []
+    assert engine.tick(sender(sent)) == {campaign_id: 2}
+    assert sent == [1, 2]
+    assert engine.get(campaign_id)['status'] == 'completed'
+
+
+def test_empty_campaign_is_completed(engine):
+    campaign_id = engine.create('Empty', 'welcome', [])
+    assert engine.get(campaign_id)['status'] == 'completed'
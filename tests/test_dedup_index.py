@@ -0,0 +1,99 @@
+import sqlite3
+
+from dedup_index import DedupIndex, geohash, normalize_address, normalize_domain, normalize_name, normalize_phone
+
+GOOGLE = {'name': "Joe's Pizza", 'formatted_phone_number': '(404) 555-1234',
+          'vicinity': '123 Main Street, Atlanta', 'geometry': {'location': {'lat': 33.7490, 'lng': -84.3880}}}
+YELP = {'name': 'Joes Pizza LLC', 'phone': '+14045551234',
+        'location': {'address1': '123 Main St', 'city': 'Atlanta'}, 'coordinates': {'latitude': 33.7491, 'longitude': -84.3881}}
+
+
+def test_normalizers():
+    assert normalize_name("Joe's Pizza, LLC") == 'joes pizza'
+    assert normalize_phone('+1 (404) 555-1234') == '4045551234'
+    assert normalize_phone('12') is None
+    assert normalize_address('123 Main Street, Atlanta') == '123 main'
+    assert normalize_address('Main Street') is None
+    assert geohash(33.7490, -84.3880) == geohash(33.7491, -84.3881)
+    assert normalize_domain('https://www.JoesPizza.com/menu') == 'joespizza.com'
+    assert normalize_domain('joespizza.com') == 'joespizza.com'
+    assert normalize_domain('n/a') is None
+
+
+def test_matches_same_business_across_providers():
+    index = DedupIndex()
+    assert index.check_and_add(GOOGLE, ref='1')
+    assert not index.check_and_add(YELP)
+    assert index.find_duplicate(YELP)[1] == '1'
+
+
+def test_nearby_businesses_with_different_names_are_distinct():
+    index = DedupIndex()
+    index.add(GOOGLE)
+    neighbour = dict(GOOGLE, name='Main Street Dry Cleaners', formatted_phone_number='(404) 555-9999')
+    assert index.check_and_add(neighbour)
+
+
+def test_nameless_records_only_match_on_phone_or_address():
+    index = DedupIndex()
+    index.add(GOOGLE)
+    assert index.find_duplicate({'phone': '404-555-1234'})
+    assert index.find_duplicate({'address': '123 Main St, Atlanta'})
+    assert index.find_duplicate({'geometry': GOOGLE['geometry']}) is None
+    # Nothing to compare on at all: always new, and never indexed
+    assert index.check_and_add({})
+    assert index.find_duplicate({}) is None
+
+
+def test_name_alone_matches_only_bare_records():
+    index = DedupIndex()
+    # A manual lead with just a name does not suppress located branches of a chain
+    index.add({'name': 'Starbucks'}, ref='manual')
+    branch = {'name': 'Starbucks', 'formatted_address': '10 Peachtree St, Atlanta'}
+    assert index.check_and_add(branch)
+    assert index.check_and_add({'name': 'Starbucks', 'phone': '404-555-0000'})
+    assert index.find_duplicate({'name': 'Starbucks'})[1] == 'manual'
+
+    # ...and a located branch does not suppress a bare lead either
+    index = DedupIndex()
+    index.add(branch)
+    assert index.check_and_add({'name': 'Starbucks'})
+
+
+def test_same_website_matches_with_a_loose_name():
+    index = DedupIndex()
+    index.add({'name': "Joe's Pizza", 'website': 'https://joespizza.com'}, ref='1')
+    assert index.find_duplicate({'name': "Joe's Pizzeria & Grill", 'website': 'http://www.joespizza.com/'})[1] == '1'
+    assert index.find_duplicate({'name': "Joe's Pizza", 'website': 'https://other.com'}) is None
+
+
+def test_index_without_domain_column_is_migrated(tmp_path):
+    db_file = str(tmp_path / 'dedup.db')
+    conn = sqlite3.connect(db_file)
+    conn.executescript("""
+        CREATE TABLE records (rid INTEGER PRIMARY KEY, name TEXT NOT NULL, phone TEXT, located INTEGER NOT NULL, ref TEXT);
+        CREATE TABLE blocks (key TEXT NOT NULL, rid INTEGER NOT NULL);
+        INSERT INTO records VALUES (1, 'joes pizza', '4045551234', 1, '1');
+        INSERT INTO blocks VALUES ('phone:4045551234', 1);
+    """)
+    conn.close()
+    index = DedupIndex(db_file)
+    assert index.find_duplicate(YELP) == (1, '1')
+
+
+def test_remove_forgets_deleted_lead(tmp_path):
+    index = DedupIndex(str(tmp_path / 'dedup.db'))
+    index.add(GOOGLE, ref='7')
+    assert index.remove('7') == 1
+    assert index.find_duplicate(YELP) is None
+    assert index.is_empty()
+
+
+def test_index_persists_across_reopen(tmp_path):
+    db_file = str(tmp_path / 'dedup.db')
+    index = DedupIndex(db_file)
+    index.add(GOOGLE, ref='1')
+    index.close()
+    reopened = DedupIndex(db_file)
+    assert not reopened.is_empty()
+    assert reopened.find_duplicate(YELP) == (1, '1')
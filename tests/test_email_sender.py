@@ -0,0 +1,111 @@
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from python_http_client.exceptions import HTTPError
+
+email_sender = pytest.importorskip('email_sender')
+
+from mail_delivery import DeliveryLedger
+from template_registry import TemplateRegistry
+
+
+class FakeMailSend:
+    """Stands in for sg.client.mail.send, rejecting the recipients in `rejected`"""
+
+    def __init__(self, rejected=()):
+        self.rejected = set(rejected)
+        self.requests = []
+
+    def post(self, request_body):
+        self.requests.append(request_body)
+        emails = [p['to'][0]['email'] for p in request_body['personalizations']]
+        errors = [{'field': f"personalizations.{position}.to.0.email", 'message': 'Invalid email'}
+                  for position, email in enumerate(emails) if email in self.rejected]
+        if errors:
+            raise HTTPError(400, 'Bad Request', json.dumps({'errors': errors}), {})
+        return SimpleNamespace(status_code=202, headers={})
+
+
+def write_welcome(templates_file, subject, mtime=1):
+    templates_file.write_text(json.dumps({'templates': [
+        {'id': 'welcome', 'subject': subject, 'content': 'Dear [Recipient\'s Name], from {company_name}'}
+    ]}))
+    os.utime(templates_file, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def sender(tmp_path, monkeypatch):
+    monkeypatch.setenv('SENDGRID_API_KEY', 'test-key')
+    monkeypatch.setenv('MAIL_TRANSPORT', 'sendgrid')
+    monkeypatch.setenv('CAMPAIGNS_DB_FILE', str(tmp_path / 'campaigns.db'))
+    templates_file = tmp_path / 'email_templates.json'
+    write_welcome(templates_file, 'Hello [Business Name]')
+    sender = email_sender.EmailSender(ledger=DeliveryLedger(str(tmp_path / 'delivery.db')))
+    sender.templates = TemplateRegistry(str(templates_file))
+    sender.company_name = 'Acme'
+    sender.mail_send = FakeMailSend()
+    sender.sg = SimpleNamespace(client=SimpleNamespace(mail=SimpleNamespace(send=sender.mail_send)))
+    return sender
+
+
+def leads(count):
+    return [{'id': str(index), 'name': f"Shop {index}", 'email': f"shop{index}@example.com"} for index in range(count)]
+
+
+def test_one_request_per_chunk_of_personalizations(sender, monkeypatch):
+    monkeypatch.setattr(email_sender, 'MAX_PERSONALIZATIONS', 2)
+    results = sender.send_template_batch('welcome', leads(5) + [{'id': 'x', 'name': 'No email'}])
+    assert [result['success'] for result in results] == [True] * 5 + [False]
+    assert results[5]['message'] == 'Lead has no email address'
+    assert [len(body['personalizations']) for body in sender.mail_send.requests] == [2, 2, 1]
+
+    body = sender.mail_send.requests[0]
+    assert body['subject'] == 'Hello -business_name-'
+    assert body['content'][0]['value'] == 'Dear -recipient_name-, from -company_name-'
+    assert body['personalizations'][1]['substitutions'] == {
+        '-business_name-': 'Shop 1', '-recipient_name-': 'Shop 1', '-company_name-': 'Acme'}
+
+
+def test_rejected_personalizations_fail_only_their_leads(sender):
+    sender.mail_send.rejected = {'shop1@example.com'}
+    results = sender.send_template_batch('welcome', leads(3), campaign_id='c1')
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['message'] == 'SendGrid rejected recipient: Invalid email'
+    # The rest of the chunk is resent once without the rejected recipient
+    assert [[p['to'][0]['email'] for p in body['personalizations']] for body in sender.mail_send.requests] == [
+        ['shop0@example.com', 'shop1@example.com', 'shop2@example.com'], ['shop0@example.com', 'shop2@example.com']]
+    [letter] = sender.ledger.dead_letters('email')
+    assert letter['payload']['to_email'] == 'shop1@example.com'
+    assert letter['payload']['subject'] == 'Hello Shop 1'
+
+    # Campaign keys make a repeated batch skip the leads already sent
+    sender.mail_send.rejected = set()
+    again = sender.send_template_batch('welcome', leads(3), campaign_id='c1')
+    assert [(result['success'], result.get('skipped', False)) for result in again] == [(True, True), (True, False), (True, True)]
+
+
+def test_send_batch_groups_items_by_template(sender):
+    first, second = leads(2)
+    results = sender.send_batch([(first, 'welcome'), (first, 'missing'), (second, 'welcome')])
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['message'] == 'Template not found: missing'
+    assert len(sender.mail_send.requests) == 1
+
+
+def test_previews_are_cached_per_template_version_and_used_values(sender):
+    lead = {'id': '1', 'name': 'Shop', 'email': 'shop@example.com'}
+    preview = sender.preview_template('welcome', lead)
+    assert (preview['subject'], preview['content']) == ('Hello Shop', 'Dear Shop, from Acme')
+
+    # Fields the template doesn't use share the cached preview
+    sender.preview_template('welcome', dict(lead, phone='555', email='other@example.com'))
+    assert sender.preview_cache.stats()['hits'] == 1
+    assert sender.preview_template('welcome', dict(lead, name='Cafe'))['subject'] == 'Hello Cafe'
+
+    write_welcome(Path(sender.templates.templates_file), 'Hi [Business Name]', mtime=2)
+    assert sender.preview_template('welcome', lead)['subject'] == 'Hi Shop'
+    assert sender.preview_cache.stats()['hits'] == 1
+    assert sender.preview_template('missing', lead) is None
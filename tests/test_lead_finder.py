@@ -0,0 +1,184 @@
+import threading
+import time
+
+import pytest
+
+
+def manual(name, email, **fields):
+    return dict(fields, name=name, email=email)
+
+
+def test_leads_are_stored_and_looked_up_by_id_and_email(finder):
+    first = finder.add_lead(finder.build_lead(manual('Joe Diner', 'joe@example.com', phone='404-555-1234')))
+    second = finder.add_lead(finder.build_lead(manual('Ann Salon', 'ann@example.com', type='salon')))
+    assert (first['id'], second['id']) == ('1', '2')
+
+    assert finder.get_lead('1')['phone'] == '404-555-1234'
+    assert finder.get_lead(2)['name'] == 'Ann Salon'
+    assert finder.get_lead_by_email('ANN@example.com')['id'] == '2'
+    assert finder.get_leads(['2', '9']) == [('2', second), ('9', None)]
+    assert [lead['id'] for lead in finder.get_leads_by_type('salon')] == ['2']
+
+    assert finder.update_lead_status('1', 'contacted')
+    assert [lead['id'] for lead in finder.get_leads_by_status('contacted')] == ['1']
+
+
+def test_deleted_lead_can_be_found_again(finder):
+    lead = finder.add_lead(finder.build_lead(manual('Joe Diner', 'joe@example.com', phone='404-555-1234')))
+    assert finder.dedup_index.find_duplicate({'name': 'Joe Diner', 'phone': '(404) 555-1234'})
+    assert finder.delete_lead(lead['id'])
+    assert finder.get_lead(lead['id']) is None
+    assert finder.dedup_index.find_duplicate({'name': 'Joe Diner', 'phone': '(404) 555-1234'}) is None
+    assert not finder.delete_lead(lead['id'])
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+class FakeSession:
+    """Stands in for a provider's requests session, tracking how many calls overlap"""
+
+    def __init__(self, respond, delay=0.01):
+        self.respond = respond
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, headers=None):
+        with self._lock:
+            self.calls.append((url, params))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            return FakeResponse(self.respond(url, params or {}))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def close(self):
+        pass
+
+
+def google_search(url, params):
+    category = params['query'].split(' in ')[0]
+    return {'results': [
+        {'name': f"{category.title()} One", 'formatted_address': f"1{len(category)} Main St, Atlanta",
+         'formatted_phone_number': f"404-555-{len(category):04d}", 'types': [category]},
+        {'name': f"{category.title()} Web", 'website': 'https://example.com', 'types': [category]},
+    ]}
+
+
+def yelp_search(url, params):
+    category = params['term']
+    # The same business as Google's first result, as Yelp formats it
+    return {'businesses': [{'name': f"{category.title()} One LLC", 'phone': f"+1404555{len(category):04d}",
+                            'location': {'address1': f"1{len(category)} Main Street", 'city': 'Atlanta'},
+                            'categories': [{'alias': category, 'title': category.title()}]}]}
+
+
+def use_fake_providers(finder, delay=0.01):
+    finder.sessions['google'] = FakeSession(google_search, delay)
+    finder.sessions['yelp'] = FakeSession(yelp_search, delay)
+    return finder.sessions['google'], finder.sessions['yelp']
+
+
+def test_concurrent_fan_out_finds_the_same_leads_as_serial_search(finder):
+    google, yelp = use_fake_providers(finder)
+    leads = finder.find_leads(concurrent=True)
+    categories = list(finder.business_categories)
+    assert len(google.calls) == len(yelp.calls) == len(categories)
+    # Yelp's copy of each business and the businesses with websites are dropped
+    assert [lead['name'] for lead in leads] == [f"{category.title()} One" for category in categories]
+    assert [lead['detected_type'] for lead in leads] == categories
+    assert [lead['id'] for lead in leads] == [str(index) for index in range(1, len(categories) + 1)]
+
+    # A second run finds nothing new: every business is already indexed
+    assert finder.find_leads(concurrent=False) == []
+
+
+def test_fan_out_respects_per_provider_concurrency(finder, monkeypatch):
+    google, yelp = use_fake_providers(finder, delay=0.05)
+    monkeypatch.setattr(finder, '_provider_slots', {'google': threading.BoundedSemaphore(2),
+                                                    'yelp': threading.BoundedSemaphore(1)})
+    finder.find_leads(concurrent=True)
+    assert 1 < google.max_in_flight <= 2
+    assert yelp.max_in_flight == 1
+
+
+def place_details(failures):
+    """Place Details responder; failures maps place_id -> how many calls fail first (-1: always)"""
+    def respond(url, params):
+        place_id = params['place_id']
+        assert params['fields'] == 'website'
+        remaining = failures.get(place_id, 0)
+        if remaining:
+            failures[place_id] = remaining - 1
+            raise ConnectionError('timed out')
+        return {'result': {'website': 'https://joes.example'} if place_id == 'web' else {}}
+    return respond
+
+
+def test_resolve_websites_fetches_each_place_once_and_caches_it(finder):
+    google = finder.sessions['google'] = FakeSession(place_details({}), delay=0)
+    assert finder._resolve_websites(['web', 'none', 'web']) == {'web': 'https://joes.example', 'none': ''}
+    assert len(google.calls) == 2
+    assert finder._resolve_websites(['web', 'none']) == {'web': 'https://joes.example', 'none': ''}
+    assert len(google.calls) == 2
+    assert finder._has_website({'place_id': 'web'})
+    assert not finder._has_website({'place_id': 'none'})
+
+
+def test_failed_lookups_are_retried_then_cached_briefly(finder):
+    google = finder.sessions['google'] = FakeSession(place_details({'flaky': 1, 'down': -1}), delay=0)
+    finder.place_failure_ttl = 0.05
+    assert finder._resolve_websites(['flaky', 'down']) == {'flaky': '', 'down': None}
+    # flaky succeeds on its first retry; down uses every attempt
+    attempts = 2 + 1 + finder.place_details_retries
+    assert len(google.calls) == attempts
+
+    # The failure is remembered for a short while, then looked up again
+    finder._resolve_websites(['down'])
+    assert len(google.calls) == attempts
+    time.sleep(0.06)
+    finder._resolve_websites(['down'])
+    assert len(google.calls) > attempts
+
+
+def test_cursor_pages_and_projected_fields(finder):
+    for index in range(1, 6):
+        finder.add_lead(finder.build_lead(manual(f"Lead {index}", f"lead{index}@example.com")))
+    page = finder.get_leads_page(limit=2, fields=['email'])
+    assert page['leads'] == [{'id': '1', 'email': 'lead1@example.com'}, {'id': '2', 'email': 'lead2@example.com'}]
+    ids = [lead['id'] for lead in page['leads']]
+    while page['next_cursor']:
+        page = finder.get_leads_page(page['next_cursor'], limit=2)
+        ids.extend(lead['id'] for lead in page['leads'])
+    assert ids == ['1', '2', '3', '4', '5']
+
+
+def test_invalid_cursor_is_rejected(finder):
+    with pytest.raises(ValueError):
+        finder.get_leads_page('not-a-cursor!')
+
+
+def test_version_backs_etags(finder):
+    # GET /api/leads derives its ETag from leads_version()
+    version = finder.leads_version()
+    finder.get_leads_page(limit=10)
+    assert finder.leads_version() == version
+    lead = finder.add_lead(finder.build_lead(manual('Joe Diner', 'joe@example.com')))
+    assert finder.leads_version() != version
+    version = finder.leads_version()
+    finder.update_statuses([lead['id']], 'contacted')
+    assert finder.leads_version() != version
@@ -0,0 +1,81 @@
+import json
+
+from lead_io import detect_format, parse_records, serialize_leads
+
+
+def ndjson(*records):
+    return [json.dumps(record) + '\n' for record in records]
+
+
+def test_detect_format_from_extension():
+    assert detect_format('leads.CSV') == 'csv'
+    assert detect_format('leads.jsonl') == 'ndjson'
+    assert detect_format('leads.txt') == 'ndjson'
+    assert detect_format(None, default='csv') == 'csv'
+
+
+def test_parse_ndjson_reports_bad_lines_by_number():
+    lines = ['{"name": "A"}\n', '\n', '{not json\n', '[1, 2]\n', '{"name": "B"}\n']
+    parsed = list(parse_records(lines, 'ndjson'))
+    assert [(number, record) for number, record, _ in parsed] == [(1, {'name': 'A'}), (3, None), (4, None), (5, {'name': 'B'})]
+    assert parsed[1][2].startswith('Invalid JSON')
+    assert parsed[2][2] == 'Expected a JSON object'
+
+
+def test_parse_csv_drops_empty_cells():
+    lines = ['name,email,phone\n', 'A,a@example.com,\n', 'B,b@example.com,555\n']
+    assert list(parse_records(lines, 'csv')) == [
+        (2, {'name': 'A', 'email': 'a@example.com'}, None),
+        (3, {'name': 'B', 'email': 'b@example.com', 'phone': '555'}, None),
+    ]
+
+
+def test_serialize_round_trips_through_parse():
+    leads = [{'id': '1', 'name': 'A, Inc.', 'email': 'a@example.com'}, {'id': '2', 'name': 'B', 'email': 'b@example.com'}]
+    for fmt in ('ndjson', 'csv'):
+        text = ''.join(serialize_leads(leads, fmt, ['id', 'name', 'email']))
+        assert [record for _, record, _ in parse_records(text.splitlines(keepends=True), fmt)] == leads
+
+
+def test_import_counts_only_inserted_leads(finder):
+    finder.add_lead(finder.build_lead({'name': 'Existing', 'email': 'old@example.com'}))
+    result = finder.import_leads(ndjson(
+        {'name': 'A', 'email': 'a@example.com'},
+        {'name': 'Old', 'email': 'OLD@example.com'},
+        {'name': 'A again', 'email': 'a@example.com'},
+        {'name': 'No email'},
+        {'name': 'B', 'email': 'b@example.com', 'status': 'contacted'},
+    ))
+    assert result == {'imported': 2, 'skipped': 2, 'failed': 1,
+                      'errors': [{'line': 4, 'error': 'Name and email are required'}]}
+    assert [(lead['id'], lead['email'], lead['status']) for lead in finder.store.all()] == [
+        ('1', 'old@example.com', 'new'), ('2', 'a@example.com', 'new'), ('3', 'b@example.com', 'contacted')]
+
+
+def test_import_reports_leads_stored_by_another_writer(finder, monkeypatch):
+    lines = ndjson({'name': 'A', 'email': 'a@example.com'}, {'name': 'B', 'email': 'b@example.com'})
+    real_get_by_email = finder.store.get_by_email
+
+    def get_by_email(email):
+        # Another writer stores the same email right after the duplicate check
+        if email == 'b@example.com' and not real_get_by_email(email):
+            finder.store.insert_many([{'id': 'other', 'name': 'B', 'email': email}])
+            return None
+        return real_get_by_email(email)
+
+    monkeypatch.setattr(finder.store, 'get_by_email', get_by_email)
+    result = finder.import_leads(lines)
+    assert result['imported'] == 1 and result['failed'] == 1
+    assert result['errors'] == [{'line': 2, 'error': 'Email b@example.com was stored by another writer during the import'}]
+    assert finder.store.count() == 2
+
+
+def test_export_streams_filtered_projected_leads(finder):
+    finder.import_leads(ndjson(
+        {'name': 'A', 'email': 'a@example.com'},
+        {'name': 'B', 'email': 'b@example.com', 'status': 'contacted'},
+    ))
+    exported = ''.join(finder.export_leads('ndjson', status='contacted', fields=['email']))
+    assert [json.loads(line) for line in exported.splitlines()] == [{'id': '2', 'email': 'b@example.com'}]
+    assert ''.join(finder.export_leads('csv', fields=['id', 'email'])).splitlines() == [
+        'id,email', '1,a@example.com', '2,b@example.com']
@@ -0,0 +1,136 @@
+import json
+
+import pytest
+
+from lead_store import LeadStore
+
+
+def lead(lead_id, status='new', business_type='restaurant', email=None):
+    return {'id': lead_id, 'name': f"Lead {lead_id}", 'email': email or f"lead{lead_id}@example.com",
+            'status': status, 'type': business_type}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LeadStore(str(tmp_path / 'leads.db'))
+
+
+def test_insert_many_skips_existing_ids(store):
+    assert store.insert_many([lead(1), lead(2)]) == 2
+    assert store.insert_many([lead(2), lead(3)]) == 1
+    assert [item['id'] for item in store.all()] == [1, 2, 3]
+    assert store.next_id() == 4
+
+
+def test_insert_new_allocates_ids_inside_the_transaction(store):
+    other = LeadStore(store.db_file)
+    hint = store.next_id()
+    # Another process takes the ID this one expected to use
+    other.insert_many([lead(str(hint))])
+    added = store.insert_new([{'name': 'A', 'email': 'a@example.com'}, {'name': 'B', 'email': 'b@example.com'}])
+    assert [item['id'] for item in added] == ['2', '3']
+    assert [item['name'] for item in store.all()] == ['Lead 1', 'A', 'B']
+
+
+def test_lookups_by_id_email_status_and_type(store):
+    store.insert_many([lead(1, status='contacted'), lead(2, business_type='salon', email='Owner@Salon.com')])
+    assert store.get('1')['status'] == 'contacted'
+    assert store.get(99) is None
+    assert set(store.get_many([1, 2, 99])) == {'1', '2'}
+    assert store.get_by_email('owner@salon.com')['id'] == 2
+    assert [item['id'] for item in store.by_status('contacted')] == [1]
+    assert [item['id'] for item in store.by_type('salon')] == [2]
+
+
+def test_import_json_reads_snapshot(store, tmp_path):
+    snapshot = tmp_path / 'leads.json'
+    snapshot.write_text(json.dumps([lead(1), {'name': 'no id'}, lead(2)]))
+    assert store.import_json(str(snapshot)) == 2
+    assert store.import_json(str(tmp_path / 'missing.json')) == 0
+
+
+def test_version_changes_only_on_mutations(store):
+    version = store.version()
+    store.all()
+    store.page(0, limit=10)
+    assert store.version() == version
+    store.insert(lead(1))
+    assert store.version() > version
+    version = store.version()
+    store.update_status(99, 'contacted')
+    assert store.version() == version
+
+
+def test_compact_writes_snapshot_once_per_version(store, tmp_path):
+    snapshot = tmp_path / 'leads.json'
+    store.insert_many([lead(1), lead(2)])
+    assert store.compact(str(snapshot))
+    assert [item['id'] for item in json.loads(snapshot.read_text())] == [1, 2]
+    assert not store.compact(str(snapshot))
+
+
+def test_snapshot_round_trips_through_a_new_store(store, tmp_path):
+    snapshot = tmp_path / 'leads.json'
+    store.insert_many([lead(1), lead(2, status='contacted')])
+    store.write_snapshot(str(snapshot))
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == '.tmp'] == []
+    restored = LeadStore(str(tmp_path / 'restored.db'))
+    assert restored.import_json(str(snapshot)) == 2
+    assert restored.all() == store.all()
+
+
+def test_background_compaction_stops_with_a_final_snapshot(store, tmp_path):
+    snapshot = tmp_path / 'leads.json'
+    store.start_compaction(str(snapshot), interval=3600)
+    store.insert(lead(1))
+    store.stop_compaction(str(snapshot))
+    assert [item['id'] for item in json.loads(snapshot.read_text())] == [1]
+
+
+def test_finders_on_one_database_share_a_store(finder):
+    from lead_finder import LeadFinder
+    other = LeadFinder()
+    try:
+        assert other.store is finder.store
+    finally:
+        other.close()
+
+
+def test_keyset_pages_cover_every_lead_once(store):
+    store.insert_many(lead(lead_id) for lead_id in range(1, 8))
+    seen, after_seq = [], 0
+    while True:
+        leads, last_seq = store.page(after_seq, limit=3)
+        seen.extend(item['id'] for item in leads)
+        if last_seq is None:
+            break
+        after_seq = last_seq
+    assert seen == list(range(1, 8))
+
+
+def test_page_filters_and_unlimited(store):
+    store.insert_many([lead(1, status='new'), lead(2, status='contacted'), lead(3, status='new')])
+    leads, last_seq = store.page(0, limit=None, status='new')
+    assert [item['id'] for item in leads] == [1, 3]
+    assert last_seq is None
+
+
+def test_counts_follow_inserts_updates_and_deletes(store):
+    store.insert_many([lead(1), lead(2), lead(3, business_type='salon')])
+    store.update_status(1, 'contacted')
+    store.update_status(2, 'interested')
+    store.delete(3)
+    assert store.counts() == {
+        'total': 2,
+        'by_status': {'contacted': 1, 'interested': 1},
+        'by_type': {'restaurant': 2}
+    }
+
+
+def test_update_statuses_reports_updated_ids(store):
+    store.insert_many([lead(1), lead(2), lead(3)])
+    version = store.version()
+    assert store.update_statuses([2, '3', 99], 'contacted') == ['2', '3']
+    assert store.version() != version
+    assert [item['id'] for item in store.by_status('contacted')] == [2, 3]
+    assert store.update_statuses([99], 'lost') == []
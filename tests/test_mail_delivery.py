@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from mail_delivery import DeliveryLedger, RetryPolicy, TransportError, retry_after, send_with_retry
+
+
+def failing(error):
+    """A send that always raises error"""
+    def send():
+        raise error
+    return send
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return DeliveryLedger(str(tmp_path / 'delivery.db'))
+
+
+def test_key_is_reserved_until_completed_or_released(ledger):
+    key = ledger.key('campaign', 'lead')
+    assert ledger.begin(key)
+    assert not ledger.begin(key)
+    ledger.release(key)
+    assert ledger.begin(key)
+    ledger.complete(key)
+    assert ledger.is_sent(key)
+    assert not ledger.begin(key)
+
+
+def test_expired_lease_can_be_taken_over(tmp_path):
+    ledger = DeliveryLedger(str(tmp_path / 'delivery.db'), lease=0)
+    assert ledger.begin('k')
+    assert ledger.begin('k')
+    ledger.complete('k')
+    assert not ledger.begin('k')
+
+
+def test_dead_letters_are_listed_and_retired(ledger):
+    refused = send_with_retry(failing(TransportError('refused', 550, retryable=False)))
+    first = ledger.dead_letter('email', {'to_email': 'a@example.com'}, refused, 'k1')
+    ledger.dead_letter('crm_template', {'name': 'x'}, refused)
+    letters = ledger.dead_letters('email')
+    assert [(letter['id'], letter['key'], letter['status']) for letter in letters] == [(first, 'k1', 550)]
+    assert letters[0]['payload'] == {'to_email': 'a@example.com'}
+    ledger.mark_replayed([first])
+    assert ledger.dead_letters('email') == []
+    assert len(ledger.dead_letters('email', include_replayed=True)) == 1
+
+
+def test_send_many_sends_each_key_once_and_dead_letters_failures(ledger):
+    sent = []
+
+    def send_many(messages):
+        sent.extend(message['to'] for message in messages)
+        return [{'success': message['to'] != 'bad@example.com', 'message': 'result'} for message in messages]
+
+    messages = [
+        {'to': 'a@example.com', 'subject': 's', 'content': 'c', 'idempotency_key': 'c:a'},
+        {'to': 'bad@example.com', 'subject': 's', 'content': 'c', 'idempotency_key': 'c:bad'},
+        {'to': 'b@example.com', 'subject': 's', 'content': 'c'},
+        {'to': 'missing-subject@example.com', 'content': 'c'},
+    ]
+    results = ledger.send_many(send_many, messages)
+    assert [result['success'] for result in results] == [True, False, True, False]
+    assert sent == ['a@example.com', 'bad@example.com', 'b@example.com']
+    assert [letter['key'] for letter in ledger.dead_letters('email')] == ['c:bad']
+
+    # Sending again skips the key already sent; the failed one is free to retry
+    results = ledger.send_many(send_many, messages[:2])
+    assert results[0] == {'email': 'a@example.com', 'success': True, 'skipped': True, 'message': 'Email already sent'}
+    assert sent[3:] == ['bad@example.com']
+
+
+def test_send_many_reports_key_held_by_another_send(ledger):
+    ledger.begin('c:a')
+    results = ledger.send_many(lambda messages: pytest.fail('must not send'),
+                               [{'to': 'a@example.com', 'subject': 's', 'content': 'c', 'idempotency_key': 'c:a'}])
+    assert results[0]['skipped'] and not results[0]['success']
+
+
+def test_send_many_holds_keys_when_the_batch_outcome_is_unknown(ledger):
+    def send_many(messages):
+        raise RuntimeError('connection pool closed')
+
+    results = ledger.send_many(send_many, [{'to': 'a@example.com', 'subject': 's', 'content': 'c',
+                                            'idempotency_key': 'c:a'}])
+    assert not results[0]['success']
+    # The message may have gone out, so it is neither dead-lettered nor free to resend yet
+    assert ledger.dead_letters('email') == []
+    assert not ledger.begin('c:a')
+
+
+def test_send_many_async_awaits_a_coroutine_sender(ledger):
+    async def send_many(messages):
+        return [{'success': message['to'] != 'bad@example.com', 'message': 'result'} for message in messages]
+
+    messages = [
+        {'to': 'a@example.com', 'subject': 's', 'content': 'c', 'idempotency_key': 'c:a'},
+        {'to': 'bad@example.com', 'subject': 's', 'content': 'c', 'idempotency_key': 'c:bad'},
+    ]
+    results = asyncio.run(ledger.send_many_async(send_many, messages))
+    assert [result['success'] for result in results] == [True, False]
+    assert ledger.is_sent('c:a')
+    assert [letter['key'] for letter in ledger.dead_letters('email')] == ['c:bad']
+    assert asyncio.run(ledger.send_many_async(send_many, messages[:1]))[0]['skipped']
+
+
+def test_send_with_retry_backs_off_then_succeeds():
+    attempts, waits = [], []
+
+    def send():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TransportError('busy', 451, retry_after=2)
+        return None
+
+    result = send_with_retry(send, RetryPolicy(max_attempts=5, base_delay=0.1, max_delay=10), sleep=waits.append)
+    assert result.success and result.attempts == 3
+    assert all(wait >= 2 for wait in waits)
+
+
+def test_send_with_retry_stops_on_permanent_error_or_long_retry_after():
+    waits = []
+    policy = RetryPolicy(max_attempts=5, base_delay=0.1, max_delay=10)
+    result = send_with_retry(failing(TransportError('no', 550, retryable=False)), policy, sleep=waits.append)
+    assert not result.success and result.attempts == 1 and result.status == 550
+    result = send_with_retry(failing(TransportError('slow', 429, retry_after=60)), policy, sleep=waits.append)
+    assert result.attempts == 1
+    assert waits == []
+
+
+def test_retry_after_header_parsing():
+    assert retry_after({'Retry-After': '7'}) == 7.0
+    assert retry_after({'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}) == 0.0
+    assert retry_after({}) is None
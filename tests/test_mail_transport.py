@@ -0,0 +1,161 @@
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import SMTP
+
+from mail_delivery import TransportError
+from mail_transport import SMTPTransport
+
+
+class RecordingHandler:
+    """Accepts mail except for refused recipients, recording what it receives"""
+
+    def __init__(self, pipelining=True, refused=None):
+        self.pipelining = pipelining
+        self.refused = refused or {}
+        self.messages = []
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        session.host_name = hostname
+        if self.pipelining:
+            responses.insert(-1, '250-PIPELINING')
+        return responses
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refused:
+            return self.refused[address]
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content))
+        return '250 OK'
+
+
+class CountingSMTP(SMTP):
+    """SMTP server that counts DATA commands, accepted or not"""
+
+    data_commands = 0
+
+    async def smtp_DATA(self, arg):
+        type(self).data_commands += 1
+        await super().smtp_DATA(arg)
+
+
+class CountingController(Controller):
+    def factory(self):
+        return CountingSMTP(self.handler, **self.SMTP_kwargs)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def relay():
+    servers = []
+
+    def start(**kwargs):
+        handler = RecordingHandler(**kwargs)
+        controller = CountingController(handler, hostname='127.0.0.1', port=free_port())
+        controller.start()
+        CountingSMTP.data_commands = 0
+        servers.append(controller)
+        return handler, controller
+
+    yield start
+    for controller in servers:
+        controller.stop()
+
+
+def make_transport(controller, **kwargs):
+    return SMTPTransport(host=controller.hostname, port=controller.port, security='none', timeout=5, **kwargs)
+
+
+def message(to, subject='Hello'):
+    return {'to': to, 'subject': subject, 'content': 'Line one\n.leading dot\n'}
+
+
+def test_pipelined_sends_reuse_one_connection(relay):
+    handler, controller = relay()
+    transport = make_transport(controller)
+    try:
+        for index in range(3):
+            transport.send(message(f"lead{index}@example.com", subject=f"Hello {index}"))
+        assert transport.connections_opened == 1
+    finally:
+        transport.close()
+
+    assert [rcpt for _, rcpt, _ in handler.messages] == [[f"lead{index}@example.com"] for index in range(3)]
+    assert all(mail_from == 'sam@webreachconnect.com' for mail_from, _, _ in handler.messages)
+    # Dot-stuffing is undone by the relay
+    assert b'\r\n.leading dot\r\n' in handler.messages[0][2]
+
+
+def test_refused_recipient_skips_data_and_keeps_connection(relay):
+    handler, controller = relay(refused={'bad@example.com': '550 No such user'})
+    transport = make_transport(controller)
+    try:
+        with pytest.raises(TransportError) as error:
+            transport.send(message('bad@example.com'))
+        assert error.value.status == 550
+        assert not error.value.retryable
+        assert CountingSMTP.data_commands == 0
+
+        transport.send(message('good@example.com'))
+        assert transport.connections_opened == 1
+    finally:
+        transport.close()
+    assert [rcpt for _, rcpt, _ in handler.messages] == [['good@example.com']]
+
+
+def test_temporary_refusal_is_retryable(relay):
+    _, controller = relay(refused={'busy@example.com': '451 Try again later'})
+    transport = make_transport(controller)
+    try:
+        with pytest.raises(TransportError) as error:
+            transport.send(message('busy@example.com'))
+        assert error.value.status == 451
+        assert error.value.retryable
+    finally:
+        transport.close()
+
+
+def test_send_many_without_pipelining(relay):
+    handler, controller = relay(pipelining=False, refused={'bad@example.com': '550 No such user'})
+    transport = make_transport(controller, pool_size=2)
+    try:
+        results = transport.send_many([message('a@example.com'), message('bad@example.com'), message('b@example.com')])
+    finally:
+        transport.close()
+
+    assert [result['success'] for result in results] == [True, False, True]
+    assert results[1]['email'] == 'bad@example.com'
+    assert sorted(rcpt[0] for _, rcpt, _ in handler.messages) == ['a@example.com', 'b@example.com']
+
+
+def test_send_many_rejects_bad_recipients_without_failing_the_batch(relay):
+    handler, controller = relay()
+    transport = make_transport(controller, pool_size=1)
+    injected = 'a@example.com\r\nRCPT TO:<victim@example.com>'
+    try:
+        results = transport.send_many([message('a@example.com'), message(injected),
+                                       message('not an address'), message('b@example.com')])
+        assert transport.connections_opened == 1
+    finally:
+        transport.close()
+
+    assert [result['success'] for result in results] == [True, False, False, True]
+    assert 'Invalid to' in results[1]['message'] and results[1]['attempts'] == 1
+    assert sorted(rcpt[0] for _, rcpt, _ in handler.messages) == ['a@example.com', 'b@example.com']
+
+
+def test_bad_recipient_is_rejected_before_connecting():
+    transport = SMTPTransport(host='127.0.0.1', port=free_port(), security='none', timeout=1)
+    with pytest.raises(TransportError) as error:
+        transport.send(message('a@example.com\nBcc: victim@example.com'))
+    assert not error.value.retryable
+    assert transport.connections_opened == 0
@@ -0,0 +1,131 @@
+import pytest
+
+import send_queue
+from mail_delivery import DeliveryLedger
+from send_queue import DAY, HOUR, SendQueue
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(send_queue, 'time', clock)
+    return clock
+
+
+class Transport:
+    def __init__(self, refused=()):
+        self.sent = []
+        self.refused = set(refused)
+
+    def send_many(self, messages):
+        self.sent.extend(message['to'] for message in messages)
+        return [{'success': message['to'] not in self.refused, 'message': 'result'} for message in messages]
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return DeliveryLedger(str(tmp_path / 'delivery.db'))
+
+
+def make_queue(tmp_path, ledger, transport, **kwargs):
+    kwargs.setdefault('hourly_limit', 3)
+    kwargs.setdefault('daily_limit', 5)
+    return SendQueue(transport.send_many, db_file=str(tmp_path / 'queue.db'), ledger=ledger, **kwargs)
+
+
+def messages(count, start=0):
+    return [{'to': f"lead{index}@example.com", 'subject': 's', 'content': 'c'} for index in range(start, start + count)]
+
+
+def test_hourly_limit_is_shared_by_every_queue_on_the_database(tmp_path, ledger, clock):
+    transport = Transport()
+    first = make_queue(tmp_path, ledger, transport)
+    second = make_queue(tmp_path, ledger, transport)
+    first.enqueue(messages(6))
+
+    assert first.drain_once() == 0.0
+    assert len(transport.sent) == 3
+    # The other queue sees the grants logged by the first one
+    assert second.drain_once() == pytest.approx(HOUR)
+
+    clock.now += HOUR
+    second.drain_once()
+    assert len(transport.sent) == 5
+    # Daily limit reached: wait until the first grant is a day old
+    assert first.drain_once() == pytest.approx(DAY - HOUR)
+
+
+def test_sliding_window_has_no_burst_at_window_edges(tmp_path, ledger, clock):
+    transport = Transport()
+    queue = make_queue(tmp_path, ledger, transport)
+    queue.enqueue(messages(2))
+    queue.drain_once()
+    clock.now += HOUR / 2
+    queue.enqueue(messages(3, start=2))
+    queue.drain_once()
+    assert len(transport.sent) == 3
+    # The first two sends leave the window first, freeing just their share
+    clock.now += HOUR / 2
+    queue.drain_once()
+    assert len(transport.sent) == 5
+
+
+def test_results_are_recorded_and_failures_dead_lettered(tmp_path, ledger, clock):
+    transport = Transport(refused={'lead1@example.com'})
+    results = []
+    queue = make_queue(tmp_path, ledger, transport, on_result=lambda message, result: results.append(
+        (message['to'], result['success'])))
+    queue.enqueue(messages(2))
+    queue.drain_once()
+    assert queue.stats()['by_status'] == {'sent': 1, 'failed': 1}
+    assert results == [('lead0@example.com', True), ('lead1@example.com', False)]
+    assert [letter['payload']['to_email'] for letter in ledger.dead_letters('email')] == ['lead1@example.com']
+
+
+def test_campaign_lead_is_sent_once(tmp_path, ledger, clock):
+    transport = Transport()
+    queue = make_queue(tmp_path, ledger, transport)
+    message = dict(messages(1)[0], lead_id=7)
+    queue.enqueue([message], campaign_id='welcome')
+    queue.drain_once()
+    assert queue.pending_lead_ids() == set()
+    queue.enqueue([message], campaign_id='welcome')
+    queue.drain_once()
+    assert transport.sent == ['lead0@example.com']
+    assert queue.stats()['by_status'] == {'sent': 2}
+
+
+def test_interrupted_claims_are_resent_only_after_the_lease(tmp_path, ledger, clock):
+    transport = Transport()
+    queue = make_queue(tmp_path, ledger, transport)
+    queue.enqueue([dict(messages(1)[0], lead_id=1)], campaign_id='welcome')
+    rows, _ = queue._claim()
+    assert len(rows) == 1
+    assert queue.pending_lead_ids(campaign_id='welcome') == {'1'}
+
+    # A restart within the lease leaves the claim alone
+    restarted = make_queue(tmp_path, ledger, transport, hourly_limit=10)
+    restarted.drain_once()
+    assert transport.sent == []
+
+    clock.now += ledger.lease + 1
+    restarted.drain_once()
+    assert transport.sent == ['lead0@example.com']
+
+
+def test_reserve_and_settle_share_the_limits(tmp_path, ledger, clock):
+    transport = Transport()
+    queue = make_queue(tmp_path, ledger, transport)
+    granted, grant = queue.reserve(10)
+    assert granted == 3
+    assert queue.reserve(1) == (0, None)
+    queue.settle(grant, 1)
+    assert queue.stats()['senders'][queue.default_sender]['hourly_remaining'] == 2
@@ -0,0 +1,36 @@
+from template_engine import bracket_variable, compile_email, compile_template
+
+
+def test_bracket_labels_map_to_variables():
+    assert bracket_variable("Recipient's Name") == 'recipient_name'
+    assert bracket_variable('Gym/Fitness Center Name') == 'business_name'
+    assert bracket_variable('Your Contact Information') == 'sender_contact'
+    assert bracket_variable('Service Area') == 'service_area'
+
+
+def test_dialects_mix_and_literal_braces_survive():
+    template = compile_template('Hi [Restaurant Name], {{ city }} loves {business_name}! {"json": 1}')
+    assert template.variables == ['business_name', 'city']
+    text, missing = template.render({'business_name': "Joe's", 'city': 'Austin'})
+    assert text == 'Hi Joe\'s, Austin loves Joe\'s! {"json": 1}'
+    assert missing == []
+
+
+def test_missing_values_keep_their_placeholders():
+    text, missing = compile_template('Dear [Your Name] at {{company}}').render({'company': ''})
+    assert text == 'Dear [Your Name] at {{company}}'
+    assert missing == ['sender_name', 'company']
+
+
+def test_compiled_plans_are_reused():
+    assert compile_template('Hello {name}') is compile_template('Hello {name}')
+
+
+def test_email_renders_subject_and_content_for_many_leads():
+    email = compile_email({'id': 't1', 'subject': 'For {business_name}', 'content': '[Location] / {{business_name}}'})
+    assert email.variables == ['business_name', 'location']
+    assert email.placeholders == {'business_name': '{business_name}', 'location': '[Location]'}
+    assert email.render_many([{'business_name': 'A', 'location': 'Austin'}, {'business_name': 'B'}]) == [
+        {'subject': 'For A', 'content': 'Austin / A', 'missing': []},
+        {'subject': 'For B', 'content': '[Location] / B', 'missing': ['location']},
+    ]
@@ -0,0 +1,54 @@
+import json
+import os
+
+import pytest
+
+from template_registry import TemplateRegistry
+
+
+def write_templates(path, templates, with_website=(), mtime=None):
+    path.write_text(json.dumps({'templates': templates, 'templates_with_website': list(with_website)}))
+    if mtime is not None:
+        # Coarse filesystem clocks could otherwise hide a rewrite
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def templates_file(tmp_path):
+    path = tmp_path / 'email_templates.json'
+    write_templates(path, [{'id': 'a', 'subject': 'A'}], [{'id': 'a', 'subject': 'shadowed'}, {'id': 'b', 'subject': 'B'}], mtime=1)
+    return path
+
+
+def test_lookups_follow_list_order(templates_file):
+    registry = TemplateRegistry(str(templates_file))
+    assert [t['subject'] for t in registry.all()] == ['A', 'shadowed', 'B']
+    assert registry.get('a')['subject'] == 'A'
+    template, version = registry.lookup('b')
+    assert template['subject'] == 'B' and version == registry.version
+    assert registry.get('missing') is None
+
+
+def test_reloads_only_when_the_file_changes(templates_file):
+    registry = TemplateRegistry(str(templates_file))
+    version = registry.version
+    first = registry.get('a')
+
+    # Same content under a new mtime keeps the loaded templates
+    write_templates(templates_file, [{'id': 'a', 'subject': 'A'}], [{'id': 'a', 'subject': 'shadowed'}, {'id': 'b', 'subject': 'B'}], mtime=2)
+    assert registry.version == version and registry.get('a') is first
+
+    write_templates(templates_file, [{'id': 'a', 'subject': 'Edited'}], mtime=3)
+    assert registry.version != version
+    assert registry.get('a')['subject'] == 'Edited'
+    assert registry.get('b') is None
+
+
+def test_keeps_last_good_templates_on_bad_file(templates_file):
+    registry = TemplateRegistry(str(templates_file))
+    version = registry.version
+    templates_file.write_text('{not json')
+    os.utime(templates_file, ns=(4, 4))
+    assert registry.get('a')['subject'] == 'A' and registry.version == version
+    templates_file.unlink()
+    assert registry.get('b')['subject'] == 'B'